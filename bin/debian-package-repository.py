@@ -7,9 +7,10 @@
 import argparse
 import os
 import signal
+from functools import partial
 from importlib.metadata import version, PackageNotFoundError
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
 
 from common_utility import ConfigLoader
 from context_logger import get_logger, setup_logging
@@ -18,7 +19,11 @@ from watchdog.observers import Observer
 
 from package_repository import DefaultRepositoryServer, RepositoryConfig, DefaultRepositoryService, \
     DefaultPackageWatcher, DefaultRepositoryCreator, DefaultRepositorySigner, DefaultRepositoryCache, DirectoryConfig, \
-    DefaultDirectoryService, DefaultDirectoryServer, ServerConfig, PublicGpgKey, PrivateGpgKey, ReleaseInfo
+    DefaultDirectoryService, DefaultDirectoryServer, ServerConfig, PublicGpgKey, PrivateGpgKey, ReleaseInfo, \
+    PackageScanner, DpkgPackageScanner, SinglePassDpkgPackageScanner, NativePackageScanner, SqlitePackageStore, \
+    PackageStore, DefaultContentsGenerator, DefaultDigestService, RepositoryBuilder, DefaultRepositoryBuilder, \
+    ProcessRepositoryBuilder, ComponentFactory, RepositoryCache, RepositoryCreator, RepositorySigner, RetentionPolicy, \
+    DigestService, DefaultPackagePool, NativeRepositorySigner, SignatureConfig, DefaultCacheMemory
 
 APPLICATION_NAME = 'debian-package-repository'
 
@@ -54,6 +59,26 @@ def main() -> None:
     repository_dir = _get_absolute_path(config.get('repository_dir', f'/etc/{APPLICATION_NAME}'))
     deb_package_dir = _get_absolute_path(config.get('deb_package_dir', '/opt/debs'))
     repo_create_delay = float(config.get('repo_create_delay', 10))
+    package_scanner = config.get('package_scanner', 'dpkg')
+    package_store_path = config.get('package_store_path', str(repository_dir / '.cache' / 'packages.db'))
+    build_workers = int(config.get('build_workers', os.cpu_count() or 1))
+    index_compressions = _get_compressions(config.get('index_compressions', 'gz'))
+    by_hash_generations = int(config.get('by_hash_generations', 3))
+    cache_generations = int(config.get('cache_generations', 3))
+    cache_generation_retention = float(config.get('cache_generation_retention', 300))
+    cache_memory_budget = int(float(config.get('cache_memory_budget', 0)) * 1024 * 1024)
+    cache_spill_dir = _get_absolute_path(config.get('cache_spill_dir', str(repository_dir / '.cache' / 'spill')))
+    cache_compressed_only = str(config.get('cache_compressed_only', 'false')).lower() == 'true'
+    pdiff_history = int(config.get('pdiff_history', 0))
+    two_phase_compression = str(config.get('two_phase_compression', 'false')).lower() == 'true'
+    retention_versions = int(config.get('retention_versions', 0))
+    retention_days = float(config.get('retention_days', 0))
+    retention_action = config.get('retention_action', 'keep')
+    pool_roots = [_get_absolute_path(root.strip()) for root in config.get('pool_roots', '').split(',') if root.strip()]
+    content_addressed_pool = str(config.get('content_addressed_pool', 'false')).lower() == 'true'
+    retention_archive_dir = _get_absolute_path(config.get('retention_archive_dir', str(repository_dir / '.archive')))
+    generate_contents = str(config.get('generate_contents', 'false')).lower() == 'true'
+    builder_mode = config.get('builder_mode', 'thread')
 
     release_template = _get_absolute_path(config.get('release_template', 'templates/Release.j2'))
     release_origin = config.get('release_origin', APPLICATION_NAME)
@@ -67,11 +92,17 @@ def main() -> None:
     private_key_pass = config.get('private_key_pass', 'test1234')
     public_key_path = _get_absolute_path(config.get('public_key_path', 'tests/keys/public-key.asc'))
     public_key_name = config.get('public_key_name', 'repository.gpg.key')
+    repository_signer = config.get('repository_signer', 'gpg')
+    signature_verification = config.get('signature_verification', 'immediate')
+    signature_sample_rate = float(config.get('signature_sample_rate', 0.1))
+    detached_signature = str(config.get('detached_signature', 'true')).lower() == 'true'
 
     directory_username = config.get('directory_username', 'admin')
     directory_password = config.get('directory_password', 'admin')
     directory_template = _get_absolute_path(config.get('directory_template', 'templates/directory.j2'))
     directory_private_patterns = config.get('directory_private')
+    directory_trusted_proxies = [proxy.strip() for proxy in config.get('directory_trusted_proxies', '').split(',')
+                                 if proxy.strip()]
 
     public_key = PublicGpgKey(private_key_id, public_key_path, public_key_name)
     private_key = PrivateGpgKey(private_key_id, private_key_path, private_key_pass)
@@ -83,23 +114,34 @@ def main() -> None:
             private_dirs.extend([path for path in repository_dir.joinpath('pool').glob(pattern) if path.is_dir()])
 
     file_observer = Observer()
-    package_watcher = DefaultPackageWatcher(file_observer, deb_package_dir)
-    repository_cache = DefaultRepositoryCache(distributions)
-    repository_config = RepositoryConfig(distributions, components, architectures, repository_dir, deb_package_dir)
+    package_watcher = DefaultPackageWatcher(file_observer, deb_package_dir, pool_roots)
+    cache_memory = DefaultCacheMemory(cache_memory_budget, cache_spill_dir)
+    repository_cache = DefaultRepositoryCache(distributions, cache_generation_retention, cache_generations,
+                                              cache_memory, cache_compressed_only)
+    retention_policy = RetentionPolicy(retention_versions, retention_days, retention_action, retention_archive_dir)
+    repository_config = RepositoryConfig(distributions, components, architectures, repository_dir, deb_package_dir,
+                                         build_workers, index_compressions, by_hash_generations, pdiff_history,
+                                         two_phase_compression, retention_policy, content_addressed_pool, pool_roots)
+    signature_config = SignatureConfig(signature_verification, signature_sample_rate, detached_signature)
     release_info = ReleaseInfo(release_template, release_origin, release_label, release_suite, release_version,
                                release_description)
-    repository_creator = DefaultRepositoryCreator(repository_cache, repository_config, release_info)
-    repository_signer = DefaultRepositorySigner(repository_cache, GPG(), private_key, public_key, repository_dir)
+    component_factory = partial(_create_repository_components, repository_config, release_info, private_key,
+                                public_key, repository_signer, signature_config, package_scanner, package_store_path,
+                                generate_contents)
+    repository_builder = _create_repository_builder(builder_mode, repository_cache, distributions, component_factory,
+                                                    partial(_update_logging, config))
 
-    repository_service = DefaultRepositoryService(package_watcher, repository_creator, repository_signer,
-                                                  repository_cache, distributions, repo_create_delay)
+    repository_service = DefaultRepositoryService(package_watcher, repository_builder, distributions,
+                                                  repo_create_delay)
 
     server_config = ServerConfig([f'{server_host}:{server_port}'], server_scheme, server_prefix, server_threads,
                                  server_backlog, server_connection_limit, server_channel_timeout)
     directory_server = DefaultDirectoryServer(server_config)
     directory_config = DirectoryConfig(repository_dir, version, directory_username, directory_password,
-                                       private_dirs, directory_template)
-    directory_service = DefaultDirectoryService(directory_server, repository_cache, directory_config)
+                                       private_dirs, directory_template, cache_generation_retention,
+                                       directory_trusted_proxies)
+    package_pool = DefaultPackagePool([deb_package_dir] + pool_roots) if pool_roots else None
+    directory_service = DefaultDirectoryService(directory_server, repository_cache, directory_config, package_pool)
 
     repository_server = DefaultRepositoryServer(repository_service, directory_service)
 
@@ -140,6 +182,38 @@ def _get_arguments() -> dict[str, Any]:
     parser.add_argument('--repository-dir', help='repository root directory')
     parser.add_argument('--deb-package-dir', help='directory containing the debian packages')
     parser.add_argument('--repo-create-delay', help='repository creation delay after package changes', type=float)
+    parser.add_argument('--package-scanner', help='package index engine to use',
+                        choices=['dpkg', 'dpkg-single-pass', 'native'])
+    parser.add_argument('--build-workers', help='number of parallel repository build workers', type=int)
+    parser.add_argument('--index-compressions',
+                        help='index compression formats with optional levels, e.g. gz:9,xz:6,zst:19 (comma separated)')
+    parser.add_argument('--by-hash-generations', help='index generations kept under by-hash (0 to disable)', type=int)
+    parser.add_argument('--cache-generations', type=int,
+                        help='previous index generations kept in memory for clients mid-update')
+    parser.add_argument('--cache-generation-retention', type=float,
+                        help='seconds a previous index generation and a client session stay pinned')
+    parser.add_argument('--cache-memory-budget', type=float,
+                        help='memory budget of cached index files in MiB before spilling to disk (0 for unlimited)')
+    parser.add_argument('--cache-spill-dir', help='directory of memory-mapped files cached index files spill to')
+    parser.add_argument('--cache-compressed-only',
+                        help='cache only the compressed form of indices that have one (true/false)')
+    parser.add_argument('--pdiff-history', help='number of Packages diffs kept for clients (0 to disable)', type=int)
+    parser.add_argument('--two-phase-compression',
+                        help='publish fast compressed indices first, recompress in the background (true/false)')
+    parser.add_argument('--retention-versions', type=int,
+                        help='latest versions kept per package and architecture (0 to keep all)')
+    parser.add_argument('--retention-days', help='days older versions are kept for (0 to keep all)', type=float)
+    parser.add_argument('--retention-action', help='what to do with package files excluded by the retention policy',
+                        choices=['keep', 'archive', 'delete'])
+    parser.add_argument('--retention-archive-dir', help='directory excluded package files are archived to')
+    parser.add_argument('--pool-roots', help='additional package pool roots merged into the pool (comma separated)')
+    parser.add_argument('--content-addressed-pool',
+                        help='hardlink identical package files to a shared content-addressed store (true/false)')
+    parser.add_argument('--generate-contents', help='generate Contents indices for apt-file (true/false)')
+    parser.add_argument('--builder-mode', help='run repository builds in a thread or a separate process',
+                        choices=['thread', 'process'])
+    parser.add_argument('--package-store-path',
+                        help='package metadata store of the native scanner and contents (empty to disable)')
 
     parser.add_argument('--release-template', help='release template file to use')
     parser.add_argument('--release-origin', help='repository release origin')
@@ -153,15 +227,86 @@ def _get_arguments() -> dict[str, Any]:
     parser.add_argument('--private-key-pass', help='passphrase of key used for signing')
     parser.add_argument('--public-key-path', help='path of key used for verification')
     parser.add_argument('--public-key-name', help='name of the public key in the repository root')
+    parser.add_argument('--repository-signer', help='signing engine to use', choices=['gpg', 'native'])
+    parser.add_argument('--signature-verification', help='when created signatures are verified',
+                        choices=['immediate', 'deferred', 'sampled'])
+    parser.add_argument('--signature-sample-rate', type=float,
+                        help='fraction of publishes verified in sampled signature verification')
+    parser.add_argument('--detached-signature', help='create Release.gpg besides InRelease (true/false)')
 
     parser.add_argument('--directory-username', help='username for the directory service')
     parser.add_argument('--directory-password', help='password for the directory service')
     parser.add_argument('--directory-template', help='directory template file to use')
     parser.add_argument('--directory-private', help='private directory patterns (glob patterns)', nargs='*')
+    parser.add_argument('--directory-trusted-proxies',
+                        help='reverse proxy addresses whose X-Forwarded-For identifies clients (comma separated)')
 
     return {k: v for k, v in vars(parser.parse_args()).items() if v is not None}
 
 
+def _create_repository_builder(builder_mode: str, cache: RepositoryCache, distributions: set[str],
+                               component_factory: ComponentFactory,
+                               initializer: Callable[[], Any]) -> RepositoryBuilder:
+    if builder_mode == 'process':
+        return ProcessRepositoryBuilder(cache, distributions, component_factory, initializer)
+    elif builder_mode == 'thread':
+        creator, signer = component_factory(cache)
+        return DefaultRepositoryBuilder(creator, signer, cache)
+    else:
+        raise ValueError(f'Unsupported builder mode: {builder_mode}')
+
+
+def _create_repository_components(repository_config: RepositoryConfig, release_info: ReleaseInfo,
+                                  private_key: PrivateGpgKey, public_key: PublicGpgKey, signer_type: str,
+                                  signature_config: SignatureConfig, scanner_type: str, store_path: str,
+                                  generate_contents: bool,
+                                  cache: RepositoryCache) -> tuple[RepositoryCreator, RepositorySigner]:
+    repository_dir = repository_config.repository_dir
+    package_store = SqlitePackageStore(Path(store_path)) if store_path else None
+    digest_service = DefaultDigestService(repository_config.build_workers)
+    scanner = _create_package_scanner(scanner_type, repository_dir, package_store, digest_service,
+                                      repository_config.build_workers)
+    contents_generator = DefaultContentsGenerator(repository_dir, package_store) if generate_contents else None
+    creator = DefaultRepositoryCreator(cache, repository_config, release_info, scanner, contents_generator,
+                                       digest_service)
+    signer = _create_repository_signer(signer_type, cache, private_key, public_key, repository_dir,
+                                       signature_config)
+    return creator, signer
+
+
+def _create_repository_signer(signer_type: str, cache: RepositoryCache, private_key: PrivateGpgKey,
+                              public_key: PublicGpgKey, repository_dir: Path,
+                              config: SignatureConfig) -> RepositorySigner:
+    if signer_type == 'native':
+        return NativeRepositorySigner(cache, private_key, public_key, repository_dir, config)
+    elif signer_type == 'gpg':
+        return DefaultRepositorySigner(cache, GPG(), private_key, public_key, repository_dir, config)
+    else:
+        raise ValueError(f'Unsupported repository signer: {signer_type}')
+
+
+def _create_package_scanner(scanner_type: str, repository_dir: Path, store: PackageStore | None,
+                            digests: DigestService, workers: int) -> PackageScanner:
+    if scanner_type == 'native':
+        return NativePackageScanner(repository_dir, store, digests)
+    elif scanner_type == 'dpkg-single-pass':
+        return SinglePassDpkgPackageScanner(repository_dir)
+    elif scanner_type == 'dpkg':
+        return DpkgPackageScanner(repository_dir, workers)
+    else:
+        raise ValueError(f'Unsupported package scanner: {scanner_type}')
+
+
+def _get_compressions(compressions: str) -> dict[str, int | None]:
+    result: dict[str, int | None] = {}
+
+    for compression in filter(None, (entry.strip() for entry in compressions.split(','))):
+        extension, _, level = compression.partition(':')
+        result[extension.strip()] = int(level) if level.strip() else None
+
+    return result
+
+
 def _get_resource_root() -> Path:
     return Path(os.path.dirname(__file__)).parent.absolute()
 
@@ -1,7 +1,19 @@
 from .packageWatcher import *
+from .packagePool import *
+from .indexWriter import *
+from .cacheMemory import *
 from .repositoryCache import *
+from .controlStanza import *
+from .debPackage import *
+from .packageStore import *
+from .digestService import *
+from .packageScanner import *
+from .contentsGenerator import *
+from .indexDiff import *
+from .retentionPolicy import *
 from .repositoryCreator import *
 from .repositorySigner import *
+from .repositoryBuilder import *
 from .repositoryService import *
 from .directoryServer import *
 from .directoryService import *
@@ -0,0 +1,171 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import mmap
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+
+from common_utility import create_directory
+from context_logger import get_logger
+
+log = get_logger('CacheMemory')
+
+SPILL_WATERMARK = 0.75
+SEGMENT_DIR = 'segments'
+SEGMENT_PREFIX = 'segment-'
+
+
+class CacheBlob(object):
+    __slots__ = ('content', 'size')
+
+    def __init__(self, content: bytes) -> None:
+        self.content: bytes | memoryview = content
+        self.size = len(content)
+
+    @property
+    def resident(self) -> bool:
+        return isinstance(self.content, bytes)
+
+    def to_bytes(self) -> bytes:
+        content = self.content
+        return content if isinstance(content, bytes) else content.tobytes()
+
+
+@dataclass(frozen=True)
+class CacheStatistics:
+    resident_bytes: int
+    spilled_bytes: int
+
+
+class CacheMemory:
+
+    def initialize(self) -> None:
+        raise NotImplementedError()
+
+    def allocate(self, content: bytes) -> CacheBlob:
+        raise NotImplementedError()
+
+    def touch(self, blob: CacheBlob) -> None:
+        raise NotImplementedError()
+
+    def retain(self, blobs: set[CacheBlob]) -> None:
+        raise NotImplementedError()
+
+    def get_statistics(self) -> CacheStatistics:
+        raise NotImplementedError()
+
+
+class DefaultCacheMemory(CacheMemory):
+
+    def __init__(self, budget: int = 0, spill_dir: Path | None = None) -> None:
+        self._budget = budget
+        self._segment_dir = spill_dir / SEGMENT_DIR if spill_dir else None
+        self._resident: OrderedDict[CacheBlob, None] = OrderedDict()
+        self._spilled: dict[CacheBlob, int] = {}
+        self._segments: dict[int, tuple[int, int]] = {}
+        self._resident_bytes = 0
+        self._spilled_bytes = 0
+        self._last_segment = 0
+        self._lock = Lock()
+
+    def initialize(self) -> None:
+        if self._budget and not self._segment_dir:
+            log.warning('Memory budget is set without a spill directory, cache will not spill', budget=self._budget)
+
+        if self._segment_dir:
+            create_directory(self._segment_dir)
+
+            # The spill directory is user configured, only segments left behind by a previous run are removed
+            for segment_path in self._segment_dir.glob(f'{SEGMENT_PREFIX}*'):
+                log.debug('Removing stale cache segment', segment=str(segment_path))
+                segment_path.unlink(missing_ok=True)
+
+    def allocate(self, content: bytes) -> CacheBlob:
+        blob = CacheBlob(content)
+
+        with self._lock:
+            self._resident[blob] = None
+            self._resident_bytes += blob.size
+            self._enforce_budget()
+
+        return blob
+
+    def touch(self, blob: CacheBlob) -> None:
+        with self._lock:
+            if blob in self._resident:
+                self._resident.move_to_end(blob)
+
+    def retain(self, blobs: set[CacheBlob]) -> None:
+        with self._lock:
+            for blob in [blob for blob in self._resident if blob not in blobs]:
+                del self._resident[blob]
+                self._resident_bytes -= blob.size
+
+            for blob in [blob for blob in self._spilled if blob not in blobs]:
+                self._release_segment(self._spilled.pop(blob))
+
+    def get_statistics(self) -> CacheStatistics:
+        with self._lock:
+            return CacheStatistics(self._resident_bytes, self._spilled_bytes)
+
+    def _enforce_budget(self) -> None:
+        if not self._budget or not self._segment_dir or self._resident_bytes <= self._budget:
+            return
+
+        target = self._budget * SPILL_WATERMARK
+        victims = []
+
+        while self._resident and self._resident_bytes > target:
+            blob, _ = self._resident.popitem(last=False)
+            self._resident_bytes -= blob.size
+            victims.append(blob)
+
+        self._spill(victims)
+
+    def _spill(self, victims: list[CacheBlob]) -> None:
+        spilled = [blob for blob in victims if blob.size]
+
+        if not spilled or not self._segment_dir:
+            return
+
+        self._last_segment += 1
+        segment = self._last_segment
+        segment_path = self._segment_dir / f'{SEGMENT_PREFIX}{os.getpid()}-{segment}'
+
+        with open(segment_path, 'w+b') as segment_file:
+            for blob in spilled:
+                segment_file.write(blob.content)
+
+            segment_file.flush()
+            mapping = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # The mapping keeps the pages alive, the file is reclaimed once the last view is released
+        os.unlink(segment_path)
+
+        view = memoryview(mapping)
+        offset = 0
+
+        for blob in spilled:
+            blob.content = view[offset:offset + blob.size]
+            offset += blob.size
+            self._spilled[blob] = segment
+
+        self._segments[segment] = (len(spilled), offset)
+        self._spilled_bytes += offset
+
+        log.debug('Spilled cache entries to memory-mapped segment', segment=str(segment_path), entries=len(spilled),
+                  size=offset, resident=self._resident_bytes)
+
+    def _release_segment(self, segment: int) -> None:
+        entries, size = self._segments[segment]
+
+        # A mapping stays alive until its last entry is released, spilled bytes count it as a whole until then
+        if entries > 1:
+            self._segments[segment] = (entries - 1, size)
+        else:
+            del self._segments[segment]
+            self._spilled_bytes -= size
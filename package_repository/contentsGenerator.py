@@ -0,0 +1,110 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+
+from context_logger import get_logger
+
+from package_repository import ControlStanza, DebPackage, PackageStore, FileFingerprint, StoredContents, \
+    find_packages
+
+log = get_logger('ContentsGenerator')
+
+
+class ContentsGenerator:
+
+    def initialize(self) -> None:
+        raise NotImplementedError()
+
+    def generate(self, package_dirs: list[Path], architectures: list[str]) -> dict[str, bytes]:
+        raise NotImplementedError()
+
+
+class DefaultContentsGenerator(ContentsGenerator):
+
+    def __init__(self, repository_dir: Path, store: PackageStore | None = None) -> None:
+        self._repository_dir = repository_dir
+        self._store = store
+        self._contents: dict[Path, dict[Path, StoredContents]] = {}
+
+    def initialize(self) -> None:
+        if self._store:
+            self._store.initialize()
+
+    def generate(self, package_dirs: list[Path], architectures: list[str]) -> dict[str, bytes]:
+        contents: list[StoredContents] = []
+
+        for package_dir in package_dirs:
+            contents.extend(self._collect_contents(package_dir).values())
+
+        return create_contents_indices(contents, architectures)
+
+    def _collect_contents(self, package_dir: Path) -> dict[Path, StoredContents]:
+        previous = self._contents.get(package_dir)
+
+        if previous is None:
+            previous = self._store.load_contents(package_dir) if self._store else {}
+
+        contents = {}
+        updated = {}
+
+        for package_path in find_packages(self._repository_dir, package_dir):
+            try:
+                fingerprint = FileFingerprint.create(self._repository_dir / package_path)
+            except FileNotFoundError:
+                continue
+
+            entry = previous.get(package_path)
+
+            if entry and entry.fingerprint == fingerprint:
+                contents[package_path] = entry
+            elif entry := self._read_contents(package_path, fingerprint):
+                contents[package_path] = entry
+                updated[package_path] = entry
+
+        if self._store:
+            self._store.save_contents(updated)
+            self._store.remove_contents(set(previous) - set(contents))
+
+        self._contents[package_dir] = contents
+
+        log.debug('Collected package contents', directory=str(package_dir), packages=len(contents),
+                  unpacked=len(updated))
+
+        return contents
+
+    def _read_contents(self, package_path: Path, fingerprint: FileFingerprint) -> StoredContents | None:
+        full_path = self._repository_dir / package_path
+
+        try:
+            package = DebPackage(full_path)
+            stanza = ControlStanza.parse(package.get_control())
+            files = package.get_files()
+        except Exception as error:
+            log.warning('Failed to read package contents, skipping package', file=str(full_path), error=error)
+            return None
+
+        location = f'{stanza.get("Section", "misc")}/{stanza.package}'
+
+        return StoredContents(fingerprint, location, stanza.architecture, files)
+
+
+def create_contents_indices(contents: list[StoredContents], architectures: list[str]) -> dict[str, bytes]:
+    locations: dict[str, dict[str, set[str]]] = {architecture: {} for architecture in architectures}
+
+    for entry in contents:
+        targets = architectures if entry.architecture == 'all' else [entry.architecture]
+
+        for architecture in targets:
+            if architecture in locations:
+                for file in entry.files:
+                    locations[architecture].setdefault(file, set()).add(entry.location)
+
+    return {
+        architecture: b''.join(
+            f'{file} {",".join(sorted(file_locations))}\n'.encode('utf-8', 'surrogateescape')
+            for file, file_locations in sorted(files.items())
+        )
+        for architecture, files in locations.items()
+    }
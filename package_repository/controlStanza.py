@@ -0,0 +1,162 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import re
+from typing import Iterator
+
+FIELD_ORDER = [
+    'Package', 'Package-Type', 'Source', 'Version', 'Kernel-Version', 'Built-For-Profiles', 'Auto-Built-Package',
+    'Architecture', 'Subarchitecture', 'Installer-Menu-Item', 'Build-Essential', 'Essential', 'Protected', 'Origin',
+    'Bugs', 'Maintainer', 'Installed-Size', 'Pre-Depends', 'Depends', 'Recommends', 'Suggests', 'Enhances',
+    'Conflicts', 'Breaks', 'Replaces', 'Provides', 'Built-Using', 'Static-Built-Using', 'Filename', 'Size', 'MD5sum',
+    'SHA1', 'SHA256', 'Section', 'Priority', 'Multi-Arch', 'Homepage', 'Description', 'Tag', 'Task'
+]
+
+FIELD_NAMES = {
+    'butautomaticupgrades': 'ButAutomaticUpgrades',
+    'md5sum': 'MD5sum',
+    'no-support-for-architecture-all': 'No-Support-for-Architecture-all',
+    'notautomatic': 'NotAutomatic',
+    'sha1': 'SHA1',
+    'sha256': 'SHA256',
+}
+
+WHITESPACE = ' \t\n\r\f\v'
+
+_FIELD_SEPARATOR = re.compile(r'\s*:\s*', re.ASCII)
+_FIELD_NAME = re.compile(r'\S+', re.ASCII)
+_CONTINUATION = re.compile(r'\s(\s*\S.*)', re.ASCII)
+_DOTS = re.compile(r'\.+')
+_NON_WHITESPACE = re.compile(r'\S', re.ASCII)
+
+_FIELD_RANKS = {name: rank for rank, name in enumerate(FIELD_ORDER)}
+
+
+class ControlStanza(object):
+
+    def __init__(self) -> None:
+        self._fields: dict[str, tuple[str, str]] = {}
+        self._content: bytes | None = None
+
+    def __contains__(self, name: str) -> bool:
+        return name.lower() in self._fields
+
+    def __getitem__(self, name: str) -> str:
+        return self._fields[name.lower()][1]
+
+    def __setitem__(self, name: str, value: str) -> None:
+        self._fields[name.lower()] = (capitalize_field(name), value)
+        self._content = None
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(name for name, _ in self._fields.values())
+
+    def get(self, name: str, default: str = '') -> str:
+        field = self._fields.get(name.lower())
+        return field[1] if field else default
+
+    def copy(self) -> 'ControlStanza':
+        stanza = ControlStanza()
+        stanza._fields = dict(self._fields)
+        return stanza
+
+    @property
+    def package(self) -> str:
+        return self.get('Package')
+
+    @property
+    def version(self) -> str:
+        return self.get('Version')
+
+    @property
+    def architecture(self) -> str:
+        return self.get('Architecture')
+
+    @property
+    def filename(self) -> str:
+        return self.get('Filename')
+
+    @classmethod
+    def parse(cls, content: bytes) -> 'ControlStanza':
+        stanza = cls()
+        current: str | None = None
+        border = True
+
+        for line in content.decode('latin-1').split('\n'):
+            line = line.rstrip(WHITESPACE)
+
+            if (not line and border) or line.startswith('#'):
+                continue
+
+            if not line:
+                break
+
+            border = False
+            current = stanza._parse_line(line, current)
+
+        if current is None:
+            raise ValueError('No fields found in control stanza')
+
+        return stanza
+
+    def _parse_line(self, line: str, current: str | None) -> str:
+        parts = _FIELD_SEPARATOR.split(line, maxsplit=1)
+
+        if _FIELD_NAME.fullmatch(parts[0]):
+            name = parts[0]
+            if name.startswith('-'):
+                raise ValueError(f'Field cannot start with a hyphen: {name}')
+            if name in self:
+                raise ValueError(f'Duplicate field found: {name}')
+            self[name] = parts[1] if len(parts) > 1 else ''
+            return name
+
+        if match := _CONTINUATION.fullmatch(line):
+            if current is None:
+                raise ValueError('Continued value line not in field')
+            value = match.group(1)
+            if _DOTS.fullmatch(value):
+                value = value[1:]
+            self[current] = f'{self[current]}\n{value}'
+            return current
+
+        raise ValueError(f'Line with unknown format: {line}')
+
+    def format(self) -> bytes:
+        if self._content is None:
+            self._content = self._format()
+
+        return self._content
+
+    def _format(self) -> bytes:
+        names = sorted(self, key=lambda name: (_FIELD_RANKS.get(name, len(FIELD_ORDER)), name))
+
+        output = []
+
+        for name in names:
+            value = self[name]
+
+            if not _NON_WHITESPACE.search(value):
+                continue
+
+            lines = value.split('\n')
+            while lines and not lines[-1]:
+                lines.pop()
+
+            first_line = lines[0] if lines else ''
+            output.append(f'{name}: {first_line}\n' if first_line else f'{name}:\n')
+
+            for line in lines[1:]:
+                line = line.rstrip(WHITESPACE)
+                if not line or _DOTS.fullmatch(line):
+                    output.append(f' .{line}\n')
+                else:
+                    output.append(f' {line}\n')
+
+        return ''.join(output).encode('latin-1')
+
+
+def capitalize_field(name: str) -> str:
+    name = name.lower()
+    return FIELD_NAMES.get(name) or '-'.join(part[:1].upper() + part[1:] for part in name.split('-'))
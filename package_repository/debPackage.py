@@ -0,0 +1,99 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import io
+import os
+import tarfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, BinaryIO, Iterator
+
+AR_MAGIC = b'!<arch>\n'
+AR_HEADER_SIZE = 60
+
+
+class DebPackageError(Exception):
+
+    def __init__(self, message: str, path: Path) -> None:
+        super().__init__(f'{message}: {path}')
+        self.path = path
+
+
+class DebPackage(object):
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def get_control(self) -> bytes:
+        with self._open_member('control.tar') as tar:
+            for member in tar:
+                if member.isfile() and os.path.normpath(member.name) == 'control':
+                    control_file = tar.extractfile(member)
+                    if control_file:
+                        return control_file.read()
+
+        raise DebPackageError('No control file in package', self.path)
+
+    def get_files(self) -> list[str]:
+        with self._open_member('data.tar') as tar:
+            return [os.path.normpath(member.name).lstrip('/') for member in tar if not member.isdir()]
+
+    @contextmanager
+    def _open_member(self, prefix: str) -> Iterator[tarfile.TarFile]:
+        with open(self.path, 'rb') as file:
+            extension, size = self._find_member(file, prefix)
+            stream: Any = _MemberReader(file, size, self.path)
+
+            if extension == '.zst':
+                import zstandard
+
+                stream = zstandard.ZstdDecompressor().stream_reader(stream)
+            elif extension not in ('', '.gz', '.xz', '.bz2'):
+                raise DebPackageError(f'Unsupported member compression {extension}', self.path)
+
+            with tarfile.open(fileobj=stream, mode='r|*') as tar:
+                yield tar
+
+    def _find_member(self, file: BinaryIO, prefix: str) -> tuple[str, int]:
+        if file.read(len(AR_MAGIC)) != AR_MAGIC:
+            raise DebPackageError('Not a Debian package', self.path)
+
+        while header := file.read(AR_HEADER_SIZE):
+            if len(header) < AR_HEADER_SIZE:
+                break
+
+            name = header[0:16].decode('ascii').rstrip().rstrip('/')
+            size = int(header[48:58].decode('ascii').strip())
+
+            if name.startswith(prefix):
+                return name[len(prefix):], size
+
+            file.seek(size + size % 2, os.SEEK_CUR)
+
+        raise DebPackageError(f'No {prefix} member in package', self.path)
+
+
+class _MemberReader(io.RawIOBase):
+
+    def __init__(self, file: BinaryIO, size: int, path: Path) -> None:
+        self._file = file
+        self._remaining = size
+        self._path = path
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        if not self._remaining:
+            return 0
+
+        data = self._file.read(min(len(buffer), self._remaining))
+
+        if not data:
+            raise DebPackageError('Truncated package member', self._path)
+
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+
+        return len(data)
@@ -0,0 +1,103 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+
+from context_logger import get_logger
+
+from package_repository import FileFingerprint
+
+log = get_logger('DigestService')
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class FileDigest:
+    size: int
+    md5: str
+    sha1: str
+    sha256: str
+
+
+class DigestService:
+
+    def digest(self, files: dict[Path, FileFingerprint]) -> dict[Path, FileDigest]:
+        raise NotImplementedError()
+
+    def prune(self) -> None:
+        raise NotImplementedError()
+
+    def shutdown(self) -> None:
+        raise NotImplementedError()
+
+
+class DefaultDigestService(DigestService):
+
+    def __init__(self, workers: int = 1) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='DigestService')
+        self._digests: dict[FileFingerprint, FileDigest] = {}
+        self._seen: set[FileFingerprint] = set()
+        self._lock = Lock()
+
+    def digest(self, files: dict[Path, FileFingerprint]) -> dict[Path, FileDigest]:
+        with self._lock:
+            self._seen.update(files.values())
+            digests = {path: self._digests[fingerprint] for path, fingerprint in files.items()
+                       if fingerprint in self._digests}
+
+        pending = [path for path in files if path not in digests]
+        results = self._executor.map(self._hash_file, pending)
+
+        for path, digest in zip(pending, results):
+            if digest:
+                digests[path] = digest
+
+        with self._lock:
+            self._digests.update((files[path], digests[path]) for path in pending if path in digests)
+
+        if pending:
+            log.debug('Computed file digests', files=len(pending), cached=len(files) - len(pending))
+
+        return digests
+
+    def prune(self) -> None:
+        with self._lock:
+            pruned = len(self._digests)
+            self._digests = {fingerprint: digest for fingerprint, digest in self._digests.items()
+                             if fingerprint in self._seen}
+            self._seen = set()
+            pruned -= len(self._digests)
+
+        if pruned:
+            log.debug('Pruned file digests', files=pruned)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown()
+
+    def _hash_file(self, file_path: Path) -> FileDigest | None:
+        try:
+            return hash_file(file_path)
+        except FileNotFoundError:
+            return None
+
+
+def hash_file(file_path: Path) -> FileDigest:
+    md5_hash = hashlib.md5()
+    sha1_hash = hashlib.sha1()
+    sha256_hash = hashlib.sha256()
+    size = 0
+
+    with open(file_path, 'rb') as file:
+        while chunk := file.read(HASH_CHUNK_SIZE):
+            md5_hash.update(chunk)
+            sha1_hash.update(chunk)
+            sha256_hash.update(chunk)
+            size += len(chunk)
+
+    return FileDigest(size, md5_hash.hexdigest(), sha1_hash.hexdigest(), sha256_hash.hexdigest())
@@ -5,18 +5,25 @@
 import mimetypes
 import os
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import lru_cache
 from pathlib import Path
+from threading import Lock
 from typing import Any
 from urllib.parse import quote
 
 from context_logger import get_logger
 from flask import send_from_directory, abort, request, Response, render_template
+from werkzeug.http import http_date
 
-from package_repository import RepositoryCache, DirectoryServer
+from package_repository import RepositoryCache, DirectoryServer, PackagePool, create_content_variants
 
 log = get_logger('DirectoryService')
 
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+GENERATION_HEADER = 'X-Repository-Generation'
+SESSION_START_FILES = {'InRelease', 'Release'}
+
 
 @dataclass
 class DirectoryConfig:
@@ -26,6 +33,8 @@ class DirectoryConfig:
     password: str
     private_dirs: list[Path]
     html_template: Path
+    session_timeout: float = 300
+    trusted_proxies: list[str] = field(default_factory=list)
 
 
 class DirectoryService:
@@ -39,10 +48,15 @@ class DirectoryService:
 
 class DefaultDirectoryService(DirectoryService):
 
-    def __init__(self, web_server: DirectoryServer, cache: RepositoryCache, config: DirectoryConfig) -> None:
+    def __init__(self, web_server: DirectoryServer, cache: RepositoryCache, config: DirectoryConfig,
+                 pool: PackagePool | None = None) -> None:
         self._web_server = web_server
         self._cache = cache
         self._config = config
+        self._pool = pool
+        self._sessions: dict[tuple[str, str, str], tuple[int, float]] = {}
+        self._sessions_swept = time.monotonic()
+        self._lock = Lock()
 
         self._register_routes()
 
@@ -69,12 +83,19 @@ class DefaultDirectoryService(DirectoryService):
             relative_path = Path(path)
             full_path = self._config.root_dir / relative_path
 
+            if any(part.startswith('.') for part in relative_path.parts):
+                log.debug('Hidden file or directory requested', path=str(full_path))
+                return abort(404)
+
             if not self._authorize(full_path):
                 return Response('Unauthorized', 401, {'WWW-Authenticate': 'Basic realm="Private Area"'})
 
+            if self._pool and relative_path.parts and relative_path.parts[0] == 'pool':
+                return self._serve_pool_path(relative_path)
+
             if full_path.is_dir():
                 log.debug('Listing directory', path=str(full_path))
-                return self._list_directory(relative_path, full_path)
+                return self._list_directory(relative_path, [full_path])
             elif relative_path.parts[0] == 'dists':
                 distribution = relative_path.parts[1]
                 log.debug('Serving cached file', distribution=distribution, path=str(full_path))
@@ -86,24 +107,116 @@ class DefaultDirectoryService(DirectoryService):
                 log.debug('File or directory not found', path=str(full_path))
                 return abort(404)
 
+    def _serve_pool_path(self, relative_path: Path) -> Response:
+        pool_path = relative_path.relative_to('pool')
+
+        if not self._pool or not (root := self._pool.resolve(pool_path)):
+            log.debug('File or directory not found in pool', path=str(relative_path))
+            return abort(404)
+
+        full_path = root / pool_path
+
+        if full_path.is_dir():
+            log.debug('Listing pool directory', path=str(relative_path))
+            return self._list_directory(relative_path, self._pool.get_directories(pool_path))
+
+        log.debug('Serving pool file', path=str(relative_path), root=str(root))
+        return send_from_directory(root, pool_path.as_posix(), as_attachment=False, mimetype='text/plain')
+
     def _load_from_cache(self, distribution: str, full_path: Path) -> Response:
-        content = self._cache.load(distribution, full_path)
+        cached_file = self._cache.resolve(distribution, full_path,
+                                          self._get_session_generation(distribution, full_path))
 
-        if not content:
+        if not cached_file or not cached_file.content:
             log.error('Failed to load file from cache', distribution=distribution, path=str(full_path))
             return abort(404)
 
-        mimetype, encoding = mimetypes.guess_type(full_path)
+        mimetype, content_headers = _get_content_headers(full_path.name, 'by-hash' in full_path.parts)
+        coding = self._select_content_coding(cached_file.variants)
+        etag = f'{cached_file.etag}-{coding}' if coding else cached_file.etag
+
+        headers = {
+            GENERATION_HEADER: str(cached_file.generation),
+            'ETag': f'"{etag}"',
+            'Last-Modified': http_date(cached_file.modified),
+            **content_headers
+        }
+
+        if cached_file.variants:
+            headers['Vary'] = 'Accept-Encoding'
+
+        if self._is_not_modified(etag, cached_file.modified):
+            log.debug('Cached file not modified', distribution=distribution, path=str(full_path))
+            return Response(status=304, headers=headers)
+
+        if coding:
+            headers['Content-Encoding'] = coding
+            return Response(_get_body(cached_file.variants[coding].content), mimetype=mimetype, headers=headers)
+
+        return Response(_get_body(cached_file.content), mimetype=mimetype, headers=headers)
+
+    def _select_content_coding(self, variants: dict[str, Any]) -> str | None:
+        if not variants:
+            return None
+
+        coding: str | None = request.accept_encodings.best_match(list(variants))
+
+        return coding
+
+    def _is_not_modified(self, etag: str, modified: float) -> bool:
+        if request.if_none_match:
+            return bool(request.if_none_match.contains(etag))
+
+        if request.if_modified_since:
+            return int(modified) <= request.if_modified_since.timestamp()
+
+        return False
+
+    def _get_session_generation(self, distribution: str, full_path: Path) -> int | None:
+        # Clients sharing an address and user agent, like apt hosts behind one NAT, share a session
+        client = (self._get_client_address(), request.user_agent.string, distribution)
+        now = time.monotonic()
 
-        headers = {}
+        if full_path.name in SESSION_START_FILES:
+            generation = self._cache.get_generation(distribution)
 
-        if encoding:
-            headers['Content-Encoding'] = encoding
-            headers['Content-Disposition'] = f'attachment; filename="{full_path.name}"'
-        elif not mimetype:
-            mimetype = 'text/plain'
+            if generation is not None:
+                with self._lock:
+                    self._sessions[client] = (generation, now)
+                    self._sweep_sessions(now)
 
-        return Response(content, mimetype=mimetype, headers=headers)
+            return generation
+
+        with self._lock:
+            session = self._sessions.get(client)
+
+        if session and now - session[1] < self._config.session_timeout:
+            return session[0]
+
+        return None
+
+    def _get_client_address(self) -> str:
+        address = str(request.remote_addr)
+
+        if address not in self._config.trusted_proxies:
+            return address
+
+        forwarded = [hop.strip() for hop in request.headers.get('X-Forwarded-For', '').split(',') if hop.strip()]
+
+        # The client is the nearest address not added by a trusted proxy
+        for hop in reversed(forwarded):
+            if hop not in self._config.trusted_proxies:
+                return hop
+
+        return forwarded[0] if forwarded else address
+
+    def _sweep_sessions(self, now: float) -> None:
+        if now - self._sessions_swept < self._config.session_timeout:
+            return
+
+        self._sessions = {client: session for client, session in self._sessions.items()
+                          if now - session[1] < self._config.session_timeout}
+        self._sessions_swept = now
 
     def _authorize(self, full_path: Path) -> bool:
         if any(full_path.is_relative_to(private_dir) for private_dir in self._config.private_dirs):
@@ -113,14 +226,19 @@ class DefaultDirectoryService(DirectoryService):
 
         return True
 
-    def _list_directory(self, path: Path, full_path: Path) -> Response:
+    def _list_directory(self, path: Path, full_paths: list[Path]) -> Response:
         sort_by = request.args.get('sort', 'name')
         reverse = request.args.get('desc', '0') == '1'
 
         entries = []
+        listed = set()
 
-        for item in sorted(os.listdir(full_path)):
-            entries.append(self._create_child_entry(full_path, path, item, sort_by))
+        for full_path in full_paths:
+            for item in sorted(os.listdir(full_path)):
+                if item.startswith('.') or item in listed:
+                    continue
+                listed.add(item)
+                entries.append(self._create_child_entry(full_path, path, item, sort_by))
 
         entries.sort(
             key=lambda x: x['sort_key'] if isinstance(x['sort_key'], tuple) else (str(x['sort_key'])), reverse=reverse
@@ -131,9 +249,18 @@ class DefaultDirectoryService(DirectoryService):
 
         breadcrumbs = self._create_breadcrumbs(path)
 
-        return Response(render_template(self._config.html_template.name, items=entries, path=path,
-                                        breadcrumbs=breadcrumbs, sort_by=sort_by, reverse=reverse,
-                                        version=self._config.version))
+        content = render_template(self._config.html_template.name, items=entries, path=path,
+                                  breadcrumbs=breadcrumbs, sort_by=sort_by, reverse=reverse,
+                                  version=self._config.version).encode()
+
+        variants = _get_listing_variants(content)
+        headers = {'Vary': 'Accept-Encoding'} if variants else {}
+
+        if coding := self._select_content_coding(variants):
+            headers['Content-Encoding'] = coding
+            return Response(variants[coding], mimetype='text/html', headers=headers)
+
+        return Response(content, mimetype='text/html', headers=headers)
 
     def _create_parent_entry(self, path: Path) -> dict[str, Any]:
         parent_path = '/' + quote(str(path.parent)) + '/'
@@ -176,3 +303,31 @@ class DefaultDirectoryService(DirectoryService):
                 'href': '/' + quote(path_accum.replace(os.sep, '/')) + '/'
             })
         return breadcrumbs
+
+
+def _get_body(content: bytes | memoryview) -> Any:
+    # A spilled entry is served straight from its memory mapping instead of being copied to bytes
+    return content if isinstance(content, bytes) else [content]
+
+
+@lru_cache(maxsize=256)
+def _get_listing_variants(content: bytes) -> dict[str, bytes]:
+    return create_content_variants(content)
+
+
+@lru_cache(maxsize=1024)
+def _get_content_headers(name: str, immutable: bool) -> tuple[str | None, dict[str, str]]:
+    mimetype, encoding = mimetypes.guess_type(name)
+
+    headers = {}
+
+    if encoding:
+        headers['Content-Encoding'] = encoding
+        headers['Content-Disposition'] = f'attachment; filename="{name}"'
+    elif not mimetype:
+        mimetype = 'text/plain'
+
+    if immutable:
+        headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+
+    return mimetype, headers
@@ -0,0 +1,88 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import gzip
+import hashlib
+from dataclasses import dataclass
+from difflib import SequenceMatcher
+
+
+@dataclass(frozen=True)
+class IndexPatch:
+    name: str
+    previous_sha256: str
+    previous_size: int
+    sha256: str
+    size: int
+    download: bytes
+    download_sha256: str
+
+    @classmethod
+    def create(cls, name: str, previous: bytes, current: bytes) -> 'IndexPatch':
+        patch = create_ed_script(previous, current)
+        download = gzip.compress(patch, mtime=0)
+        return cls(name, hashlib.sha256(previous).hexdigest(), len(previous), hashlib.sha256(patch).hexdigest(),
+                   len(patch), download, hashlib.sha256(download).hexdigest())
+
+
+def create_ed_script(previous: bytes, current: bytes) -> bytes:
+    previous_stanzas = _split_stanzas(previous)
+    current_stanzas = _split_stanzas(current)
+    previous_offsets = _get_line_offsets(previous_stanzas)
+
+    matcher = SequenceMatcher(None, previous_stanzas, current_stanzas, autojunk=False)
+    commands = []
+
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag == 'equal':
+            continue
+
+        start, end = previous_offsets[i1], previous_offsets[i2]
+        lines = b''.join(current_stanzas[j1:j2])
+
+        if tag == 'insert':
+            commands.append(f'{start}a\n'.encode() + lines + b'.\n')
+        elif tag == 'delete':
+            commands.append(f'{_format_range(start, end)}d\n'.encode())
+        else:
+            commands.append(f'{_format_range(start, end)}c\n'.encode() + lines + b'.\n')
+
+    return b''.join(commands)
+
+
+def create_diff_index(current: bytes, patches: list[IndexPatch]) -> bytes:
+    lines = [f'SHA256-Current: {hashlib.sha256(current).hexdigest()} {len(current)}', 'SHA256-History:']
+    lines.extend(f' {patch.previous_sha256} {patch.previous_size} {patch.name}' for patch in patches)
+    lines.append('SHA256-Patches:')
+    lines.extend(f' {patch.sha256} {patch.size} {patch.name}' for patch in patches)
+    lines.append('SHA256-Download:')
+    lines.extend(f' {patch.download_sha256} {len(patch.download)} {patch.name}.gz' for patch in patches)
+    return ('\n'.join(lines) + '\n').encode()
+
+
+def _split_stanzas(content: bytes) -> list[bytes]:
+    stanzas = []
+    start = 0
+
+    while (end := content.find(b'\n\n', start)) != -1:
+        stanzas.append(content[start:end + 2])
+        start = end + 2
+
+    if start < len(content):
+        stanzas.append(content[start:])
+
+    return stanzas
+
+
+def _get_line_offsets(stanzas: list[bytes]) -> list[int]:
+    offsets = [0]
+
+    for stanza in stanzas:
+        offsets.append(offsets[-1] + stanza.count(b'\n') + (0 if stanza.endswith(b'\n') else 1))
+
+    return offsets
+
+
+def _format_range(start: int, end: int) -> str:
+    return f'{start + 1},{end}' if end - start > 1 else f'{start + 1}'
@@ -0,0 +1,144 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import bz2
+import gzip
+import hashlib
+import io
+import lzma
+import os
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+COMPRESSION_LEVELS = {'gz': 9, 'xz': 6, 'bz2': 9, 'zst': 19}
+FAST_COMPRESSION_LEVELS = {'gz': 1, 'xz': 0, 'bz2': 1, 'zst': 1}
+MAXIMUM_COMPRESSION_LEVELS = {'gz': 9, 'xz': 9, 'bz2': 9, 'zst': 19}
+
+WRITE_CHUNK_SIZE = 256 * 1024
+
+
+@dataclass(frozen=True)
+class IndexFile:
+    path: Path
+    content: bytes
+    size: int
+    md5: str
+    sha1: str
+    sha256: str
+
+    @classmethod
+    def create(cls, path: Path, content: bytes) -> 'IndexFile':
+        md5, sha1, sha256 = hashlib.md5(), hashlib.sha1(), hashlib.sha256()
+
+        for chunk in iterate_chunks(content):
+            md5.update(chunk)
+            sha1.update(chunk)
+            sha256.update(chunk)
+
+        return cls(path, content, len(content), md5.hexdigest(), sha1.hexdigest(), sha256.hexdigest())
+
+
+class IndexWriter(object):
+
+    def __init__(self, path: Path, compression: str | None = None, level: int | None = None) -> None:
+        self._path = path
+        self._temp_path = path.parent / f'.{path.name}.tmp'
+        self._compressor = create_compressor(compression, level) if compression else None
+        self._md5 = hashlib.md5()
+        self._sha1 = hashlib.sha1()
+        self._sha256 = hashlib.sha256()
+        self._buffer = io.BytesIO()
+        self._size = 0
+        self._file = open(self._temp_path, 'wb')
+
+    def write(self, chunk: bytes | memoryview) -> None:
+        self._emit(self._compressor.compress(chunk) if self._compressor else chunk)
+
+    def close(self) -> IndexFile:
+        if self._compressor:
+            self._emit(self._compressor.flush())
+
+        self._file.close()
+        os.replace(self._temp_path, self._path)
+
+        # The buffer is handed over without copying as nothing else references it
+        return IndexFile(self._path, self._buffer.getvalue(), self._size, self._md5.hexdigest(),
+                         self._sha1.hexdigest(), self._sha256.hexdigest())
+
+    def abort(self) -> None:
+        self._file.close()
+        self._temp_path.unlink(missing_ok=True)
+
+    def _emit(self, data: bytes | memoryview) -> None:
+        if data:
+            self._md5.update(data)
+            self._sha1.update(data)
+            self._sha256.update(data)
+            self._file.write(data)
+            self._buffer.write(data)
+            self._size += len(data)
+
+
+def write_index_file(path: Path, chunks: Iterable[bytes | memoryview], compression: str | None = None,
+                     level: int | None = None) -> IndexFile:
+    writer = IndexWriter(path, compression, level)
+
+    try:
+        for chunk in chunks:
+            writer.write(chunk)
+    except BaseException:
+        writer.abort()
+        raise
+
+    return writer.close()
+
+
+def iterate_chunks(content: bytes | memoryview, chunk_size: int = WRITE_CHUNK_SIZE) -> Iterator[memoryview]:
+    view = memoryview(content)
+
+    for offset in range(0, len(view), chunk_size):
+        yield view[offset:offset + chunk_size]
+
+
+def compress_content(content: bytes | memoryview, compression: str, level: int | None = None) -> bytes:
+    compressor = create_compressor(compression, level)
+    chunks = [compressor.compress(chunk) for chunk in iterate_chunks(content)]
+    chunks.append(compressor.flush())
+    return b''.join(chunks)
+
+
+def decompress_content(content: bytes | memoryview, compression: str) -> bytes:
+    if compression == 'gz':
+        return gzip.decompress(content)
+    elif compression == 'xz':
+        return lzma.decompress(content)
+    elif compression == 'bz2':
+        return bz2.decompress(content)
+    elif compression == 'zst':
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompressobj().decompress(content)
+    else:
+        raise ValueError(f'Unsupported compression: {compression}')
+
+
+def create_compressor(compression: str, level: int | None = None) -> Any:
+    if compression not in COMPRESSION_LEVELS:
+        raise ValueError(f'Unsupported compression: {compression}')
+
+    if level is None:
+        level = COMPRESSION_LEVELS[compression]
+
+    if compression == 'gz':
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif compression == 'xz':
+        return lzma.LZMACompressor(format=lzma.FORMAT_XZ, check=lzma.CHECK_CRC64, preset=level)
+    elif compression == 'bz2':
+        return bz2.BZ2Compressor(level)
+    else:
+        import zstandard
+
+        return zstandard.ZstdCompressor(level=level).compressobj()
@@ -0,0 +1,51 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+from pathlib import Path
+from threading import Lock
+
+from context_logger import get_logger
+
+log = get_logger('PackagePool')
+
+
+class PackagePool:
+
+    def resolve(self, pool_path: Path) -> Path | None:
+        raise NotImplementedError()
+
+    def get_directories(self, pool_path: Path) -> list[Path]:
+        raise NotImplementedError()
+
+
+class DefaultPackagePool(PackagePool):
+
+    def __init__(self, roots: list[Path]) -> None:
+        self._roots = roots
+        self._index: dict[Path, Path] = {}
+        self._lock = Lock()
+
+    def resolve(self, pool_path: Path) -> Path | None:
+        with self._lock:
+            root = self._index.get(pool_path)
+
+        if root and (root / pool_path).exists():
+            return root
+
+        for root in self._roots:
+            if (root / pool_path).exists():
+                log.debug('Indexed pool path', path=str(pool_path), root=str(root))
+
+                with self._lock:
+                    self._index[pool_path] = root
+
+                return root
+
+        with self._lock:
+            self._index.pop(pool_path, None)
+
+        return None
+
+    def get_directories(self, pool_path: Path) -> list[Path]:
+        return [root / pool_path for root in self._roots if (root / pool_path).is_dir()]
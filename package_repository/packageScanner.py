@@ -0,0 +1,232 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from context_logger import get_logger
+
+from package_repository import ControlStanza, DebPackage, PackageStore, FileFingerprint, StoredPackage, \
+    DigestService, DefaultDigestService, FileDigest
+
+log = get_logger('PackageScanner')
+
+
+class PackageScanner:
+
+    def initialize(self) -> None:
+        raise NotImplementedError()
+
+    def scan(self, package_dir: Path, architectures: list[str],
+             changed_paths: set[Path] | None = None) -> dict[str, bytes]:
+        raise NotImplementedError()
+
+
+class DpkgPackageScanner(PackageScanner):
+
+    def __init__(self, repository_dir: Path, workers: int = 1) -> None:
+        self._repository_dir = repository_dir
+        self._workers = workers
+
+    def initialize(self) -> None:
+        pass
+
+    def scan(self, package_dir: Path, architectures: list[str],
+             changed_paths: set[Path] | None = None) -> dict[str, bytes]:
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            results = executor.map(lambda architecture: self._scan_architecture(package_dir, architecture),
+                                   architectures)
+
+            return dict(zip(architectures, results))
+
+    def _scan_architecture(self, package_dir: Path, architecture: str) -> bytes:
+        command = ['dpkg-scanpackages', '--multiversion', '--arch', architecture, str(package_dir)]
+        result = subprocess.run(command, capture_output=True, check=True, cwd=self._repository_dir)
+        return result.stdout
+
+
+class SinglePassDpkgPackageScanner(PackageScanner):
+
+    def __init__(self, repository_dir: Path) -> None:
+        self._repository_dir = repository_dir
+
+    def initialize(self) -> None:
+        pass
+
+    def scan(self, package_dir: Path, architectures: list[str],
+             changed_paths: set[Path] | None = None) -> dict[str, bytes]:
+        command = ['dpkg-scanpackages', '--multiversion', str(package_dir)]
+        result = subprocess.run(command, capture_output=True, check=True, cwd=self._repository_dir)
+
+        stanzas = [ControlStanza.parse(entry) for entry in result.stdout.split(b'\n\n') if entry.strip()]
+
+        log.debug('Scanned package directory', directory=str(package_dir), packages=len(stanzas))
+
+        return create_packages_indices(stanzas, architectures)
+
+
+class NativePackageScanner(PackageScanner):
+
+    def __init__(self, repository_dir: Path, store: PackageStore | None = None,
+                 digests: DigestService | None = None) -> None:
+        self._repository_dir = repository_dir
+        self._store = store
+        self._digests = digests or DefaultDigestService()
+        self._stanzas: dict[Path, dict[Path, ControlStanza]] = {}
+        self._packages: dict[Path, dict[str, bytes]] = {}
+
+    def initialize(self) -> None:
+        if self._store:
+            self._store.initialize()
+
+    def scan(self, package_dir: Path, architectures: list[str],
+             changed_paths: set[Path] | None = None) -> dict[str, bytes]:
+        stanzas = self._stanzas.get(package_dir)
+        packages = self._packages.get(package_dir)
+
+        if changed_paths is None or stanzas is None or packages is None or set(packages) != set(architectures):
+            stanzas = self._scan_directory(package_dir)
+            packages = create_packages_indices(list(stanzas.values()), architectures)
+            log.debug('Scanned package directory', directory=str(package_dir), packages=len(stanzas))
+        else:
+            stanzas = dict(stanzas)
+            affected = self._apply_changes(stanzas, changed_paths)
+
+            if not affected:
+                return packages
+
+            if 'all' in affected:
+                affected = set(architectures)
+
+            packages = packages | create_packages_indices(list(stanzas.values()), sorted(affected & set(packages)))
+            log.debug('Updated package directory', directory=str(package_dir), packages=len(stanzas),
+                      changes=len(changed_paths), architectures=sorted(affected))
+
+        self._stanzas[package_dir] = stanzas
+        self._packages[package_dir] = packages
+
+        return packages
+
+    def _scan_directory(self, package_dir: Path) -> dict[Path, ControlStanza]:
+        return self._read_packages(package_dir, find_packages(self._repository_dir, package_dir))
+
+    def _read_packages(self, package_dir: Path, package_paths: list[Path]) -> dict[Path, ControlStanza]:
+        stored = self._store.load(package_dir) if self._store else {}
+        stanzas = {}
+        pending = {}
+
+        for package_path in package_paths:
+            try:
+                fingerprint = FileFingerprint.create(self._repository_dir / package_path)
+            except FileNotFoundError:
+                continue
+
+            stored_package = stored.get(package_path)
+
+            if stored_package and stored_package.fingerprint == fingerprint:
+                stanzas[package_path] = stored_package.stanza
+            else:
+                pending[package_path] = fingerprint
+
+        digests = self._digests.digest({self._repository_dir / path: fingerprint
+                                        for path, fingerprint in pending.items()})
+        updated = {}
+
+        for package_path, fingerprint in pending.items():
+            digest = digests.get(self._repository_dir / package_path)
+
+            if digest and (stanza := self._create_stanza(package_path, digest)):
+                stanzas[package_path] = stanza
+                updated[package_path] = StoredPackage(fingerprint, stanza)
+
+        if self._store:
+            self._store.save(updated)
+            self._store.remove(set(stored) - set(stanzas))
+
+        if stored:
+            log.debug('Reused stored packages', directory=str(package_dir),
+                      reused=len(stanzas) - len(updated), updated=len(updated))
+
+        return stanzas
+
+    def _apply_changes(self, stanzas: dict[Path, ControlStanza], changed_paths: set[Path]) -> set[str]:
+        affected = set()
+
+        for changed_path in changed_paths:
+            for package_path in [path for path in stanzas if path.is_relative_to(changed_path)]:
+                affected.add(stanzas.pop(package_path).architecture)
+
+            full_path = self._repository_dir / changed_path
+
+            if full_path.is_dir():
+                added = self._scan_directory(changed_path)
+            elif full_path.is_file() and full_path.suffix == '.deb':
+                added = self._read_packages(changed_path, [changed_path])
+            else:
+                added = self._read_packages(changed_path, [])
+
+            for package_path, stanza in added.items():
+                stanzas[package_path] = stanza
+                affected.add(stanza.architecture)
+
+        return affected
+
+    def _create_stanza(self, package_path: Path, digest: FileDigest) -> ControlStanza | None:
+        full_path = self._repository_dir / package_path
+
+        try:
+            stanza = ControlStanza.parse(DebPackage(full_path).get_control())
+        except Exception as error:
+            log.warning('Failed to read control information, skipping package', file=str(full_path), error=error)
+            return None
+
+        if not stanza.package:
+            log.warning('No Package field in control file, skipping package', file=str(full_path))
+            return None
+
+        stanza['Filename'] = package_path.as_posix()
+        stanza['MD5sum'] = digest.md5
+        stanza['SHA1'] = digest.sha1
+        stanza['SHA256'] = digest.sha256
+        stanza['Size'] = str(digest.size)
+
+        return stanza
+
+
+def create_packages_indices(stanzas: list[ControlStanza], architectures: list[str]) -> dict[str, bytes]:
+    packages: dict[str, list[bytes]] = {architecture: [] for architecture in architectures}
+
+    for stanza in sorted(stanzas, key=lambda entry: (entry.package, entry.version, entry.filename)):
+        content = stanza.format() + b'\n'
+
+        if stanza.architecture == 'all':
+            for entries in packages.values():
+                entries.append(content)
+        elif stanza.architecture in packages:
+            packages[stanza.architecture].append(content)
+
+    return {architecture: b''.join(entries) for architecture, entries in packages.items()}
+
+
+def find_packages(repository_dir: Path, package_dir: Path) -> list[Path]:
+    package_paths = []
+    visited = set()
+
+    for root, dirs, files in os.walk(repository_dir / package_dir, followlinks=True):
+        stat = os.stat(root)
+
+        if (stat.st_dev, stat.st_ino) in visited:
+            dirs.clear()
+            continue
+
+        visited.add((stat.st_dev, stat.st_ino))
+        relative_root = package_dir / Path(root).relative_to(repository_dir / package_dir)
+
+        for file in files:
+            if file.endswith('.deb'):
+                package_paths.append(relative_root / file)
+
+    return package_paths
@@ -0,0 +1,211 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import os
+import sqlite3
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+
+from context_logger import get_logger
+
+from package_repository import ControlStanza
+
+log = get_logger('PackageStore')
+
+
+@dataclass(frozen=True)
+class FileFingerprint:
+    size: int
+    mtime: int
+    inode: int
+
+    @classmethod
+    def create(cls, file_path: Path) -> 'FileFingerprint':
+        stat = os.stat(file_path)
+        return cls(stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+@dataclass
+class StoredPackage:
+    fingerprint: FileFingerprint
+    stanza: ControlStanza
+
+
+@dataclass
+class StoredContents:
+    fingerprint: FileFingerprint
+    location: str
+    architecture: str
+    files: list[str]
+
+
+class PackageStore:
+
+    def initialize(self) -> None:
+        raise NotImplementedError()
+
+    def load(self, package_path: Path) -> dict[Path, StoredPackage]:
+        raise NotImplementedError()
+
+    def save(self, packages: dict[Path, StoredPackage]) -> None:
+        raise NotImplementedError()
+
+    def remove(self, package_paths: set[Path]) -> None:
+        raise NotImplementedError()
+
+    def load_contents(self, package_path: Path) -> dict[Path, StoredContents]:
+        raise NotImplementedError()
+
+    def save_contents(self, contents: dict[Path, StoredContents]) -> None:
+        raise NotImplementedError()
+
+    def remove_contents(self, package_paths: set[Path]) -> None:
+        raise NotImplementedError()
+
+
+class SqlitePackageStore(PackageStore):
+
+    def __init__(self, database_path: Path) -> None:
+        self._database_path = database_path
+        self._connection: sqlite3.Connection | None = None
+        self._lock = Lock()
+
+    def initialize(self) -> None:
+        os.makedirs(self._database_path.parent, exist_ok=True)
+
+        with self._lock:
+            if self._connection:
+                return
+
+            self._connection = sqlite3.connect(self._database_path, check_same_thread=False)
+            self._connection.execute('''
+                CREATE TABLE IF NOT EXISTS packages (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    md5 TEXT NOT NULL,
+                    sha1 TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    control BLOB NOT NULL
+                )
+            ''')
+            self._connection.execute('''
+                CREATE TABLE IF NOT EXISTS contents (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime INTEGER NOT NULL,
+                    inode INTEGER NOT NULL,
+                    location TEXT NOT NULL,
+                    architecture TEXT NOT NULL,
+                    files BLOB NOT NULL
+                )
+            ''')
+            self._connection.commit()
+
+            count = self._connection.execute('SELECT COUNT(*) FROM packages').fetchone()[0]
+
+        log.info('Opened package store', file=str(self._database_path), packages=count)
+
+    def load(self, package_path: Path) -> dict[Path, StoredPackage]:
+        path = package_path.as_posix()
+
+        with self._lock:
+            rows = self._get_connection().execute(
+                'SELECT path, size, mtime, inode, control FROM packages WHERE path = ? OR (path > ? AND path < ?)',
+                (path, f'{path}/', f'{path}0')
+            ).fetchall()
+
+        packages = {}
+
+        for row_path, size, mtime, inode, control in rows:
+            try:
+                packages[Path(row_path)] = StoredPackage(FileFingerprint(size, mtime, inode),
+                                                         ControlStanza.parse(control))
+            except ValueError as error:
+                log.warning('Ignoring invalid stored package', path=row_path, error=error)
+
+        return packages
+
+    def save(self, packages: dict[Path, StoredPackage]) -> None:
+        if not packages:
+            return
+
+        rows = [
+            (path.as_posix(), package.fingerprint.size, package.fingerprint.mtime, package.fingerprint.inode,
+             package.stanza.get('MD5sum'), package.stanza.get('SHA1'), package.stanza.get('SHA256'),
+             package.stanza.format())
+            for path, package in packages.items()
+        ]
+
+        with self._lock:
+            connection = self._get_connection()
+            connection.executemany('INSERT OR REPLACE INTO packages VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            connection.commit()
+
+        log.debug('Saved packages to store', packages=len(rows))
+
+    def remove(self, package_paths: set[Path]) -> None:
+        if not package_paths:
+            return
+
+        with self._lock:
+            connection = self._get_connection()
+            rows = [(path.as_posix(),) for path in package_paths]
+            connection.executemany('DELETE FROM packages WHERE path = ?', rows)
+            connection.commit()
+
+        log.debug('Removed packages from store', packages=len(package_paths))
+
+    def load_contents(self, package_path: Path) -> dict[Path, StoredContents]:
+        path = package_path.as_posix()
+
+        with self._lock:
+            rows = self._get_connection().execute(
+                'SELECT path, size, mtime, inode, location, architecture, files FROM contents '
+                'WHERE path = ? OR (path > ? AND path < ?)',
+                (path, f'{path}/', f'{path}0')
+            ).fetchall()
+
+        return {
+            Path(row_path): StoredContents(FileFingerprint(size, mtime, inode), location, architecture,
+                                           files.decode('utf-8', 'surrogateescape').splitlines())
+            for row_path, size, mtime, inode, location, architecture, files in rows
+        }
+
+    def save_contents(self, contents: dict[Path, StoredContents]) -> None:
+        if not contents:
+            return
+
+        rows = [
+            (path.as_posix(), entry.fingerprint.size, entry.fingerprint.mtime, entry.fingerprint.inode, entry.location,
+             entry.architecture, '\n'.join(entry.files).encode('utf-8', 'surrogateescape'))
+            for path, entry in contents.items()
+        ]
+
+        with self._lock:
+            connection = self._get_connection()
+            connection.executemany('INSERT OR REPLACE INTO contents VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            connection.commit()
+
+        log.debug('Saved contents to store', packages=len(rows))
+
+    def remove_contents(self, package_paths: set[Path]) -> None:
+        if not package_paths:
+            return
+
+        with self._lock:
+            connection = self._get_connection()
+            rows = [(path.as_posix(),) for path in package_paths]
+            connection.executemany('DELETE FROM contents WHERE path = ?', rows)
+            connection.commit()
+
+        log.debug('Removed contents from store', packages=len(package_paths))
+
+    def _get_connection(self) -> sqlite3.Connection:
+        if not self._connection:
+            raise RuntimeError('Package store is not initialized')
+
+        return self._connection
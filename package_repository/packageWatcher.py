@@ -13,7 +13,7 @@ log = get_logger('PackageWatcher')
 
 
 class OnPackageEvent(Protocol):
-    def __call__(self, distribution: str) -> None: ...
+    def __call__(self, distribution: str, package_path: Path) -> None: ...
 
 
 class PackageWatcher:
@@ -33,15 +33,17 @@ class PackageWatcher:
 
 class DefaultPackageWatcher(PackageWatcher, FileSystemEventHandler):
 
-    def __init__(self, observer: BaseObserver, deb_package_dir: Path) -> None:
+    def __init__(self, observer: BaseObserver, deb_package_dir: Path, pool_roots: list[Path] | None = None) -> None:
         self._observer = observer
         self._deb_package_dir = deb_package_dir
+        self._pool_roots = [deb_package_dir] + (pool_roots or [])
         self._handlers: list[OnPackageEvent] = []
 
     def start(self) -> None:
-        deb_package_dir = str(self._deb_package_dir)
-        log.info('Watching package pool for changes', directory=deb_package_dir)
-        self._observer.schedule(self, deb_package_dir, recursive=True)
+        for pool_root in self._pool_roots:
+            log.info('Watching package pool for changes', directory=str(pool_root))
+            self._observer.schedule(self, str(pool_root), recursive=True)
+
         self._observer.start()
 
     def stop(self) -> None:
@@ -54,31 +56,47 @@ class DefaultPackageWatcher(PackageWatcher, FileSystemEventHandler):
         self._handlers.remove(handler)
 
     def on_created(self, event: FileSystemEvent) -> None:
-        self._on_changed(event)
+        self._on_changed(event, str(event.src_path))
 
     def on_moved(self, event: FileSystemEvent) -> None:
-        self._on_changed(event)
+        self._on_changed(event, str(event.src_path))
+
+        if event.dest_path:
+            self._on_changed(event, str(event.dest_path))
 
     def on_deleted(self, event: FileSystemEvent) -> None:
-        self._on_changed(event)
+        self._on_changed(event, str(event.src_path))
 
-    def _on_changed(self, event: FileSystemEvent) -> None:
-        if str(event.src_path).endswith('.deb'):
-            log.debug('File change event detected for package', event_type=event.event_type, file=event.src_path)
+    def _on_changed(self, event: FileSystemEvent, file_path: str) -> None:
+        if file_path.endswith('.deb') or event.is_directory:
+            log.debug('File change event detected for package', event_type=event.event_type, file=file_path)
 
             try:
-                relative_path = Path(str(event.src_path)).relative_to(self._deb_package_dir)
+                relative_path = Path(file_path).relative_to(self._get_pool_root(Path(file_path)))
+
+                if any(part.startswith('.') for part in relative_path.parts):
+                    log.debug('File change event, ignoring hidden path', event_type=event.event_type, file=file_path)
+                    return
+
                 distribution = relative_path.parts[0]
 
                 for handler in self._handlers:
-                    self._execute_handler(handler, distribution)
+                    self._execute_handler(handler, distribution, relative_path)
             except Exception as error:
-                log.error('Could not determine distribution from file path', error=error, file=event.src_path)
+                log.error('Could not determine distribution from file path', error=error, file=file_path)
         else:
-            log.debug('File change event, ignoring as not a package', event_type=event.event_type, file=event.src_path)
+            log.debug('File change event, ignoring as not a package', event_type=event.event_type, file=file_path)
+
+    def _get_pool_root(self, file_path: Path) -> Path:
+        for pool_root in self._pool_roots:
+            if file_path.is_relative_to(pool_root):
+                return pool_root
+
+        return self._deb_package_dir
 
-    def _execute_handler(self, handler: OnPackageEvent, distribution: str) -> None:
+    def _execute_handler(self, handler: OnPackageEvent, distribution: str, package_path: Path) -> None:
         try:
-            handler(distribution)
+            handler(distribution, package_path)
         except Exception as error:
-            log.error('Error when executing package event handler', error=error, distribution=distribution)
+            log.error('Error when executing package event handler', error=error, distribution=distribution,
+                      file=str(package_path))
@@ -0,0 +1,275 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable
+
+from context_logger import get_logger
+
+from package_repository import RepositoryCache, DefaultRepositoryCache, RepositoryCreator, RepositorySigner
+
+log = get_logger('RepositoryBuilder')
+
+RECOMPRESSION_NICENESS = 10
+
+ComponentFactory = Callable[[RepositoryCache], tuple[RepositoryCreator, RepositorySigner]]
+
+
+class RepositoryBuildError(Exception):
+
+    def __init__(self, message: str, distribution: str | None = None) -> None:
+        super().__init__(message)
+        self.distribution = distribution
+
+
+class RepositoryBuilder:
+
+    def initialize(self) -> None:
+        raise NotImplementedError()
+
+    def build(self, distribution: str, changed_paths: set[Path] | None = None) -> bool:
+        raise NotImplementedError()
+
+    def recompress(self, distribution: str) -> bool:
+        raise NotImplementedError()
+
+    def shutdown(self) -> None:
+        raise NotImplementedError()
+
+
+class DefaultRepositoryBuilder(RepositoryBuilder):
+
+    def __init__(self, creator: RepositoryCreator, signer: RepositorySigner, cache: RepositoryCache) -> None:
+        self._creator = creator
+        self._signer = signer
+        self._cache = cache
+        self._locks: dict[str, Lock] = {}
+        self._verifier = ThreadPoolExecutor(max_workers=1, thread_name_prefix='SignatureVerifier')
+
+    def initialize(self) -> None:
+        self._cache.initialize()
+        self._creator.initialize()
+        self._signer.initialize()
+
+    def build(self, distribution: str, changed_paths: set[Path] | None = None) -> bool:
+        with self._locks.setdefault(distribution, Lock()):
+            try:
+                if not self._creator.create(distribution, changed_paths):
+                    log.info('Repository unchanged, skipping publish', distribution=distribution)
+                    self._cache.discard(distribution)
+                    return False
+
+                self._signer.sign(distribution)
+            except Exception:
+                self._cache.discard(distribution)
+                self._creator.revert(distribution)
+                raise
+
+            verification = self._verifier.submit(self._signer.verify, distribution)
+
+            self._cache.switch(distribution)
+
+            try:
+                verification.result()
+            except Exception:
+                log.error('Signature verification failed, reverting publish', distribution=distribution)
+                self._cache.revert(distribution)
+                self._creator.revert(distribution)
+                raise
+
+            self._creator.commit(distribution)
+
+            return True
+
+    def recompress(self, distribution: str) -> bool:
+        if not self._creator.recompress(distribution):
+            return False
+
+        log.info('Publishing recompressed index files', distribution=distribution)
+
+        return self.build(distribution, set())
+
+    def shutdown(self) -> None:
+        self._verifier.shutdown()
+        self._creator.shutdown()
+        self._cache.shutdown()
+
+
+class ProcessRepositoryBuilder(RepositoryBuilder):
+
+    def __init__(self, cache: RepositoryCache, distributions: set[str], factory: ComponentFactory,
+                 initializer: Callable[[], Any] | None = None) -> None:
+        self._cache = cache
+        self._distributions = distributions
+        self._factory = factory
+        self._initializer = initializer
+        self._context = multiprocessing.get_context('spawn')
+        self._process: BaseProcess | None = None
+        self._connection: Connection | None = None
+        self._lock = Lock()
+
+    def initialize(self) -> None:
+        self._cache.initialize()
+
+        with self._lock:
+            self._start_process()
+
+    def build(self, distribution: str, changed_paths: set[Path] | None = None) -> bool:
+        return self._execute('build', distribution, changed_paths)
+
+    def recompress(self, distribution: str) -> bool:
+        return self._execute('recompress', distribution)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._connection and self._process and self._process.is_alive():
+                self._connection.send(None)
+                self._process.join()
+
+            self._process = None
+            self._connection = None
+
+        self._cache.shutdown()
+
+    def _execute(self, command: str, distribution: str, changed_paths: set[Path] | None = None) -> bool:
+        with self._lock:
+            if not self._process or not self._process.is_alive():
+                log.warning('Builder process is not running, restarting', distribution=distribution)
+                self._start_process()
+
+            status, result = self._request((command, distribution, changed_paths), distribution)
+
+        if status == 'error':
+            raise RepositoryBuildError(f'Repository build failed: {result}', distribution)
+
+        if result is None:
+            return False
+
+        files, removed = result
+
+        if removed is None:
+            self._cache.replace(distribution, files)
+        else:
+            self._cache.patch(distribution, files, removed)
+
+        log.info('Published generation built by builder process', distribution=distribution, command=command,
+                 files=len(files), removed=len(removed or ()))
+
+        return True
+
+    def _start_process(self) -> None:
+        parent_connection, child_connection = self._context.Pipe()
+
+        self._process = self._context.Process(target=_run_builder, name='RepositoryBuilder', daemon=True,
+                                              args=(child_connection, self._distributions, self._factory,
+                                                    self._initializer))
+        self._process.start()
+        self._connection = parent_connection
+
+        child_connection.close()
+
+        status, result = self._receive(None)
+
+        if status == 'error':
+            raise RepositoryBuildError(f'Failed to initialize builder process: {result}')
+
+        log.info('Started builder process', pid=self._process.pid)
+
+    def _request(self, request: Any, distribution: str) -> tuple[str, Any]:
+        if not self._connection:
+            raise RepositoryBuildError('Builder process is not running', distribution)
+
+        try:
+            self._connection.send(request)
+        except OSError as error:
+            self._process = None
+            self._connection = None
+            raise RepositoryBuildError(f'Builder process terminated: {error!r}', distribution) from error
+
+        return self._receive(distribution)
+
+    def _receive(self, distribution: str | None) -> tuple[str, Any]:
+        if not self._connection:
+            raise RepositoryBuildError('Builder process is not running', distribution)
+
+        try:
+            response: tuple[str, Any] = self._connection.recv()
+            return response
+        except (EOFError, OSError) as error:
+            self._process = None
+            self._connection = None
+            raise RepositoryBuildError(f'Builder process terminated: {error!r}', distribution) from error
+
+
+def _run_builder(connection: Connection, distributions: set[str], factory: ComponentFactory,
+                 initializer: Callable[[], Any] | None) -> None:
+    if initializer:
+        initializer()
+
+    # The builder's cache is only exported, content variants are created by the serving cache
+    cache = DefaultRepositoryCache(distributions, content_variants=False)
+
+    try:
+        creator, signer = factory(cache)
+        builder = DefaultRepositoryBuilder(creator, signer, cache)
+        builder.initialize()
+    except Exception as error:
+        log.error('Failed to initialize builder process', error=error)
+        connection.send(('error', repr(error)))
+        return
+
+    connection.send(('ready', None))
+
+    # Recompression runs on a lower priority thread, like in the serving process in thread mode
+    recompressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='Recompressor',
+                                      initializer=lower_thread_priority)
+    published: dict[str, dict[Path, bytes]] = {}
+
+    while request := connection.recv():
+        command, distribution, changed_paths = request
+
+        try:
+            if command == 'recompress':
+                changed = recompressor.submit(builder.recompress, distribution).result()
+            else:
+                changed = builder.build(distribution, changed_paths)
+
+            connection.send(('done', _get_published_changes(cache, distribution, published) if changed else None))
+        except Exception as error:
+            log.error('Failed to build repository', distribution=distribution, error=error)
+            connection.send(('error', repr(error)))
+
+    recompressor.shutdown()
+    builder.shutdown()
+
+
+def lower_thread_priority() -> None:
+    try:
+        thread_id = threading.get_native_id()
+        os.setpriority(os.PRIO_PROCESS, thread_id, os.getpriority(os.PRIO_PROCESS, thread_id) + RECOMPRESSION_NICENESS)
+    except (AttributeError, OSError) as error:
+        log.warning('Failed to lower recompression thread priority', error=error)
+
+
+def _get_published_changes(cache: RepositoryCache, distribution: str,
+                           published: dict[str, dict[Path, bytes]]) -> tuple[dict[Path, bytes], set[Path] | None]:
+    files = cache.export(distribution)
+    previous = published.get(distribution)
+    published[distribution] = files
+
+    if previous is None:
+        return files, None
+
+    # Unchanged content is exported as the same interned object, only changed files are sent to the parent
+    changed = {path: content for path, content in files.items()
+               if (sent := previous.get(path)) is None or (sent is not content and sent != content)}
+
+    return changed, set(previous) - set(files)
@@ -2,12 +2,80 @@
 # SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
 # SPDX-License-Identifier: MIT
 
+import hashlib
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from importlib.util import find_spec
 from pathlib import Path
+from threading import RLock
 
 from context_logger import get_logger
 
+from package_repository import compress_content, decompress_content, CacheMemory, DefaultCacheMemory, CacheBlob, \
+    CacheStatistics, COMPRESSION_LEVELS, FAST_COMPRESSION_LEVELS
+
 log = get_logger('RepositoryCache')
 
+CONTENT_CODINGS = {'zstd': 'zst', 'gzip': 'gz'}
+COMPRESSED_SIGNATURES = (b'\x1f\x8b', b'\xfd7zXZ\x00', b'BZh', b'\x28\xb5\x2f\xfd')
+MIN_VARIANT_SIZE = 512
+DECOMPRESSION_PREFERENCE = ['zst', 'gz', 'xz', 'bz2']
+INFLATED_CACHE_SIZE = 8
+
+
+@dataclass(frozen=True)
+class CachedFile:
+    generation: int
+    blob: CacheBlob
+    etag: str
+    modified: float
+    variants: dict[str, CacheBlob]
+    compression: str | None = None
+
+    @property
+    def content(self) -> bytes | memoryview:
+        return self.blob.content
+
+
+@dataclass(frozen=True)
+class CacheGeneration:
+    id: int
+    entries: dict[Path, CachedFile]
+    created: float
+    expires: float = float('inf')
+
+
+def create_content_variants(content: bytes | memoryview, codings: list[str] | None = None) -> dict[str, bytes]:
+    if not is_variant_candidate(content):
+        return {}
+
+    variants = {}
+
+    for coding in get_content_codings():
+        if codings is not None and coding not in codings:
+            continue
+
+        # Variants are made of content being served, a fast level keeps up with publishes and listings
+        extension = CONTENT_CODINGS[coding]
+        variant = compress_content(content, extension, FAST_COMPRESSION_LEVELS[extension])
+
+        if len(variant) < len(content):
+            variants[coding] = variant
+
+    return variants
+
+
+def is_variant_candidate(content: bytes | memoryview) -> bool:
+    return len(content) >= MIN_VARIANT_SIZE and not bytes(content[:6]).startswith(COMPRESSED_SIGNATURES)
+
+
+@lru_cache(maxsize=1)
+def get_content_codings() -> list[str]:
+    return [coding for coding in CONTENT_CODINGS if coding != 'zstd' or find_spec('zstandard')]
+
 
 class RepositoryCache:
 
@@ -20,41 +88,394 @@ class RepositoryCache:
     def load(self, distribution: str, path: Path) -> bytes | None:
         raise NotImplementedError()
 
+    def resolve(self, distribution: str, path: Path, generation: int | None = None) -> CachedFile | None:
+        raise NotImplementedError()
+
+    def get_generation(self, distribution: str) -> int | None:
+        raise NotImplementedError()
+
     def switch(self, distribution: str) -> None:
         raise NotImplementedError()
 
+    def discard(self, distribution: str) -> None:
+        raise NotImplementedError()
+
+    def revert(self, distribution: str) -> None:
+        raise NotImplementedError()
+
+    def export(self, distribution: str) -> dict[Path, bytes]:
+        raise NotImplementedError()
+
+    def replace(self, distribution: str, files: dict[Path, bytes]) -> None:
+        raise NotImplementedError()
+
+    def patch(self, distribution: str, files: dict[Path, bytes], removed: set[Path]) -> None:
+        raise NotImplementedError()
+
+    def get_statistics(self) -> CacheStatistics:
+        raise NotImplementedError()
+
+    def shutdown(self) -> None:
+        raise NotImplementedError()
+
 
 class DefaultRepositoryCache(RepositoryCache):
 
-    def __init__(self, distributions: set[str]) -> None:
+    def __init__(self, distributions: set[str], generation_retention: float = 300, generation_history: int = 3,
+                 memory: CacheMemory | None = None, compressed_only: bool = False,
+                 content_variants: bool = True) -> None:
         self._distributions = distributions
-        self._write_cache: dict[str, dict[Path, bytes]] = {}
-        self._read_cache: dict[str, dict[Path, bytes]] = {}
+        self._generation_retention = generation_retention
+        self._generation_history = max(1, generation_history)
+        self._memory = memory or DefaultCacheMemory()
+        self._compressed_only = compressed_only
+        self._content_variants = content_variants
+        self._write_cache: dict[str, dict[Path, CacheBlob]] = {}
+        self._generations: dict[str, list[CacheGeneration]] = {}
+        self._last_generation: dict[str, int] = {}
+        self._blobs: dict[str, CacheBlob] = {}
+        self._digests: dict[CacheBlob, str] = {}
+        self._variants: dict[tuple[str, tuple[str, ...]], dict[str, CacheBlob]] = {}
+        self._verified: dict[tuple[str, str], bool] = {}
+        self._inflated: OrderedDict[str, CacheBlob] = OrderedDict()
+        self._pending_variants: set[tuple[str, tuple[str, ...]]] = set()
+        self._variant_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ContentVariants')
+        self._lock = RLock()
 
     def initialize(self) -> None:
+        self._memory.initialize()
+
         for distribution in self._distributions:
             self._write_cache[distribution] = {}
-            self._read_cache[distribution] = {}
+            self._generations[distribution] = [CacheGeneration(0, {}, time.time())]
+            self._last_generation[distribution] = 0
 
     def store(self, distribution: str, path: Path, content: bytes) -> None:
         if distribution in self._write_cache:
             log.debug('Storing content to cache', distribution=distribution, path=str(path))
-            self._write_cache[distribution][path] = content
+            digest = hashlib.sha256(content).hexdigest()
+
+            # Builds of other distributions and the garbage collection access the write caches concurrently
+            with self._lock:
+                self._write_cache[distribution][path] = self._intern(content, digest)
         else:
             log.warning('Attempted to store to unsupported cache', distribution=distribution, path=str(path))
 
     def load(self, distribution: str, path: Path) -> bytes | None:
-        if distribution in self._read_cache:
+        if distribution in self._generations:
             log.debug('Loading content from cache', distribution=distribution, path=str(path))
-            return self._read_cache[distribution].get(path)
+            entry = self._generations[distribution][0].entries.get(path)
+            return self._inflate(entry).to_bytes() if entry else None
         else:
             log.warning('Attempted to load from unsupported cache', distribution=distribution, path=str(path))
             return None
 
+    def resolve(self, distribution: str, path: Path, generation: int | None = None) -> CachedFile | None:
+        if distribution not in self._generations:
+            log.warning('Attempted to resolve from unsupported cache', distribution=distribution, path=str(path))
+            return None
+
+        now = time.time()
+        generations = [entry for entry in self._generations[distribution] if entry.expires > now]
+
+        if generation is not None:
+            generations.sort(key=lambda entry: entry.id != generation)
+
+        for entry in generations:
+            if cached_file := entry.entries.get(path):
+                log.debug('Resolved content from cache', distribution=distribution, path=str(path),
+                          generation=entry.id)
+                self._touch(cached_file)
+                return replace(cached_file, blob=self._inflate(cached_file), compression=None)
+
+        return None
+
+    def get_generation(self, distribution: str) -> int | None:
+        if distribution in self._generations:
+            return self._generations[distribution][0].id
+        else:
+            log.warning('Attempted to get generation of unsupported cache', distribution=distribution)
+            return None
+
     def switch(self, distribution: str) -> None:
-        if distribution in self._read_cache:
+        if distribution in self._write_cache:
             log.info('Switching cache for distribution', distribution=distribution)
-            self._read_cache[distribution] = self._write_cache[distribution]
-            self._write_cache[distribution] = {}
+
+            with self._lock:
+                self._publish(distribution, self._write_cache[distribution])
+                self._write_cache[distribution] = {}
+
+            self._collect_garbage()
         else:
             log.warning('Attempted to switch unsupported cache', distribution=distribution)
+
+    def discard(self, distribution: str) -> None:
+        if distribution in self._write_cache:
+            log.debug('Discarding cache for distribution', distribution=distribution)
+
+            with self._lock:
+                self._write_cache[distribution] = {}
+
+            self._collect_garbage()
+        else:
+            log.warning('Attempted to discard unsupported cache', distribution=distribution)
+
+    def revert(self, distribution: str) -> None:
+        if distribution not in self._generations:
+            log.warning('Attempted to revert unsupported cache', distribution=distribution)
+            return
+
+        generations = self._generations[distribution]
+
+        if len(generations) < 2:
+            log.warning('No previous generation to revert to', distribution=distribution)
+            return
+
+        previous = replace(generations[1], expires=float('inf'))
+
+        log.info('Reverting cache for distribution', distribution=distribution, generation=previous.id)
+
+        with self._lock:
+            self._generations[distribution] = [previous, *generations[2:]]
+
+        self._collect_garbage()
+
+    def export(self, distribution: str) -> dict[Path, bytes]:
+        if distribution in self._generations:
+            entries = self._generations[distribution][0].entries
+            return {path: self._inflate(entry).to_bytes() for path, entry in entries.items()}
+        else:
+            log.warning('Attempted to export unsupported cache', distribution=distribution)
+            return {}
+
+    def replace(self, distribution: str, files: dict[Path, bytes]) -> None:
+        if distribution in self._write_cache:
+            log.info('Replacing cache for distribution', distribution=distribution, files=len(files))
+            digests = {path: hashlib.sha256(content).hexdigest() for path, content in files.items()}
+
+            # Interned content is only referenced once published, a concurrent collection must not see it before
+            with self._lock:
+                self._publish(distribution, {path: self._intern(content, digests[path])
+                                             for path, content in files.items()})
+                self._write_cache[distribution] = {}
+
+            self._collect_garbage()
+        else:
+            log.warning('Attempted to replace unsupported cache', distribution=distribution)
+
+    def patch(self, distribution: str, files: dict[Path, bytes], removed: set[Path]) -> None:
+        if distribution in self._write_cache:
+            log.info('Patching cache for distribution', distribution=distribution, files=len(files),
+                     removed=len(removed))
+            digests = {path: hashlib.sha256(content).hexdigest() for path, content in files.items()}
+
+            with self._lock:
+                current = self._generations[distribution][0]
+                carried = {path: entry for path, entry in current.entries.items()
+                           if path not in files and path not in removed}
+                self._publish(distribution, {path: self._intern(content, digests[path])
+                                             for path, content in files.items()}, carried)
+                self._write_cache[distribution] = {}
+
+            self._collect_garbage()
+        else:
+            log.warning('Attempted to patch unsupported cache', distribution=distribution)
+
+    def get_statistics(self) -> CacheStatistics:
+        return self._memory.get_statistics()
+
+    def shutdown(self) -> None:
+        self._variant_executor.shutdown(cancel_futures=True)
+
+    def _intern(self, content: bytes, digest: str | None = None) -> CacheBlob:
+        digest = digest or hashlib.sha256(content).hexdigest()
+
+        with self._lock:
+            if blob := self._blobs.get(digest):
+                return blob
+
+            blob = self._memory.allocate(content)
+            self._blobs[digest] = blob
+            self._digests[blob] = digest
+
+        return blob
+
+    def _publish(self, distribution: str, files: dict[Path, CacheBlob],
+                 carried: dict[Path, CachedFile] | None = None) -> None:
+        # Content variants created in the background are added to the installed generations under the lock
+        with self._lock:
+            self._publish_generation(distribution, files, carried)
+
+    def _publish_generation(self, distribution: str, files: dict[Path, CacheBlob],
+                            carried: dict[Path, CachedFile] | None) -> None:
+        now = time.time()
+        current, *previous = self._generations[distribution]
+
+        self._last_generation[distribution] += 1
+        generation_id = self._last_generation[distribution]
+        entries = {path: replace(entry, generation=generation_id) for path, entry in (carried or {}).items()}
+        entries.update((path, self._create_cached_file(generation_id, path, files, now, current.entries.get(path)))
+                       for path in files)
+        generation = CacheGeneration(generation_id, entries, now)
+
+        retained = [entry for entry in previous if entry.expires > now]
+        superseded = replace(current, expires=now + self._generation_retention)
+
+        self._generations[distribution] = [generation, superseded, *retained][:self._generation_history + 1]
+
+        log.debug('Published cache generation', distribution=distribution, generation=generation.id,
+                  retained=len(self._generations[distribution]) - 1)
+
+    def _create_cached_file(self, generation: int, path: Path, files: dict[Path, CacheBlob], modified: float,
+                            previous: CachedFile | None) -> CachedFile:
+        blob = files[path]
+        etag = self._digests[blob]
+
+        if previous and previous.etag == etag:
+            modified = previous.modified
+
+        siblings = self._get_compressed_siblings(path, etag, files)
+        variants = self._get_variants(etag, blob, siblings)
+
+        if self._compressed_only and siblings:
+            compression, source = next(iter(siblings.items()))
+            return CachedFile(generation, source, etag, modified, variants, compression)
+
+        return CachedFile(generation, blob, etag, modified, variants)
+
+    def _get_compressed_siblings(self, path: Path, digest: str, files: dict[Path, CacheBlob]) -> dict[str, CacheBlob]:
+        if path.suffix[1:] in COMPRESSION_LEVELS:
+            return {}
+
+        siblings = {}
+
+        for compression in DECOMPRESSION_PREFERENCE:
+            sibling = files.get(path.with_name(f'{path.name}.{compression}'))
+
+            if sibling and self._is_compressed_form(digest, sibling, compression):
+                siblings[compression] = sibling
+
+        return siblings
+
+    def _is_compressed_form(self, digest: str, blob: CacheBlob, compression: str) -> bool:
+        key = (digest, self._digests[blob])
+
+        if key not in self._verified:
+            try:
+                content = decompress_content(blob.content, compression)
+                self._verified[key] = hashlib.sha256(content).hexdigest() == digest
+            except Exception as error:
+                log.warning('Failed to decompress cached content', compression=compression, error=error)
+                self._verified[key] = False
+
+        return self._verified[key]
+
+    def _get_variants(self, digest: str, blob: CacheBlob, siblings: dict[str, CacheBlob]) -> dict[str, CacheBlob]:
+        reused = {coding: siblings[extension] for coding, extension in CONTENT_CODINGS.items()
+                  if extension in siblings and siblings[extension].size < blob.size}
+        codings = tuple(coding for coding, extension in CONTENT_CODINGS.items()
+                        if extension not in siblings and coding in get_content_codings())
+        created = {}
+
+        if self._content_variants and codings and is_variant_candidate(blob.content):
+            key = (digest, codings)
+
+            if (variants := self._variants.get(key)) is not None:
+                created = variants
+            elif key not in self._pending_variants:
+                # Compressing on the publishing thread would delay the switch, entries get the variants when ready
+                self._pending_variants.add(key)
+                self._variant_executor.submit(self._create_variants, key, blob)
+
+        return _merge_variants(reused, created)
+
+    def _create_variants(self, key: tuple[str, tuple[str, ...]], blob: CacheBlob) -> None:
+        digest, codings = key
+
+        try:
+            variants = create_content_variants(blob.content, list(codings))
+        except Exception as error:
+            log.warning('Failed to create content variants', digest=digest, error=error)
+            variants = {}
+
+        with self._lock:
+            self._pending_variants.discard(key)
+
+            if digest not in self._blobs:
+                return
+
+            created = {coding: self._memory.allocate(variant) for coding, variant in variants.items()}
+            self._variants[key] = created
+            updated = self._add_variants(digest, created)
+
+        log.debug('Created content variants', digest=digest, codings=list(created), entries=updated)
+
+    def _add_variants(self, digest: str, created: dict[str, CacheBlob]) -> int:
+        updated = 0
+
+        for generations in self._generations.values():
+            for generation in generations:
+                for path, entry in generation.entries.items():
+                    if entry.etag == digest and any(coding not in entry.variants for coding in created):
+                        generation.entries[path] = replace(entry, variants=_merge_variants(entry.variants, created))
+                        updated += 1
+
+        return updated
+
+    def _inflate(self, cached_file: CachedFile) -> CacheBlob:
+        if not cached_file.compression:
+            return cached_file.blob
+
+        with self._lock:
+            if blob := self._inflated.get(cached_file.etag):
+                self._inflated.move_to_end(cached_file.etag)
+                return blob
+
+        blob = CacheBlob(decompress_content(cached_file.blob.content, cached_file.compression))
+
+        with self._lock:
+            self._inflated[cached_file.etag] = blob
+
+            while len(self._inflated) > INFLATED_CACHE_SIZE:
+                self._inflated.popitem(last=False)
+
+        return blob
+
+    def _touch(self, cached_file: CachedFile) -> None:
+        self._memory.touch(cached_file.blob)
+
+        for variant in cached_file.variants.values():
+            self._memory.touch(variant)
+
+    def _collect_garbage(self) -> None:
+        # Content interned by a concurrent store between taking the references and pruning would be lost
+        with self._lock:
+            blobs = {blob for files in self._write_cache.values() for blob in files.values()}
+            digests = {self._digests[blob] for blob in blobs}
+
+            for generations in self._generations.values():
+                for generation in generations:
+                    for entry in generation.entries.values():
+                        blobs.add(entry.blob)
+                        blobs.update(entry.variants.values())
+                        digests.add(entry.etag)
+
+            self._blobs = {digest: blob for digest, blob in self._blobs.items() if blob in blobs}
+            self._digests = {blob: digest for digest, blob in self._blobs.items()}
+            self._variants = {key: variants for key, variants in self._variants.items()
+                              if key[0] in digests and all(variant in blobs for variant in variants.values())}
+            self._verified = {key: verified for key, verified in self._verified.items() if key[0] in digests}
+
+            for etag in [etag for etag in self._inflated if etag not in digests]:
+                del self._inflated[etag]
+
+            self._memory.retain(blobs)
+
+        statistics = self._memory.get_statistics()
+
+        log.info('Cache memory usage', resident_bytes=statistics.resident_bytes,
+                 spilled_bytes=statistics.spilled_bytes, unique_blobs=len(self._blobs))
+
+
+def _merge_variants(variants: dict[str, CacheBlob], created: dict[str, CacheBlob]) -> dict[str, CacheBlob]:
+    return {coding: variant for coding in CONTENT_CODINGS if (variant := variants.get(coding) or created.get(coding))}
@@ -2,24 +2,34 @@
 # SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
 # SPDX-License-Identifier: MIT
 
-import gzip
-import hashlib
 import os
+import re
 import shutil
-import subprocess
-from dataclasses import dataclass
+import stat
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
 from datetime import datetime, timezone
-from io import BytesIO
 from pathlib import Path
-from typing import Tuple
+from threading import Lock
+from typing import Any
 
 from common_utility import create_directory, render_template_file
 from context_logger import get_logger
 
-from package_repository import RepositoryCache
+from package_repository import RepositoryCache, PackageScanner, DpkgPackageScanner, ContentsGenerator, IndexPatch, \
+    DigestService, DefaultDigestService, FileDigest, FileFingerprint, find_packages, \
+    IndexFile, COMPRESSION_LEVELS, FAST_COMPRESSION_LEVELS, MAXIMUM_COMPRESSION_LEVELS, create_diff_index, \
+    write_index_file, iterate_chunks, compress_content, RetentionPolicy, RetentionResult, RETENTION_ACTIONS, \
+    evaluate_retention_policy
 
 log = get_logger('RepositoryCreator')
 
+CONTENT_STORE_DIR = '.content-store'
+POOL_DIR = Path('pool')
+SHARD_DIR = Path('.pools')
+FILENAME_PATTERN = re.compile(rb'^Filename: (.+)$', re.MULTILINE)
+
 
 @dataclass
 class RepositoryConfig:
@@ -28,6 +38,23 @@ class RepositoryConfig:
     architectures: set[str]
     repository_dir: Path
     deb_package_dir: Path
+    build_workers: int = 1
+    compressions: dict[str, int | None] = field(default_factory=lambda: {'gz': None})
+    by_hash_generations: int = 3
+    pdiff_history: int = 0
+    two_phase_compression: bool = False
+    retention: RetentionPolicy = field(default_factory=RetentionPolicy)
+    content_addressed_pool: bool = False
+    pool_roots: list[Path] = field(default_factory=list)
+
+
+@dataclass
+class CreatorSnapshot:
+    indices: dict[Path, list[IndexFile]]
+    contents_indices: dict[Path, tuple[bytes, IndexFile]]
+    patches: dict[Path, list[IndexPatch]]
+    by_hash: list[list[IndexFile]]
+    recompressions: set[Path]
 
 
 @dataclass
@@ -45,32 +72,223 @@ class RepositoryCreator:
     def initialize(self) -> None:
         raise NotImplementedError()
 
-    def create(self, distribution: str) -> None:
+    def create(self, distribution: str, changed_paths: set[Path] | None = None) -> bool:
+        raise NotImplementedError()
+
+    def recompress(self, distribution: str) -> bool:
+        raise NotImplementedError()
+
+    def commit(self, distribution: str) -> None:
+        raise NotImplementedError()
+
+    def revert(self, distribution: str) -> None:
+        raise NotImplementedError()
+
+    def shutdown(self) -> None:
         raise NotImplementedError()
 
 
 class DefaultRepositoryCreator(RepositoryCreator):
 
-    def __init__(self, cache: RepositoryCache, config: RepositoryConfig, info: ReleaseInfo) -> None:
+    def __init__(self, cache: RepositoryCache, config: RepositoryConfig, info: ReleaseInfo,
+                 scanner: PackageScanner | None = None, contents: ContentsGenerator | None = None,
+                 digests: DigestService | None = None) -> None:
         self._cache = cache
         self._config = config
         self._info = info
+        self._scanner = scanner or DpkgPackageScanner(config.repository_dir)
+        self._contents = contents
+        self._digests = digests or DefaultDigestService()
         self._architectures = sorted({'all'} | config.architectures)
+        self._indices: dict[Path, list[IndexFile]] = {}
+        self._contents_indices: dict[Path, tuple[bytes, IndexFile]] = {}
+        self._by_hash: dict[str, list[list[IndexFile]]] = {}
+        self._patches: dict[Path, list[IndexPatch]] = {}
+        self._retention: dict[tuple[str, str, str], tuple[bytes, RetentionResult]] = {}
+        self._recompressions: dict[str, set[Path]] = {}
+        self._queued_recompressions: dict[str, set[Path]] = {}
+        self._staged: dict[str, dict[Path, tuple[Path, IndexFile]]] = {}
+        self._linked: dict[Path, str] = {}
+        self._snapshots: dict[str, CreatorSnapshot] = {}
+        self._locks: dict[str, Lock] = {distribution: Lock() for distribution in config.distributions}
+
+        if unsupported := set(config.compressions) - set(COMPRESSION_LEVELS):
+            raise ValueError(f'Unsupported compressions: {", ".join(sorted(unsupported))}')
+
+        if config.retention.action not in RETENTION_ACTIONS:
+            raise ValueError(f'Unsupported retention action: {config.retention.action}')
+
+        if config.retention.action == 'archive' and not config.retention.archive_dir:
+            raise ValueError('Retention archive directory is not configured')
 
     def initialize(self) -> None:
         self._create_repository_dir()
         self._link_package_dir()
+        self._scanner.initialize()
+
+        if self._contents:
+            self._contents.initialize()
+
+    def create(self, distribution: str, changed_paths: set[Path] | None = None) -> bool:
+        with self._locks.setdefault(distribution, Lock()):
+            # Kept until the publish is committed or reverted, a recompression may have taken it already
+            self._snapshots.setdefault(distribution, self._take_snapshot(distribution))
+
+            if self._config.content_addressed_pool:
+                self._deduplicate_packages(distribution, changed_paths)
+
+            with ThreadPoolExecutor(max_workers=self._config.build_workers) as executor:
+                index_files = self._generate_packages_files(executor, distribution, changed_paths)
+
+                if self._contents:
+                    index_files.extend(self._generate_contents_files(executor, self._contents, distribution))
+
+            if self._config.content_addressed_pool:
+                self._remove_unreferenced_blobs(distribution)
+
+            # Digests not needed by this or a concurrent build belong to replaced or deleted packages
+            self._digests.prune()
+
+            self._publish_by_hash(distribution, index_files)
+
+            if self._is_published(distribution, index_files):
+                log.info('Index files unchanged, skipping Release file', distribution=distribution)
+                self._snapshots.pop(distribution, None)
+                return False
+
+            self._generate_release_file(distribution, index_files)
+
+            return True
+
+    def recompress(self, distribution: str) -> bool:
+        lock = self._locks.setdefault(distribution, Lock())
+
+        with lock:
+            packages_paths = self._recompressions.pop(distribution, set())
+            pending = {path: self._indices[path] for path in packages_paths if path in self._indices}
+
+        if not pending:
+            return False
+
+        log.info('Recompressing Packages files', distribution=distribution, files=len(pending))
+
+        with ThreadPoolExecutor(max_workers=self._config.build_workers) as executor:
+            compressions = {packages_path: [executor.submit(compress_content, files[0].content, extension,
+                                                            self._get_maximum_level(extension, level))
+                                            for extension, level in self._config.compressions.items()]
+                            for packages_path, files in pending.items()}
+
+            recompressed = {packages_path: [compression.result() for compression in files]
+                            for packages_path, files in compressions.items()}
+
+        with lock:
+            snapshot = self._take_snapshot(distribution)
+            snapshot.recompressions.update(packages_paths)
+            updated = 0
+
+            for packages_path, contents in recompressed.items():
+                files = self._indices.get(packages_path)
+
+                if files is None or files != pending[packages_path]:
+                    log.debug('Packages file changed during recompression', file=str(packages_path),
+                              distribution=distribution)
+                    continue
+
+                self._indices[packages_path] = files[:1] + [
+                    self._stage_file(distribution, index_file.path, content)
+                    for index_file, content in zip(files[1:], contents)
+                ]
+                updated += 1
+
+            if updated:
+                self._snapshots.setdefault(distribution, snapshot)
+
+        log.info('Recompressed Packages files', distribution=distribution, files=updated)
+
+        return updated > 0
+
+    def commit(self, distribution: str) -> None:
+        with self._locks.setdefault(distribution, Lock()):
+            if queued := self._queued_recompressions.pop(distribution, None):
+                self._recompressions.setdefault(distribution, set()).update(queued)
+
+            staged = self._staged.pop(distribution, {})
+
+            for file_path, (staged_path, index_file) in staged.items():
+                published = self._indices.get(file_path.with_suffix(''), [])
+
+                # A later build may have regenerated the file, the staged content is then stale
+                if any(published_file is index_file for published_file in published):
+                    os.replace(staged_path, file_path)
+                else:
+                    staged_path.unlink(missing_ok=True)
+
+            if staged:
+                log.info('Committed recompressed index files', distribution=distribution, files=len(staged))
+
+            self._snapshots.pop(distribution, None)
 
-    def create(self, distribution: str) -> None:
-        current_dir = os.getcwd()
+    def revert(self, distribution: str) -> None:
+        with self._locks.setdefault(distribution, Lock()):
+            self._queued_recompressions.pop(distribution, None)
 
-        os.chdir(self._config.repository_dir)
+            for staged_path, _ in self._staged.pop(distribution, {}).values():
+                staged_path.unlink(missing_ok=True)
 
-        packages_files = self._generate_packages_files(distribution)
+            if snapshot := self._snapshots.pop(distribution, None):
+                self._restore_snapshot(distribution, snapshot)
 
-        self._generate_release_file(distribution, packages_files)
+            self._restore_published_files(distribution)
 
-        os.chdir(current_dir)
+    def shutdown(self) -> None:
+        self._digests.shutdown()
+
+    def _take_snapshot(self, distribution: str) -> CreatorSnapshot:
+        dist_path = self._config.repository_dir / 'dists' / distribution
+
+        return CreatorSnapshot(
+            {path: files for path, files in self._indices.items() if path.is_relative_to(dist_path)},
+            {path: entry for path, entry in self._contents_indices.items() if path.is_relative_to(dist_path)},
+            {path: patches for path, patches in self._patches.items() if path.is_relative_to(dist_path)},
+            list(self._by_hash.get(distribution, [])),
+            set(self._recompressions.get(distribution, set()))
+        )
+
+    def _restore_snapshot(self, distribution: str, snapshot: CreatorSnapshot) -> None:
+        dist_path = self._config.repository_dir / 'dists' / distribution
+
+        _restore_entries(self._indices, snapshot.indices, dist_path)
+        _restore_entries(self._contents_indices, snapshot.contents_indices, dist_path)
+        _restore_entries(self._patches, snapshot.patches, dist_path)
+        self._by_hash[distribution] = snapshot.by_hash
+        self._recompressions[distribution] = snapshot.recompressions
+
+        log.info('Reverted index state', distribution=distribution)
+
+    def _restore_published_files(self, distribution: str) -> None:
+        dist_path = self._config.repository_dir / 'dists' / distribution
+        published = self._cache.export(distribution)
+        restored = 0
+
+        for file_path, content in published.items():
+            if not file_path.is_file() or file_path.read_bytes() != content:
+                create_directory(file_path.parent)
+
+                with open(file_path, 'wb') as file:
+                    file.write(content)
+
+                restored += 1
+
+        removed = 0
+
+        if dist_path.is_dir():
+            for file_path in list(dist_path.rglob('*')):
+                if file_path.is_file() and not file_path.name.startswith('.') and file_path not in published:
+                    file_path.unlink()
+                    removed += 1
+
+        log.info('Restored published repository files', distribution=distribution, restored=restored,
+                 removed=removed)
 
     def _create_repository_dir(self) -> None:
         if not self._config.repository_dir.is_dir():
@@ -93,6 +311,114 @@ class DefaultRepositoryCreator(RepositoryCreator):
         log.info('Linking package pool directory', source=str(source_dir), target=str(target_link))
         os.symlink(source_dir, target_link, target_is_directory=True)
 
+        shard_dir = self._config.repository_dir / SHARD_DIR
+
+        if shard_dir.exists() or shard_dir.is_symlink():
+            self._clean_target(shard_dir)
+
+        for pool_dir, pool_root in zip(self._get_pool_dirs()[1:], self._config.pool_roots):
+            if not pool_root.is_dir():
+                log.info('Creating package pool root', directory=str(pool_root))
+                os.makedirs(pool_root)
+
+            log.info('Linking package pool root', source=str(pool_root), target=str(pool_dir))
+            create_directory(shard_dir)
+            os.symlink(pool_root, self._config.repository_dir / pool_dir, target_is_directory=True)
+
+        if self._config.content_addressed_pool:
+            log.info('Using content-addressed package store', directory=str(source_dir / CONTENT_STORE_DIR))
+            create_directory(source_dir / CONTENT_STORE_DIR)
+
+    def _deduplicate_packages(self, distribution: str, changed_paths: set[Path] | None) -> None:
+        package_paths: list[Path] = []
+
+        # Changed paths are relative to the pool, any of the pool roots may hold them
+        for pool_root in [self._config.deb_package_dir] + self._config.pool_roots:
+            for changed_path in {Path(distribution)} if changed_paths is None else changed_paths:
+                if (pool_root / changed_path).is_dir():
+                    package_paths.extend(pool_root / path for path in find_packages(pool_root, changed_path))
+                elif changed_path.suffix == '.deb':
+                    package_paths.append(pool_root / changed_path)
+
+        fingerprints = {}
+
+        for package_path in package_paths:
+            try:
+                fingerprints[package_path] = FileFingerprint.create(package_path)
+            except FileNotFoundError:
+                continue
+
+        digests = self._digests.digest(fingerprints)
+        linked = sum(self._link_package(path, digest) for path, digest in digests.items())
+
+        log.info('Deduplicated packages in content-addressed store', distribution=distribution,
+                 packages=len(digests), linked=linked)
+
+    def _link_package(self, package_path: Path, digest: FileDigest) -> bool:
+        blob_path = self._get_blob_path(digest.sha256)
+
+        try:
+            self._remove_modified_blob(package_path, digest.sha256)
+            self._linked[package_path] = digest.sha256
+
+            if blob_path.exists() and not self._is_blob_intact(blob_path, digest.sha256):
+                log.warning('Removing package blob not matching its digest', blob=digest.sha256)
+                blob_path.unlink()
+
+            if not blob_path.exists():
+                create_directory(blob_path.parent)
+
+                try:
+                    os.link(package_path, blob_path)
+                    _make_read_only(blob_path)
+                    return False
+                except FileExistsError:
+                    pass
+
+            if os.path.samefile(package_path, blob_path):
+                return False
+
+            temp_path = package_path.parent / f'.{package_path.name}.tmp'
+            temp_path.unlink(missing_ok=True)
+            os.link(blob_path, temp_path)
+            os.replace(temp_path, package_path)
+            log.debug('Linked package to content-addressed store', file=str(package_path), blob=digest.sha256)
+
+            return True
+        except OSError as error:
+            log.warning('Failed to link package to content-addressed store', file=str(package_path), error=error)
+            return False
+
+    def _get_blob_path(self, sha256: str) -> Path:
+        return self._config.deb_package_dir / CONTENT_STORE_DIR / sha256[:2] / sha256
+
+    def _remove_modified_blob(self, package_path: Path, sha256: str) -> None:
+        previous = self._linked.get(package_path)
+
+        if not previous or previous == sha256:
+            return
+
+        blob_path = self._get_blob_path(previous)
+
+        # The package was overwritten in place, its blob shares the inode and no longer matches its digest
+        if blob_path.exists() and os.path.samefile(package_path, blob_path):
+            log.warning('Package linked to content-addressed store was modified in place', file=str(package_path),
+                        blob=previous)
+            blob_path.unlink()
+
+    def _is_blob_intact(self, blob_path: Path, sha256: str) -> bool:
+        digest = self._digests.digest({blob_path: FileFingerprint.create(blob_path)}).get(blob_path)
+        return digest is not None and digest.sha256 == sha256
+
+    def _remove_unreferenced_blobs(self, distribution: str) -> None:
+        for blob_path in (self._config.deb_package_dir / CONTENT_STORE_DIR).glob('*/*'):
+            try:
+                if blob_path.stat().st_nlink == 1:
+                    log.debug('Removing unreferenced package blob', blob=blob_path.name, distribution=distribution)
+                    blob_path.unlink()
+            except FileNotFoundError:
+                continue
+
     def _clean_target(self, target_link: Path) -> None:
         if target_link.is_symlink():
             target_link.unlink()
@@ -101,59 +427,361 @@ class DefaultRepositoryCreator(RepositoryCreator):
         else:
             os.remove(target_link)
 
-    def _generate_packages_files(self, distribution: str) -> list[Path]:
-        packages_files = []
+    def _generate_packages_files(self, executor: Executor, distribution: str,
+                                 changed_paths: set[Path] | None) -> list[IndexFile]:
+        components = list(self._config.components)
+        pool_dirs = self._get_pool_dirs()
 
-        for component in self._config.components:
-            target_dir = self._config.repository_dir / 'dists' / distribution / component
+        scans = [[executor.submit(self._scan_component, distribution, pool_dir, component, changed_paths)
+                  for pool_dir in pool_dirs] for component in components]
 
-            create_directory(target_dir)
+        indices = []
 
-            package_dir = Path('pool') / distribution / component
+        for component, component_scans in zip(components, scans):
+            packages = self._merge_packages([scan.result() for scan in component_scans])
 
-            create_directory(package_dir)
+            if self._config.retention.enabled:
+                packages = self._apply_retention_policy(distribution, component, packages)
+
+            if len(pool_dirs) > 1:
+                packages = {architecture: self._rewrite_filenames(content, pool_dirs[1:])
+                            for architecture, content in packages.items()}
 
             for architecture in self._architectures:
-                arch_dir = target_dir / f'binary-{architecture}'
+                packages_path = (self._config.repository_dir / 'dists' / distribution / component /
+                                 f'binary-{architecture}' / 'Packages')
+                files = self._generate_packages_file(executor, distribution, packages_path, packages[architecture])
+                indices.append((packages_path, files))
+
+        index_files = []
+        diffs = []
+
+        for packages_path, files in indices:
+            previous = self._indices.get(packages_path)
+            self._indices[packages_path] = [file.result() for file in files]
+            index_files.extend(self._indices[packages_path])
+
+            if self._config.pdiff_history > 0:
+                diffs.append(executor.submit(self._generate_packages_diff, distribution, packages_path,
+                                             previous[0] if previous else None, self._indices[packages_path][0]))
+
+        for diff in diffs:
+            index_files.extend(diff.result())
+
+        return index_files
+
+    def _get_pool_dirs(self) -> list[Path]:
+        return [POOL_DIR] + [SHARD_DIR / str(index) for index in range(1, len(self._config.pool_roots) + 1)]
+
+    def _scan_component(self, distribution: str, pool_dir: Path, component: str,
+                        changed_paths: set[Path] | None) -> dict[str, bytes]:
+        package_dir = pool_dir / distribution / component
+
+        create_directory(self._config.repository_dir / package_dir)
+
+        component_changes = self._get_component_changes(pool_dir, package_dir, changed_paths)
+
+        return self._scanner.scan(package_dir, self._architectures, component_changes)
+
+    def _merge_packages(self, results: list[dict[str, bytes]]) -> dict[str, bytes]:
+        if len(results) == 1:
+            return results[0]
+
+        return {architecture: self._merge_entries([packages[architecture] for packages in results])
+                for architecture in self._architectures}
+
+    def _merge_entries(self, contents: list[bytes]) -> bytes:
+        entries = []
+        pool_paths = set()
+
+        # The package pool serves a path from the first root holding it, later roots' entries are shadowed
+        for content in contents:
+            for entry in content.split(b'\n\n'):
+                if not entry.strip():
+                    continue
+
+                match = FILENAME_PATTERN.search(entry)
+                pool_path = self._get_pool_relative_path(match.group(1).decode()) if match else None
+
+                if pool_path in pool_paths:
+                    continue
+
+                if pool_path:
+                    pool_paths.add(pool_path)
+
+                entries.append(entry + b'\n\n')
+
+        return b''.join(entries)
+
+    def _rewrite_filenames(self, content: bytes, pool_dirs: list[Path]) -> bytes:
+        content = b'\n' + content
+
+        for pool_dir in pool_dirs:
+            content = content.replace(f'\nFilename: {pool_dir.as_posix()}/'.encode(),
+                                      f'\nFilename: {POOL_DIR.as_posix()}/'.encode())
+
+        return content[1:]
+
+    def _apply_retention_policy(self, distribution: str, component: str,
+                                packages: dict[str, bytes]) -> dict[str, bytes]:
+        retained = {}
+        excluded = set()
+        now = time.time()
+
+        for architecture, content in packages.items():
+            key = (distribution, component, architecture)
+            previous = self._retention.get(key)
+
+            # Unchanged Packages content keeps its result until a retained version ages out
+            if previous and previous[0] == content and now < previous[1].expires:
+                result = previous[1]
+            else:
+                result = evaluate_retention_policy(content, self._config.retention, self._config.repository_dir, now)
+                self._retention[key] = (content, result)
+
+            retained[architecture] = result.content
+            excluded.update(result.excluded)
+
+        if excluded:
+            log.info('Excluded packages by retention policy', distribution=distribution, component=component,
+                     packages=len(excluded), action=self._config.retention.action)
+
+            for filename in sorted(excluded):
+                self._collect_package(distribution, filename)
+
+        return retained
+
+    def _collect_package(self, distribution: str, filename: str) -> None:
+        retention = self._config.retention
+        package_path = self._config.repository_dir / filename
+
+        try:
+            if retention.action == 'delete':
+                log.info('Deleting package excluded by retention policy', file=filename, distribution=distribution)
+                package_path.unlink()
+            elif retention.action == 'archive' and retention.archive_dir:
+                archive_path = retention.archive_dir / self._get_pool_relative_path(filename)
+                log.info('Archiving package excluded by retention policy', file=filename,
+                         archive=str(archive_path), distribution=distribution)
+                create_directory(archive_path.parent)
+
+                if package_path.stat().st_nlink > 1:
+                    # A copy does not keep the content-addressed blob and the other links alive
+                    shutil.copy2(package_path, archive_path)
+                    package_path.unlink()
+                else:
+                    shutil.move(package_path, archive_path)
+        except (OSError, ValueError) as error:
+            log.warning('Failed to collect package excluded by retention policy', file=filename,
+                        distribution=distribution, error=error)
+
+    def _get_pool_relative_path(self, filename: str) -> Path:
+        for pool_dir in self._get_pool_dirs():
+            if Path(filename).is_relative_to(pool_dir):
+                return Path(filename).relative_to(pool_dir)
+
+        raise ValueError(f'Package is not in the pool: {filename}')
+
+    def _generate_packages_file(self, executor: Executor, distribution: str, packages_path: Path,
+                                content: bytes) -> list[Future[IndexFile]]:
+        create_directory(packages_path.parent)
+
+        if previous := self._get_reusable_index(packages_path, content):
+            log.debug('Packages file unchanged', file=str(packages_path), distribution=distribution)
+            return [executor.submit(self._reuse_file, distribution, index_file) for index_file in previous]
+
+        log.info('Generating Packages file', file=str(packages_path), distribution=distribution,
+                 compressions=list(self._config.compressions), two_phase=self._config.two_phase_compression)
+
+        files = [executor.submit(self._create_file, distribution, packages_path, content)]
+
+        for extension, level in self._config.compressions.items():
+            if self._config.two_phase_compression:
+                level = FAST_COMPRESSION_LEVELS[extension]
+
+            files.append(executor.submit(self._create_file, distribution, Path(f'{packages_path}.{extension}'),
+                                         content, extension, level))
 
-                create_directory(arch_dir)
+        if self._config.two_phase_compression and self._config.compressions:
+            self._queued_recompressions.setdefault(distribution, set()).add(packages_path)
 
-                command = ['dpkg-scanpackages', '--multiversion', '--arch', architecture, str(package_dir)]
-                result = subprocess.run(command, capture_output=True, check=True)
+        return files
 
-                packages_content = result.stdout
+    def _generate_packages_diff(self, distribution: str, packages_path: Path, previous: IndexFile | None,
+                                current: IndexFile) -> list[IndexFile]:
+        patches = self._patches.get(packages_path, [])
 
-                packages_path = arch_dir / 'Packages'
+        if previous and previous.sha256 != current.sha256:
+            name = self._get_patch_name(patches)
+            patches = (patches + [IndexPatch.create(name, previous.content, current.content)])
+            patches = patches[-self._config.pdiff_history:]
+            log.info('Generated Packages diff', file=str(packages_path), distribution=distribution, patch=name)
 
-                self._create_file(distribution, packages_path, packages_content)
+        self._patches[packages_path] = patches
 
-                log.info('Generated Packages file', file=str(packages_path),
-                         distribution=distribution, component=component, architecture=architecture)
+        diff_dir = Path(f'{packages_path}.diff')
+        retained = {diff_dir / f'{patch.name}.gz': patch for patch in patches}
 
-                packages_files.append(packages_path)
+        if diff_dir.is_dir():
+            for diff_path in diff_dir.iterdir():
+                if diff_path.is_file() and diff_path not in retained and not (patches and diff_path.name == 'Index'):
+                    log.debug('Removing expired Packages diff', file=str(diff_path), distribution=distribution)
+                    diff_path.unlink()
 
-                compressed_path = Path(f'{packages_path}.gz')
+        if not patches:
+            return []
 
-                self._create_file(distribution, compressed_path, packages_content, compressed=True)
+        create_directory(diff_dir)
 
-                packages_files.append(compressed_path)
+        for diff_path, patch in retained.items():
+            self._cache.store(distribution, diff_path, patch.download)
 
-        return packages_files
+            if not diff_path.is_file():
+                with open(diff_path, 'wb') as file:
+                    file.write(patch.download)
 
-    def _generate_release_file(self, distribution: str, packages_files: list[Path]) -> None:
+        return [self._create_file(distribution, diff_dir / 'Index', create_diff_index(current.content, patches))]
+
+    def _get_patch_name(self, patches: list[IndexPatch]) -> str:
+        name = datetime.now(timezone.utc).strftime('%Y-%m-%d-%H%M.%S')
+        names = {patch.name for patch in patches}
+        suffix = 0
+
+        while (f'{name}.{suffix}' if suffix else name) in names:
+            suffix += 1
+
+        return f'{name}.{suffix}' if suffix else name
+
+    def _generate_contents_files(self, executor: Executor, contents: ContentsGenerator,
+                                 distribution: str) -> list[IndexFile]:
+        components = list(self._config.components)
+
+        generations = [executor.submit(contents.generate,
+                                       [pool_dir / distribution / component for pool_dir in self._get_pool_dirs()],
+                                       self._architectures)
+                       for component in components]
+
+        files = []
+
+        for component, generation in zip(components, generations):
+            for architecture, content in generation.result().items():
+                contents_path = self._config.repository_dir / 'dists' / distribution / component / \
+                                f'Contents-{architecture}.gz'
+                previous = self._contents_indices.get(contents_path)
+
+                if previous and previous[0] == content and contents_path.is_file():
+                    log.debug('Contents file unchanged', file=str(contents_path), distribution=distribution)
+                    files.append((content, executor.submit(self._reuse_file, distribution, previous[1])))
+                else:
+                    log.info('Generating Contents file', file=str(contents_path), distribution=distribution)
+                    files.append((content, executor.submit(self._create_file, distribution, contents_path, content,
+                                                           'gz', self._config.compressions.get('gz'))))
+
+        index_files = []
+
+        for content, file in files:
+            index_file = file.result()
+            self._contents_indices[index_file.path] = (content, index_file)
+            index_files.append(index_file)
+
+        return index_files
+
+    def _get_component_changes(self, pool_dir: Path, package_dir: Path,
+                               changed_paths: set[Path] | None) -> set[Path] | None:
+        if changed_paths is None:
+            return None
+
+        component_changes = set()
+
+        for changed_path in changed_paths:
+            pool_path = pool_dir / changed_path
+
+            if pool_path.is_relative_to(package_dir):
+                component_changes.add(pool_path)
+            elif package_dir.is_relative_to(pool_path):
+                component_changes.add(package_dir)
+
+        return component_changes
+
+    def _get_reusable_index(self, packages_path: Path, content: bytes) -> list[IndexFile] | None:
+        previous = self._indices.get(packages_path)
+
+        if not previous or previous[0].content != content:
+            return None
+
+        if [index_file.path for index_file in previous[1:]] != self._get_compressed_paths(packages_path):
+            return None
+
+        if not all(index_file.path.is_file() for index_file in previous):
+            return None
+
+        return previous
+
+    def _get_compressed_paths(self, packages_path: Path) -> list[Path]:
+        return [Path(f'{packages_path}.{extension}') for extension in self._config.compressions]
+
+    def _get_maximum_level(self, extension: str, level: int | None) -> int:
+        return level if level is not None else MAXIMUM_COMPRESSION_LEVELS[extension]
+
+    def _stage_file(self, distribution: str, file_path: Path, content: bytes) -> IndexFile:
+        staged_path = file_path.parent / f'.{file_path.name}.staged'
+        index_file = replace(write_index_file(staged_path, iterate_chunks(content)), path=file_path)
+        self._staged.setdefault(distribution, {})[file_path] = (staged_path, index_file)
+        return index_file
+
+    def _reuse_file(self, distribution: str, index_file: IndexFile) -> IndexFile:
+        self._cache.store(distribution, index_file.path, index_file.content)
+        return index_file
+
+    def _publish_by_hash(self, distribution: str, index_files: list[IndexFile]) -> None:
+        if self._config.by_hash_generations < 1:
+            return
+
+        generations = self._by_hash.setdefault(distribution, [])
+
+        if not generations or generations[-1] != index_files:
+            generations.append(index_files)
+            del generations[:-self._config.by_hash_generations]
+
+        retained = {get_by_hash_path(index_file): index_file for generation in generations for index_file in generation}
+
+        for by_hash_path, index_file in retained.items():
+            self._cache.store(distribution, by_hash_path, index_file.content)
+
+            if not by_hash_path.is_file():
+                create_directory(by_hash_path.parent)
+                with open(by_hash_path, 'wb') as file:
+                    file.write(index_file.content)
+
+        for by_hash_dir in {by_hash_path.parent for by_hash_path in retained}:
+            for by_hash_path in by_hash_dir.iterdir():
+                if by_hash_path not in retained:
+                    log.debug('Removing expired by-hash file', file=str(by_hash_path), distribution=distribution)
+                    by_hash_path.unlink()
+
+        log.info('Published by-hash index files', distribution=distribution, generations=len(generations),
+                 files=len(retained))
+
+    def _is_published(self, distribution: str, index_files: list[IndexFile]) -> bool:
+        release_path = self._config.repository_dir / 'dists' / distribution / 'Release'
+
+        if self._cache.load(distribution, release_path) is None:
+            return False
+
+        return all(self._cache.load(distribution, index_file.path) == index_file.content for index_file in index_files)
+
+    def _generate_release_file(self, distribution: str, index_files: list[IndexFile]) -> None:
         dist_path = self._config.repository_dir / 'dists' / distribution
 
         md5_checksums = []
         sha1_checksums = []
         sha256_checksums = []
 
-        for packages_file in packages_files:
-            md5, sha1, sha256 = self._generate_checksums(packages_file)
-            file_size = os.stat(packages_file).st_size
-            file_path = str(packages_file)[len(str(dist_path)) + 1:]
-            md5_checksums.append(f' {md5} {file_size} {file_path}')
-            sha1_checksums.append(f' {sha1} {file_size} {file_path}')
-            sha256_checksums.append(f' {sha256} {file_size} {file_path}')
+        for index_file in index_files:
+            file_path = index_file.path.relative_to(dist_path).as_posix()
+            md5_checksums.append(f' {index_file.md5} {index_file.size} {file_path}')
+            sha1_checksums.append(f' {index_file.sha1} {index_file.size} {file_path}')
+            sha256_checksums.append(f' {index_file.sha256} {index_file.size} {file_path}')
 
         context = {
             'origin': self._info.origin,
@@ -168,6 +796,7 @@ class DefaultRepositoryCreator(RepositoryCreator):
             'md5_checksums': '\n'.join(md5_checksums),
             'sha1_checksums': '\n'.join(sha1_checksums),
             'sha256_checksums': '\n'.join(sha256_checksums),
+            'acquire_by_hash': self._config.by_hash_generations > 0,
         }
 
         rendered_content = render_template_file(self._info.template, context).encode('utf-8')
@@ -178,27 +807,26 @@ class DefaultRepositoryCreator(RepositoryCreator):
 
         log.info('Generated Release file', file=str(release_path), distribution=distribution)
 
-    def _create_file(self, distribution: str, file_path: Path, content: bytes, compressed: bool = False) -> None:
-        if compressed:
-            buffer = BytesIO()
-            with gzip.GzipFile(fileobj=buffer, mode='wb') as compressed_file:
-                compressed_file.write(content)
-            content = buffer.getvalue()
+    def _create_file(self, distribution: str, file_path: Path, content: bytes,
+                     compression: str | None = None, level: int | None = None) -> IndexFile:
+        index_file = write_index_file(file_path, iterate_chunks(content), compression, level)
+
+        self._cache.store(distribution, file_path, index_file.content)
+
+        return index_file
+
+
+def _restore_entries(entries: dict[Path, Any], saved: dict[Path, Any], dist_path: Path) -> None:
+    for path in [path for path in entries if path.is_relative_to(dist_path)]:
+        del entries[path]
 
-        self._cache.store(distribution, file_path, content)
+    entries.update(saved)
 
-        with open(file_path, 'wb') as file:
-            file.write(content)
 
-    def _generate_checksums(self, file_path: Path) -> Tuple[str, str, str]:
-        md5_hashes = hashlib.md5()
-        sha1_hashes = hashlib.sha1()
-        sha256_hashes = hashlib.sha256()
+def _make_read_only(file_path: Path) -> None:
+    mode = stat.S_IMODE(file_path.stat().st_mode)
+    os.chmod(file_path, mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
 
-        with open(file_path, 'rb') as f:
-            data = f.read()
-            md5_hashes.update(data)
-            sha1_hashes.update(data)
-            sha256_hashes.update(data)
 
-        return md5_hashes.hexdigest(), sha1_hashes.hexdigest(), sha256_hashes.hexdigest()
+def get_by_hash_path(index_file: IndexFile) -> Path:
+    return index_file.path.parent / 'by-hash' / 'SHA256' / index_file.sha256
@@ -2,10 +2,14 @@
 # SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
 # SPDX-License-Identifier: MIT
 
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+
 from common_utility import IReusableTimer, ReusableTimer
 from context_logger import get_logger
 
-from package_repository import RepositoryCreator, RepositorySigner, RepositoryCache, PackageWatcher
+from package_repository import RepositoryBuilder, PackageWatcher, lower_thread_priority
 
 log = get_logger('RepositoryService')
 
@@ -21,22 +25,22 @@ class RepositoryService:
 
 class DefaultRepositoryService(RepositoryService):
 
-    def __init__(self, watcher: PackageWatcher, creator: RepositoryCreator, signer: RepositorySigner,
-                 cache: RepositoryCache, distributions: set[str], trigger_delay: float) -> None:
+    def __init__(self, watcher: PackageWatcher, builder: RepositoryBuilder, distributions: set[str],
+                 trigger_delay: float) -> None:
         self._watcher = watcher
-        self._creator = creator
-        self._signer = signer
-        self._cache = cache
+        self._builder = builder
         self._distributions = distributions
         self._trigger_delay = trigger_delay
         self._timers: dict[str, IReusableTimer] = {}
+        self._changes: dict[str, set[Path]] = {}
+        self._lock = Lock()
+        self._recompressor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='Recompressor',
+                                                initializer=lower_thread_priority)
 
     def start(self) -> None:
         log.info('Initializing repository')
 
-        self._cache.initialize()
-        self._creator.initialize()
-        self._signer.initialize()
+        self._builder.initialize()
 
         for distribution in self._distributions:
             self._update_repository(distribution)
@@ -47,12 +51,17 @@ class DefaultRepositoryService(RepositoryService):
     def stop(self) -> None:
         self._watcher.deregister(self._handle_event)
         self._watcher.stop()
+        self._recompressor.shutdown(cancel_futures=True)
+        self._builder.shutdown()
 
-    def _handle_event(self, distribution: str) -> None:
+    def _handle_event(self, distribution: str, package_path: Path) -> None:
         if distribution not in self._distributions:
             log.warning('Received event for unsupported distribution', distribution=distribution)
             return
 
+        with self._lock:
+            self._changes.setdefault(distribution, set()).add(package_path)
+
         timer = self._get_timer(distribution)
 
         if timer.is_alive():
@@ -74,7 +83,28 @@ class DefaultRepositoryService(RepositoryService):
         return timer
 
     def _update_repository(self, distribution: str) -> None:
-        log.info('Updating repository', distribution=distribution)
-        self._creator.create(distribution)
-        self._signer.sign(distribution)
-        self._cache.switch(distribution)
+        with self._lock:
+            changed_paths = self._changes.pop(distribution, None)
+
+        log.info('Updating repository', distribution=distribution,
+                 changes=len(changed_paths) if changed_paths is not None else 'all')
+
+        try:
+            changed = self._builder.build(distribution, changed_paths)
+        except Exception:
+            self._restore_changes(distribution, changed_paths)
+            raise
+
+        if changed:
+            self._recompressor.submit(self._recompress_repository, distribution)
+
+    def _recompress_repository(self, distribution: str) -> None:
+        try:
+            self._builder.recompress(distribution)
+        except Exception as error:
+            log.error('Failed to recompress repository', distribution=distribution, error=error)
+
+    def _restore_changes(self, distribution: str, changed_paths: set[Path] | None) -> None:
+        if changed_paths is not None:
+            with self._lock:
+                self._changes.setdefault(distribution, set()).update(changed_paths)
@@ -2,8 +2,15 @@
 # SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
 # SPDX-License-Identifier: MIT
 
+import random
 import shutil
+import tempfile
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
+from typing import Any, Callable
 
 from context_logger import get_logger
 from gnupg import GPG, ImportResult, Sign, Verify
@@ -12,6 +19,8 @@ from package_repository import RepositoryCache
 
 log = get_logger('RepositorySigner')
 
+VERIFICATION_MODES = ['immediate', 'deferred', 'sampled']
+
 
 class GpgException(Exception):
 
@@ -23,6 +32,13 @@ class GpgException(Exception):
         self.error = result.stderr if hasattr(result, 'stderr') else None
 
 
+class SignatureError(Exception):
+
+    def __init__(self, message: str, path: Path) -> None:
+        super().__init__(message)
+        self.path = path
+
+
 class GpgKey(object):
 
     def __init__(self, key_id: str, key_path: Path) -> None:
@@ -44,6 +60,21 @@ class PublicGpgKey(GpgKey):
         self.public_name = public_name
 
 
+@dataclass
+class SignatureConfig:
+    verification: str = 'immediate'
+    sample_rate: float = 0.1
+    detached_signature: bool = True
+
+
+@dataclass
+class SignedRelease:
+    path: Path
+    release: bytes
+    in_release: bytes
+    signature: bytes | None
+
+
 class RepositorySigner:
 
     def initialize(self) -> None:
@@ -52,16 +83,97 @@ class RepositorySigner:
     def sign(self, distribution: str) -> None:
         raise NotImplementedError()
 
+    def verify(self, distribution: str) -> None:
+        raise NotImplementedError()
+
+
+def add_sign_with_field(release: bytes, key_id: str) -> bytes:
+    sign_with = 'SignWith'
+    signed_with = f'{sign_with}: {key_id}'
+
+    release_lines = release.decode().splitlines(keepends=True)
+
+    if release_lines and sign_with in release_lines[-1]:
+        release_lines[-1] = signed_with
+    else:
+        release_lines.append(f'\n{signed_with}')
+
+    return ''.join(release_lines).encode()
+
+
+def _is_verification_deferred(config: SignatureConfig) -> bool:
+    if config.verification not in VERIFICATION_MODES:
+        raise ValueError(f'Unsupported signature verification: {config.verification}')
+
+    return config.verification != 'immediate'
+
+
+def _is_verification_sampled(config: SignatureConfig) -> bool:
+    return config.verification != 'sampled' or random.random() < config.sample_rate
+
+
+def _sign_release(cache: RepositoryCache, executor: Executor, dist_path: Path, distribution: str, key_id: str,
+                  clearsign: Callable[[bytes], bytes], detach_sign: Callable[[bytes], bytes] | None) -> SignedRelease:
+    release_path = dist_path / 'Release'
+
+    release = add_sign_with_field(release_path.read_bytes(), key_id)
+    _create_file(cache, distribution, release_path, release)
+
+    detached = executor.submit(detach_sign, release) if detach_sign else None
+    in_release = clearsign(release)
+    signature = detached.result() if detached else None
+
+    signed = SignedRelease(dist_path, release, in_release, signature)
+    _store_signatures(cache, distribution, signed)
+
+    return signed
+
+
+def _store_signatures(cache: RepositoryCache, distribution: str, signed: SignedRelease) -> None:
+    in_release_path = signed.path / 'InRelease'
+    _create_file(cache, distribution, in_release_path, signed.in_release)
+    log.info('Created signed Release file', file=str(in_release_path))
+
+    signature_path = signed.path / 'Release.gpg'
+
+    if signed.signature is not None:
+        _create_file(cache, distribution, signature_path, signed.signature)
+        log.info('Created signature file', file=str(signature_path))
+    elif signature_path.exists():
+        signature_path.unlink()
+        log.info('Removed detached signature file', file=str(signature_path))
+
+
+def _create_file(cache: RepositoryCache, distribution: str, file_path: Path, content: bytes) -> None:
+    cache.store(distribution, file_path, content)
+
+    with open(file_path, 'wb') as file:
+        file.write(content)
+
+
+def _schedule_verification(deferred: bool, config: SignatureConfig, pending: dict[str, SignedRelease],
+                           distribution: str, signed: SignedRelease, verify: Callable[[SignedRelease], None]) -> None:
+    if not deferred:
+        verify(signed)
+    elif _is_verification_sampled(config):
+        pending[distribution] = signed
+    else:
+        log.debug('Skipping sampled signature verification', distribution=distribution)
+
 
 class DefaultRepositorySigner(RepositorySigner):
 
     def __init__(self, cache: RepositoryCache, gpg: GPG, private_key: PrivateGpgKey, public_key: PublicGpgKey,
-                 repository_dir: Path) -> None:
+                 repository_dir: Path, config: SignatureConfig | None = None) -> None:
         self._cache = cache
         self._gpg = gpg
         self._private_key = private_key
         self._public_key = public_key
         self._repository_dir = repository_dir
+        self._config = config or SignatureConfig()
+        self._deferred = _is_verification_deferred(self._config)
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='RepositorySigner')
+        self._pending: dict[str, SignedRelease] = {}
 
     def initialize(self) -> None:
         self._import_private_key()
@@ -71,11 +183,18 @@ class DefaultRepositorySigner(RepositorySigner):
         dist_path = self._repository_dir / 'dists' / distribution
         release_path = dist_path / 'Release'
 
-        self._update_release_file(distribution, release_path)
+        signed = _sign_release(
+            self._cache, self._executor, dist_path, distribution, self._private_key.id,
+            partial(self._create_signature, release_path, detach=False),
+            partial(self._create_signature, release_path, detach=True) if self._config.detached_signature else None
+        )
 
-        self._clearsign_release_file(distribution, release_path)
+        _schedule_verification(self._deferred, self._config, self._pending, distribution, signed,
+                               self._verify_signatures)
 
-        self._create_detached_signature(distribution, release_path)
+    def verify(self, distribution: str) -> None:
+        if signed := self._pending.pop(distribution, None):
+            self._verify_signatures(signed)
 
     def _add_public_key(self) -> None:
         target_path = self._repository_dir / self._public_key.public_name
@@ -104,65 +223,193 @@ class DefaultRepositorySigner(RepositorySigner):
 
         return False
 
-    def _update_release_file(self, distribution: str, release_path: Path) -> None:
-        sign_with = 'SignWith'
-        signed_with = f'{sign_with}: {self._private_key.id}'
+    def _create_signature(self, release_path: Path, release: bytes, detach: bool) -> bytes:
+        result: Sign = self._gpg.sign(
+            release,
+            keyid=self._private_key.id,
+            passphrase=self._private_key.passphrase,
+            detach=detach
+        )
 
-        with open(release_path, 'r') as release_file:
-            release_lines = release_file.readlines()
+        if result.returncode != 0:
+            log.error('Failed to create signature', file=str(release_path), detach=detach)
+            raise GpgException('Failed to create signature', result)
 
-        if sign_with in release_lines[-1]:
-            release_lines[-1] = signed_with
-        else:
-            release_lines.append(f'\n{signed_with}')
+        signature: bytes = result.data
 
-        release_content = ''.join(release_lines).encode()
+        return signature
 
-        self._create_file(distribution, release_path, release_content)
+    def _verify_signatures(self, signed: SignedRelease) -> None:
+        detached = None
 
-    def _clearsign_release_file(self, distribution: str, release_path: Path) -> None:
-        in_release_path = release_path.parent / 'InRelease'
+        if signed.signature is not None:
+            detached = self._executor.submit(self._verify_detached_signature, signed, signed.signature)
 
-        self._create_signature(distribution, release_path, in_release_path, detach=False)
+        result: Verify = self._gpg.verify(signed.in_release)
+        self._check_verification(result, signed.path / 'InRelease')
 
-        log.info('Created signed Release file', file=str(in_release_path))
+        if detached:
+            detached.result()
 
-    def _create_detached_signature(self, distribution: str, release_path: Path) -> None:
-        signature_path = Path(f'{release_path}.gpg')
+    def _verify_detached_signature(self, signed: SignedRelease, signature: bytes) -> None:
+        # Verify the created signature, Release.gpg on disk may have been replaced since
+        with tempfile.NamedTemporaryFile(prefix='Release.', suffix='.gpg') as signature_file:
+            signature_file.write(signature)
+            signature_file.flush()
+            result: Verify = self._gpg.verify_data(signature_file.name, signed.release)
 
-        self._create_signature(distribution, release_path, signature_path, detach=True)
+        self._check_verification(result, signed.path / 'Release.gpg')
 
-        log.info('Created signature file', file=str(signature_path))
+    def _check_verification(self, result: Verify, signature_path: Path) -> None:
+        if result.returncode != 0:
+            log.error('Failed to verify signature', signature=str(signature_path))
+            raise GpgException('Failed to verify signature', result)
+        else:
+            log.debug('Verified signature', file=str(signature_path))
 
-    def _create_signature(self, distribution: str, release_path: Path, signature_path: Path, detach: bool) -> None:
-        result: Sign = self._gpg.sign_file(
-            str(release_path),
-            keyid=self._private_key.id,
-            passphrase=self._private_key.passphrase,
-            detach=detach
+
+class NativeRepositorySigner(RepositorySigner):
+
+    def __init__(self, cache: RepositoryCache, private_key: PrivateGpgKey, public_key: PublicGpgKey,
+                 repository_dir: Path, config: SignatureConfig | None = None, hash_algorithm: str = 'SHA512') -> None:
+        self._cache = cache
+        self._private_key = private_key
+        self._public_key = public_key
+        self._repository_dir = repository_dir
+        self._config = config or SignatureConfig()
+        self._deferred = _is_verification_deferred(self._config)
+        self._hash_algorithm = hash_algorithm
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='RepositorySigner')
+        self._pending: dict[str, SignedRelease] = {}
+        self._session = ExitStack()
+        self._signing_key: Any = None
+        self._verifying_key: Any = None
+
+    def initialize(self) -> None:
+        self._load_private_key()
+        self._load_public_key()
+        self._add_public_key()
+
+    def sign(self, distribution: str) -> None:
+        if not self._signing_key:
+            raise SignatureError('Signing key is not loaded', self._private_key.path)
+
+        signed = _sign_release(
+            self._cache, self._executor, self._repository_dir / 'dists' / distribution, distribution,
+            self._private_key.id, self._create_clearsigned_release,
+            self._create_detached_signature if self._config.detached_signature else None
         )
 
-        if result.returncode != 0:
-            log.error('Failed to create signature', file=str(release_path), signature=str(signature_path))
-            raise GpgException('Failed to create signature', result)
-        else:
-            self._create_file(distribution, signature_path, result.data)
-            log.debug('Created signature', file=str(signature_path))
+        _schedule_verification(self._deferred, self._config, self._pending, distribution, signed,
+                               self._verify_signatures)
 
-        self._verify_signature(release_path, signature_path, detached=detach)
+    def verify(self, distribution: str) -> None:
+        if signed := self._pending.pop(distribution, None):
+            self._verify_signatures(signed)
 
-    def _create_file(self, distribution: str, file_path: Path, content: bytes) -> None:
-        self._cache.store(distribution, file_path, content)
+    def _load_private_key(self) -> None:
+        import pgpy
 
-        with open(file_path, 'wb') as file:
-            file.write(content)
+        key_path = self._private_key.path
+        key, _ = pgpy.PGPKey.from_file(str(key_path))
+        signing_key = self._find_key(key, self._private_key.id)
 
-    def _verify_signature(self, release_path: Path, signature_path: Path, detached: bool) -> None:
-        with open(signature_path, 'rb') as signature_file:
-            result: Verify = self._gpg.verify_file(signature_file, str(release_path) if detached else None)
+        if not signing_key:
+            log.error('Signing key not found in key file', file=str(key_path), key_id=self._private_key.id)
+            raise SignatureError('Signing key not found in key file', key_path)
 
-        if result.returncode != 0:
-            log.error('Failed to verify signature', file=str(release_path), signature=str(signature_path))
-            raise GpgException('Failed to verify signature', result)
-        else:
-            log.debug('Verified signature', file=str(signature_path))
+        if signing_key.is_protected:
+            try:
+                self._session.enter_context(signing_key.unlock(self._private_key.passphrase))
+            except pgpy.errors.PGPDecryptionError as error:
+                log.error('Failed to unlock signing key', file=str(key_path), key_id=self._private_key.id)
+                raise SignatureError('Failed to unlock signing key', key_path) from error
+
+        self._signing_key = signing_key
+
+        log.info('Loaded signing key', key_id=self._private_key.id)
+
+    def _load_public_key(self) -> None:
+        import pgpy
+
+        key_path = self._public_key.path
+        key, _ = pgpy.PGPKey.from_file(str(key_path))
+
+        if not self._find_key(key, self._public_key.id):
+            log.error('Verification key not found in key file', file=str(key_path), key_id=self._public_key.id)
+            raise SignatureError('Verification key not found in key file', key_path)
+
+        self._verifying_key = key
+
+    def _find_key(self, key: Any, key_id: str) -> Any:
+        key_id = key_id.replace(' ', '').upper()
+
+        for candidate in [key, *key.subkeys.values()]:
+            fingerprint = str(candidate.fingerprint).replace(' ', '').upper()
+
+            if fingerprint == key_id or fingerprint.endswith(key_id):
+                return candidate
+
+        return None
+
+    def _add_public_key(self) -> None:
+        target_path = self._repository_dir / self._public_key.public_name
+        shutil.copyfile(self._public_key.path, target_path)
+        log.info('Added public key file', file=str(target_path))
+
+    def _create_clearsigned_release(self, release: bytes) -> bytes:
+        import pgpy
+
+        message = pgpy.PGPMessage.new(release.decode(), cleartext=True)
+        message |= self._signing_key.sign(message, hash=pgpy.constants.HashAlgorithm[self._hash_algorithm])
+
+        return str(message).encode()
+
+    def _create_detached_signature(self, release: bytes) -> bytes:
+        import pgpy
+
+        signature = self._signing_key.sign(release, hash=pgpy.constants.HashAlgorithm[self._hash_algorithm])
+
+        return str(signature).encode()
+
+    def _verify_signatures(self, signed: SignedRelease) -> None:
+        import pgpy
+
+        message = pgpy.PGPMessage.from_blob(signed.in_release)
+        self._verify_signature(message, None, signed.path / 'InRelease')
+
+        if signed.signature is not None:
+            signature = pgpy.PGPSignature.from_blob(signed.signature)
+            self._verify_signature(signed.release, signature, signed.path / 'Release.gpg')
+
+    def _verify_signature(self, subject: Any, signature: Any, signature_path: Path) -> None:
+        import pgpy
+
+        try:
+            verification = self._verifying_key.verify(subject, signature)
+        except pgpy.errors.PGPError as error:
+            # Raised when no signature was made by the verification key
+            log.error('Failed to verify signature', signature=str(signature_path), error=str(error))
+            raise SignatureError('Failed to verify signature', signature_path) from error
+
+        self._check_verification(verification, signature_path)
+
+    def _check_verification(self, verification: Any, signature_path: Path) -> None:
+        from pgpy.constants import SecurityIssues
+
+        verified = list(verification.good_signatures)
+
+        for result in verification.bad_signatures:
+            # Like gpg, an expired key still yields a cryptographically valid signature
+            if result.issues & ~SecurityIssues.Expired:
+                log.error('Failed to verify signature', signature=str(signature_path), issues=str(result.issues))
+                raise SignatureError('Failed to verify signature', signature_path)
+
+            log.warning('Signature made with expired key', signature=str(signature_path))
+            verified.append(result)
+
+        if not verified:
+            log.error('No signature made by verification key', signature=str(signature_path))
+            raise SignatureError('No signature made by verification key', signature_path)
+
+        log.debug('Verified signature', file=str(signature_path))
@@ -0,0 +1,195 @@
+# SPDX-FileCopyrightText: 2024 Ferenc Nandor Janky <ferenj@effective-range.com>
+# SPDX-FileCopyrightText: 2024 Attila Gombos <attila.gombos@effective-range.com>
+# SPDX-License-Identifier: MIT
+
+import os
+import time
+from dataclasses import dataclass
+from functools import cmp_to_key
+from pathlib import Path
+
+from context_logger import get_logger
+
+from package_repository import ControlStanza
+
+log = get_logger('RetentionPolicy')
+
+RETENTION_ACTIONS = ['keep', 'archive', 'delete']
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+@dataclass
+class RetentionPolicy:
+    max_versions: int = 0
+    max_age_days: float = 0
+    action: str = 'keep'
+    archive_dir: Path | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_versions > 0 or self.max_age_days > 0
+
+
+@dataclass(frozen=True)
+class RetentionResult:
+    content: bytes
+    excluded: set[str]
+    expires: float = float('inf')
+
+
+def apply_retention_policy(content: bytes, policy: RetentionPolicy, repository_dir: Path,
+                           now: float | None = None) -> tuple[bytes, set[str]]:
+    result = evaluate_retention_policy(content, policy, repository_dir, now)
+    return result.content, result.excluded
+
+
+def evaluate_retention_policy(content: bytes, policy: RetentionPolicy, repository_dir: Path,
+                              now: float | None = None) -> RetentionResult:
+    entries = [entry for entry in content.split(b'\n\n') if entry.strip()]
+    groups: dict[tuple[str, str], list[tuple[int, ControlStanza]]] = {}
+
+    for index, entry in enumerate(entries):
+        try:
+            stanza = ControlStanza.parse(entry)
+        except ValueError as error:
+            log.warning('Ignoring invalid stanza in retention policy', error=error)
+            continue
+
+        groups.setdefault((stanza.package, stanza.architecture), []).append((index, stanza))
+
+    max_age = policy.max_age_days * SECONDS_PER_DAY
+    cutoff = (now if now is not None else time.time()) - max_age
+    excluded: dict[int, str] = {}
+    expires = float('inf')
+
+    for versions in groups.values():
+        versions.sort(key=cmp_to_key(_compare_entries))
+
+        for rank, (index, stanza) in enumerate(versions[1:], start=1):
+            if policy.max_versions > 0 and rank >= policy.max_versions:
+                excluded[index] = stanza.filename
+            elif policy.max_age_days > 0:
+                mtime = _get_mtime(repository_dir / stanza.filename)
+
+                if mtime < cutoff:
+                    excluded[index] = stanza.filename
+                else:
+                    # The result stays valid until the oldest retained version ages out
+                    expires = min(expires, mtime + max_age)
+
+    if not excluded:
+        return RetentionResult(content, set(), expires)
+
+    retained = b''.join(entry + b'\n\n' for index, entry in enumerate(entries) if index not in excluded)
+
+    return RetentionResult(retained, set(excluded.values()), expires)
+
+
+def compare_versions(first: str, second: str) -> int:
+    first_epoch, first_upstream, first_revision = _split_version(first)
+    second_epoch, second_upstream, second_revision = _split_version(second)
+
+    if first_epoch != second_epoch:
+        return first_epoch - second_epoch
+
+    return _compare_part(first_upstream, second_upstream) or _compare_part(first_revision, second_revision)
+
+
+def _compare_entries(first: tuple[int, ControlStanza], second: tuple[int, ControlStanza]) -> int:
+    return compare_versions(second[1].version, first[1].version)
+
+
+def _split_version(version: str) -> tuple[int, str, str]:
+    epoch, separator, rest = version.partition(':')
+
+    if not separator:
+        epoch, rest = '0', version
+
+    upstream, separator, revision = rest.rpartition('-')
+
+    if not separator:
+        upstream, revision = rest, ''
+
+    try:
+        return int(epoch or 0), upstream, revision
+    except ValueError:
+        return 0, version, ''
+
+
+def _compare_part(first: str, second: str) -> int:
+    i = j = 0
+
+    while i < len(first) or j < len(second):
+        difference, i, j = _compare_non_digits(first, second, i, j)
+
+        if difference:
+            return difference
+
+        difference, i, j = _compare_digits(first, second, i, j)
+
+        if difference:
+            return difference
+
+    return 0
+
+
+def _compare_non_digits(first: str, second: str, i: int, j: int) -> tuple[int, int, int]:
+    while (i < len(first) and not _is_digit(first[i])) or (j < len(second) and not _is_digit(second[j])):
+        first_order = _get_order(first[i]) if i < len(first) else 0
+        second_order = _get_order(second[j]) if j < len(second) else 0
+
+        if first_order != second_order:
+            return first_order - second_order, i, j
+
+        i += 1
+        j += 1
+
+    return 0, i, j
+
+
+def _compare_digits(first: str, second: str, i: int, j: int) -> tuple[int, int, int]:
+    while i < len(first) and first[i] == '0':
+        i += 1
+
+    while j < len(second) and second[j] == '0':
+        j += 1
+
+    difference = 0
+
+    while i < len(first) and _is_digit(first[i]) and j < len(second) and _is_digit(second[j]):
+        if not difference:
+            difference = ord(first[i]) - ord(second[j])
+
+        i += 1
+        j += 1
+
+    if i < len(first) and _is_digit(first[i]):
+        return 1, i, j
+
+    if j < len(second) and _is_digit(second[j]):
+        return -1, i, j
+
+    return difference, i, j
+
+
+def _get_order(character: str) -> int:
+    if _is_digit(character):
+        return 0
+    elif character.isascii() and character.isalpha():
+        return ord(character)
+    elif character == '~':
+        return -1
+    else:
+        return ord(character) + 256
+
+
+def _is_digit(character: str) -> bool:
+    return '0' <= character <= '9'
+
+
+def _get_mtime(path: Path) -> float:
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return float('inf')
@@ -23,4 +23,8 @@ setup(
         'python-context-logger@git+https://github.com/EffectiveRange/python-context-logger.git@latest',
         'python-common-utility@git+https://github.com/EffectiveRange/python-common-utility.git@latest',
     ],
+    extras_require={
+        'zstd': ['zstandard'],
+        'pgp': ['PGPy'],
+    },
 )
@@ -0,0 +1,112 @@
+import os
+import unittest
+from unittest import TestCase
+
+from common_utility import delete_directory, create_directory
+from context_logger import setup_logging
+
+from package_repository import DefaultCacheMemory, CacheStatistics
+from tests import APPLICATION_NAME, REPOSITORY_DIR
+
+SPILL_DIR = REPOSITORY_DIR / '.cache/spill'
+
+
+class DefaultCacheMemoryTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        setup_logging(APPLICATION_NAME, 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self):
+        print()
+        delete_directory(REPOSITORY_DIR)
+
+    def test_allocate_keeps_content_resident_within_budget(self):
+        # Given
+        memory = DefaultCacheMemory(1000, SPILL_DIR)
+        memory.initialize()
+
+        # When
+        blob = memory.allocate(b'a' * 400)
+
+        # Then
+        self.assertTrue(blob.resident)
+        self.assertEqual(CacheStatistics(400, 0), memory.get_statistics())
+
+    def test_allocate_spills_least_recently_used_content_over_budget(self):
+        # Given
+        memory = DefaultCacheMemory(1000, SPILL_DIR)
+        memory.initialize()
+        blobs = [memory.allocate(bytes([index]) * 250) for index in range(4)]
+        memory.touch(blobs[0])
+
+        # When
+        blobs.append(memory.allocate(b'\xff' * 250))
+
+        # Then
+        self.assertEqual([True, False, False, True, True], [blob.resident for blob in blobs])
+        self.assertIsInstance(blobs[1].content, memoryview)
+        self.assertEqual(b'\x01' * 250, blobs[1].to_bytes())
+        self.assertEqual(b'\x02' * 250, blobs[2].to_bytes())
+        self.assertEqual(CacheStatistics(750, 500), memory.get_statistics())
+        self.assertEqual([], os.listdir(SPILL_DIR / 'segments'))
+
+    def test_initialize_removes_only_stale_segments_from_spill_dir(self):
+        # Given
+        create_directory(SPILL_DIR / 'segments')
+        (SPILL_DIR / 'segments/segment-1-1').write_bytes(b'stale')
+        (SPILL_DIR / 'other.txt').write_bytes(b'other')
+        memory = DefaultCacheMemory(1000, SPILL_DIR)
+
+        # When
+        memory.initialize()
+
+        # Then
+        self.assertEqual([], os.listdir(SPILL_DIR / 'segments'))
+        self.assertEqual(b'other', (SPILL_DIR / 'other.txt').read_bytes())
+
+    def test_allocate_keeps_content_resident_without_budget(self):
+        # Given
+        memory = DefaultCacheMemory()
+        memory.initialize()
+
+        # When
+        blobs = [memory.allocate(b'a' * 400) for _ in range(10)]
+
+        # Then
+        self.assertTrue(all(blob.resident for blob in blobs))
+        self.assertEqual(CacheStatistics(4000, 0), memory.get_statistics())
+
+    def test_retain_releases_unreferenced_content(self):
+        # Given
+        memory = DefaultCacheMemory(1000, SPILL_DIR)
+        memory.initialize()
+        memory.allocate(b'a' * 400)
+        memory.allocate(b'b' * 400)
+        memory.allocate(b'c' * 100)
+        retained = memory.allocate(b'd' * 100)
+
+        # When
+        memory.retain({retained})
+
+        # Then
+        self.assertEqual(CacheStatistics(100, 0), memory.get_statistics())
+
+    def test_retain_counts_spilled_segment_until_last_entry_released(self):
+        # Given
+        memory = DefaultCacheMemory(1000, SPILL_DIR)
+        memory.initialize()
+        blobs = [memory.allocate(bytes([index]) * 250) for index in range(5)]
+
+        # When
+        memory.retain({blobs[1], blobs[3], blobs[4]})
+        partially_released = memory.get_statistics()
+        memory.retain({blobs[3], blobs[4]})
+
+        # Then
+        self.assertEqual(CacheStatistics(500, 500), partially_released)
+        self.assertEqual(CacheStatistics(500, 0), memory.get_statistics())
+
+
+if __name__ == "__main__":
+    unittest.main()
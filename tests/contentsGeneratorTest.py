@@ -0,0 +1,96 @@
+import os
+import unittest
+from pathlib import Path
+from unittest import TestCase, mock
+
+from common_utility import delete_directory, create_directory
+from context_logger import setup_logging
+
+from package_repository import DefaultContentsGenerator, SqlitePackageStore, DebPackage
+from tests import create_test_packages, create_test_package, REPOSITORY_DIR, PACKAGE_DIR, APPLICATION_NAME
+
+ARCHITECTURES = ['all', 'amd64', 'arm64']
+
+
+class ContentsGeneratorTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        setup_logging(APPLICATION_NAME, 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self):
+        print()
+        delete_directory(PACKAGE_DIR)
+        delete_directory(REPOSITORY_DIR)
+        create_test_packages(PACKAGE_DIR, 'trixie')
+        create_test_package(PACKAGE_DIR, 'trixie', 'main', 'all', 'hello-all')
+        create_directory(REPOSITORY_DIR)
+        os.symlink(PACKAGE_DIR, REPOSITORY_DIR / 'pool', target_is_directory=True)
+
+    def test_generate_contents_per_architecture(self):
+        # Given
+        generator = DefaultContentsGenerator(REPOSITORY_DIR)
+        generator.initialize()
+
+        # When
+        contents = generator.generate([Path('pool/trixie/main')], ARCHITECTURES)
+
+        # Then
+        self.assertEqual(ARCHITECTURES, list(contents.keys()))
+        self.assertEqual(b'usr/bin/hello-all misc/hello-all\n'
+                         b'usr/bin/hello-world misc/hello-world\n', contents['amd64'])
+        self.assertEqual(b'usr/bin/hello-all misc/hello-all\n'
+                         b'usr/bin/hello-world misc/hello-world\n', contents['arm64'])
+
+    def test_generate_unpacks_new_packages_only(self):
+        # Given
+        generator = DefaultContentsGenerator(REPOSITORY_DIR)
+        generator.initialize()
+        generator.generate([Path('pool/trixie/main')], ARCHITECTURES)
+        create_test_package(PACKAGE_DIR, 'trixie', 'main', 'arm64', 'hello-arm')
+
+        with mock.patch.object(DebPackage, 'get_files', autospec=True,
+                               side_effect=DebPackage.get_files) as get_files:
+            # When
+            contents = generator.generate([Path('pool/trixie/main')], ARCHITECTURES)
+
+        # Then
+        get_files.assert_called_once()
+        self.assertIn(b'usr/bin/hello-arm misc/hello-arm\n', contents['arm64'])
+        self.assertNotIn(b'hello-arm', contents['amd64'])
+
+    def test_generate_removes_deleted_packages(self):
+        # Given
+        generator = DefaultContentsGenerator(REPOSITORY_DIR)
+        generator.initialize()
+        generator.generate([Path('pool/trixie/main')], ARCHITECTURES)
+        os.remove(PACKAGE_DIR / 'trixie/main/hello-all_0.0.1-1_all.deb')
+
+        # When
+        contents = generator.generate([Path('pool/trixie/main')], ARCHITECTURES)
+
+        # Then
+        self.assertEqual(b'usr/bin/hello-world misc/hello-world\n', contents['amd64'])
+        self.assertEqual(b'', contents['all'])
+
+    def test_generate_reuses_stored_contents_after_restart(self):
+        # Given
+        store_path = REPOSITORY_DIR / '.cache/packages.db'
+        generator = DefaultContentsGenerator(REPOSITORY_DIR, SqlitePackageStore(store_path))
+        generator.initialize()
+        expected = generator.generate([Path('pool/trixie/main')], ARCHITECTURES)
+
+        restarted = DefaultContentsGenerator(REPOSITORY_DIR, SqlitePackageStore(store_path))
+        restarted.initialize()
+
+        with mock.patch.object(DebPackage, 'get_files') as get_files:
+            # When
+            contents = restarted.generate([Path('pool/trixie/main')], ARCHITECTURES)
+
+        # Then
+        get_files.assert_not_called()
+        self.assertEqual(expected, contents)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from unittest import TestCase
+
+from context_logger import setup_logging
+
+from package_repository import ControlStanza
+from tests import APPLICATION_NAME
+
+CONTROL = b'''Package: hello-world
+Version: 0.0.1
+ARCHITECTURE: amd64
+X-Custom-Field: custom
+Homepage: http://example.com
+Maintainer: example <example@example.com>
+Description: A program that prints hello world
+ Long description.
+ .
+ Second paragraph.
+'''
+
+
+class ControlStanzaTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        setup_logging(APPLICATION_NAME, 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self):
+        print()
+
+    def test_parse(self):
+        # When
+        stanza = ControlStanza.parse(CONTROL)
+
+        # Then
+        self.assertEqual('hello-world', stanza.package)
+        self.assertEqual('0.0.1', stanza.version)
+        self.assertEqual('amd64', stanza.architecture)
+        self.assertEqual('amd64', stanza['architecture'])
+        self.assertEqual('A program that prints hello world\nLong description.\n\nSecond paragraph.',
+                         stanza['Description'])
+
+    def test_parse_when_field_is_duplicated(self):
+        # When, Then
+        self.assertRaises(ValueError, ControlStanza.parse, b'Package: a\npackage: b\n')
+
+    def test_parse_when_continuation_has_no_field(self):
+        # When, Then
+        self.assertRaises(ValueError, ControlStanza.parse, b' continuation\n')
+
+    def test_parse_stops_at_stanza_end(self):
+        # When
+        stanza = ControlStanza.parse(b'\n# comment\nPackage: a\n\nPackage: b\n')
+
+        # Then
+        self.assertEqual('a', stanza.package)
+
+    def test_format_uses_canonical_field_names_and_order(self):
+        # Given
+        stanza = ControlStanza.parse(CONTROL)
+        stanza['sha256'] = 'abc'
+        stanza['md5sum'] = 'def'
+        stanza['Empty'] = ' '
+
+        # When
+        content = stanza.format()
+
+        # Then
+        self.assertEqual(b'''Package: hello-world
+Version: 0.0.1
+Architecture: amd64
+Maintainer: example <example@example.com>
+MD5sum: def
+SHA256: abc
+Homepage: http://example.com
+Description: A program that prints hello world
+ Long description.
+ .
+ Second paragraph.
+X-Custom-Field: custom
+''', content)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+from unittest import TestCase
+
+from common_utility import delete_directory, create_file
+from context_logger import setup_logging
+
+from package_repository import DebPackage, DebPackageError, ControlStanza
+from tests import create_test_package, PACKAGE_DIR, APPLICATION_NAME
+
+
+class DebPackageTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        setup_logging(APPLICATION_NAME, 'DEBUG', warn_on_overwrite=False)
+        delete_directory(PACKAGE_DIR)
+        create_test_package(PACKAGE_DIR, 'trixie', 'main', 'amd64')
+
+    def setUp(self):
+        print()
+
+    def test_get_control(self):
+        # Given
+        package = DebPackage(PACKAGE_DIR / 'trixie/main/hello-world_0.0.1-1_amd64.deb')
+
+        # When
+        control = package.get_control()
+
+        # Then
+        stanza = ControlStanza.parse(control)
+        self.assertEqual('hello-world', stanza.package)
+        self.assertEqual('amd64', stanza.architecture)
+
+    def test_get_files(self):
+        # Given
+        package = DebPackage(PACKAGE_DIR / 'trixie/main/hello-world_0.0.1-1_amd64.deb')
+
+        # When
+        files = package.get_files()
+
+        # Then
+        self.assertEqual(['usr/bin/hello-world'], files)
+
+    def test_get_control_when_not_a_package(self):
+        # Given
+        file_path = PACKAGE_DIR / 'trixie/main/invalid.deb'
+        create_file(file_path, 'invalid content')
+        package = DebPackage(file_path)
+
+        # When, Then
+        self.assertRaises(DebPackageError, package.get_control)
+
+    def test_get_files_when_package_truncated(self):
+        # Given
+        content = (PACKAGE_DIR / 'trixie/main/hello-world_0.0.1-1_amd64.deb').read_bytes()
+        file_path = PACKAGE_DIR / 'trixie/main/truncated.deb'
+        file_path.write_bytes(content[:-100])
+        package = DebPackage(file_path)
+
+        # When, Then
+        self.assertRaises(DebPackageError, package.get_files)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import hashlib
+import unittest
+from unittest import TestCase, mock
+
+from common_utility import delete_directory, create_directory
+from context_logger import setup_logging
+
+from package_repository import DefaultDigestService, FileFingerprint, FileDigest, hash_file
+from tests import APPLICATION_NAME, REPOSITORY_DIR
+
+
+class DigestServiceTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        setup_logging(APPLICATION_NAME, 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self):
+        print()
+        delete_directory(REPOSITORY_DIR)
+        create_directory(REPOSITORY_DIR)
+
+    def test_hash_file(self):
+        # Given
+        file_path = REPOSITORY_DIR / 'large.deb'
+        content = bytes(range(256)) * 10000
+        file_path.write_bytes(content)
+
+        # When
+        digest = hash_file(file_path)
+
+        # Then
+        self.assertEqual(FileDigest(len(content), hashlib.md5(content).hexdigest(), hashlib.sha1(content).hexdigest(),
+                                    hashlib.sha256(content).hexdigest()), digest)
+
+    def test_digest_files_in_parallel(self):
+        # Given
+        service = DefaultDigestService(4)
+        files = {}
+        for index in range(8):
+            file_path = REPOSITORY_DIR / f'package-{index}.deb'
+            file_path.write_bytes(f'content {index}'.encode())
+            files[file_path] = FileFingerprint.create(file_path)
+
+        # When
+        digests = service.digest(files)
+
+        # Then
+        self.assertEqual({path: hash_file(path) for path in files}, digests)
+
+    def test_digest_reuses_results_by_fingerprint(self):
+        # Given
+        service = DefaultDigestService()
+        file_path = REPOSITORY_DIR / 'package.deb'
+        file_path.write_bytes(b'content')
+        files = {file_path: FileFingerprint.create(file_path)}
+        expected = service.digest(files)
+
+        with mock.patch.object(service, '_hash_file') as hash_function:
+            # When
+            digests = service.digest(files)
+
+        # Then
+        hash_function.assert_not_called()
+        self.assertEqual(expected, digests)
+
+    def test_prune_drops_digests_not_requested_since_last_prune(self):
+        # Given
+        service = DefaultDigestService()
+        first_path = REPOSITORY_DIR / 'first.deb'
+        second_path = REPOSITORY_DIR / 'second.deb'
+        first_path.write_bytes(b'first')
+        second_path.write_bytes(b'second')
+        service.digest({first_path: FileFingerprint.create(first_path),
+                        second_path: FileFingerprint.create(second_path)})
+        service.prune()
+        service.digest({first_path: FileFingerprint.create(first_path)})
+
+        # When
+        service.prune()
+
+        # Then
+        self.assertEqual({FileFingerprint.create(first_path)}, set(service._digests))
+
+    def test_digest_skips_missing_files(self):
+        # Given
+        service = DefaultDigestService()
+        file_path = REPOSITORY_DIR / 'missing.deb'
+
+        # When
+        digests = service.digest({file_path: FileFingerprint(1, 1, 1)})
+
+        # Then
+        self.assertEqual({}, digests)
+
+
+if __name__ == "__main__":
+    unittest.main()
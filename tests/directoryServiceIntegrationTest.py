@@ -1,5 +1,6 @@
 import base64
 import gzip
+import hashlib
 import os
 import unittest
 from io import BytesIO
@@ -11,7 +12,7 @@ from context_logger import setup_logging
 from test_utility import wait_for_condition
 
 from package_repository import DefaultDirectoryServer, ServerConfig, DirectoryConfig, DefaultDirectoryService, \
-    DefaultRepositoryCache
+    DefaultRepositoryCache, DefaultPackagePool, DefaultCacheMemory
 from tests import (
     create_test_packages,
     TEST_RESOURCE_ROOT,
@@ -131,7 +132,8 @@ class DirectoryServiceTest(TestCase):
         web_server, cache, config = create_components()
         file_path = REPOSITORY_DIR / 'dists/trixie/info'
         file_content = b'This is a test file.'
-        cache._read_cache['trixie'][file_path] = file_content
+        cache.store('trixie', file_path, file_content)
+        cache.switch('trixie')
 
         with DefaultDirectoryService(web_server, cache, config) as directory_service:
             # When
@@ -154,7 +156,8 @@ class DirectoryServiceTest(TestCase):
         web_server, cache, config = create_components()
         file_path = REPOSITORY_DIR / 'dists/trixie/info.txt'
         file_content = b'This is a test file.'
-        cache._read_cache['trixie'][file_path] = file_content
+        cache.store('trixie', file_path, file_content)
+        cache.switch('trixie')
 
         with DefaultDirectoryService(web_server, cache, config) as directory_service:
             # When
@@ -182,7 +185,8 @@ class DirectoryServiceTest(TestCase):
         buffer = BytesIO()
         with gzip.GzipFile(fileobj=buffer, mode='wb') as gz:
             gz.write(file_content)
-        cache._read_cache['trixie'][compressed_path] = buffer.getvalue()
+        cache.store('trixie', compressed_path, buffer.getvalue())
+        cache.switch('trixie')
 
         with DefaultDirectoryService(web_server, cache, config) as directory_service:
             # When
@@ -201,7 +205,276 @@ class DirectoryServiceTest(TestCase):
             self.assertEqual(200, response.status_code)
             self.assertEqual('gzip', response.headers['Content-Encoding'])
             self.assertEqual('attachment; filename="info.gz"', response.headers['Content-Disposition'])
-            self.assertEqual(cache._read_cache['trixie'][compressed_path], response.data)
+            self.assertEqual(buffer.getvalue(), response.data)
+
+    def test_returns_200_with_immutable_caching_when_accessing_by_hash_file(self):
+        # Given
+        web_server, cache, config = create_components()
+        digest = 'd2a84f4b8b650937ec8f73cd8be2c74add5a911ba64df27458ed8229da804a26'
+        file_path = REPOSITORY_DIR / f'dists/trixie/main/binary-amd64/by-hash/SHA256/{digest}'
+        file_content = b'Package: hello-world'
+        cache.store('trixie', file_path, file_content)
+        cache.switch('trixie')
+
+        with DefaultDirectoryService(web_server, cache, config) as directory_service:
+            # When
+            directory_service.start()
+
+            wait_for_condition(1, lambda: web_server.is_running())
+
+            client = web_server._app.test_client()
+
+            # When
+            response = client.get(f'/dists/trixie/main/binary-amd64/by-hash/SHA256/{digest}')
+
+            # Then
+            self.assertEqual(200, response.status_code)
+            self.assertEqual('public, max-age=31536000, immutable', response.headers['Cache-Control'])
+            self.assertEqual(file_content, response.data)
+
+    def test_serves_client_session_from_pinned_generation(self):
+        # Given
+        web_server, cache, config = create_components()
+        release_path = REPOSITORY_DIR / 'dists/trixie/InRelease'
+        packages_path = REPOSITORY_DIR / 'dists/trixie/main/binary-amd64/Packages'
+        cache.store('trixie', release_path, b'Release 1')
+        cache.store('trixie', packages_path, b'Packages 1')
+        cache.switch('trixie')
+
+        with DefaultDirectoryService(web_server, cache, config) as directory_service:
+            directory_service.start()
+
+            wait_for_condition(1, lambda: web_server.is_running())
+
+            client = web_server._app.test_client()
+            release_response = client.get('/dists/trixie/InRelease', headers={'User-Agent': 'apt'})
+
+            cache.store('trixie', release_path, b'Release 2')
+            cache.store('trixie', packages_path, b'Packages 2')
+            cache.switch('trixie')
+
+            # When
+            pinned_response = client.get('/dists/trixie/main/binary-amd64/Packages', headers={'User-Agent': 'apt'})
+            other_response = client.get('/dists/trixie/main/binary-amd64/Packages', headers={'User-Agent': 'other'})
+
+            # Then
+            self.assertEqual(b'Release 1', release_response.data)
+            self.assertEqual('1', release_response.headers['X-Repository-Generation'])
+            self.assertEqual(b'Packages 1', pinned_response.data)
+            self.assertEqual('1', pinned_response.headers['X-Repository-Generation'])
+            self.assertEqual(b'Packages 2', other_response.data)
+            self.assertEqual('2', other_response.headers['X-Repository-Generation'])
+
+    def test_serves_client_session_of_forwarded_address_from_pinned_generation(self):
+        # Given
+        web_server, cache, config = create_components()
+        config.trusted_proxies = ['127.0.0.1']
+        release_path = REPOSITORY_DIR / 'dists/trixie/InRelease'
+        packages_path = REPOSITORY_DIR / 'dists/trixie/main/binary-amd64/Packages'
+        cache.store('trixie', release_path, b'Release 1')
+        cache.store('trixie', packages_path, b'Packages 1')
+        cache.switch('trixie')
+
+        with DefaultDirectoryService(web_server, cache, config) as directory_service:
+            directory_service.start()
+
+            wait_for_condition(1, lambda: web_server.is_running())
+
+            client = web_server._app.test_client()
+            client.get('/dists/trixie/InRelease', headers={'User-Agent': 'apt', 'X-Forwarded-For': '10.0.0.1'})
+
+            cache.store('trixie', release_path, b'Release 2')
+            cache.store('trixie', packages_path, b'Packages 2')
+            cache.switch('trixie')
+
+            # When
+            pinned_response = client.get('/dists/trixie/main/binary-amd64/Packages',
+                                         headers={'User-Agent': 'apt', 'X-Forwarded-For': '10.0.0.1'})
+            other_response = client.get('/dists/trixie/main/binary-amd64/Packages',
+                                        headers={'User-Agent': 'apt', 'X-Forwarded-For': '10.0.0.2'})
+
+            # Then
+            self.assertEqual(b'Packages 1', pinned_response.data)
+            self.assertEqual(b'Packages 2', other_response.data)
+
+    def test_returns_200_when_accessing_file_of_previous_generation(self):
+        # Given
+        web_server, cache, config = create_components()
+        file_path = REPOSITORY_DIR / 'dists/trixie/main/binary-amd64/Packages.bz2'
+        cache.store('trixie', file_path, b'Previous content')
+        cache.switch('trixie')
+        cache.switch('trixie')
+
+        with DefaultDirectoryService(web_server, cache, config) as directory_service:
+            directory_service.start()
+
+            wait_for_condition(1, lambda: web_server.is_running())
+
+            client = web_server._app.test_client()
+
+            # When
+            response = client.get('/dists/trixie/main/binary-amd64/Packages.bz2')
+
+            # Then
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(b'Previous content', response.data)
+            self.assertEqual('1', response.headers['X-Repository-Generation'])
+
+    def test_returns_304_when_cached_file_matches_etag(self):
+        # Given
+        web_server, cache, config = create_components()
+        file_path = REPOSITORY_DIR / 'dists/trixie/main/binary-amd64/Packages.gz'
+        cache.store('trixie', file_path, b'Packages content')
+        cache.switch('trixie')
+
+        with DefaultDirectoryService(web_server, cache, config) as directory_service:
+            directory_service.start()
+
+            wait_for_condition(1, lambda: web_server.is_running())
+
+            client = web_server._app.test_client()
+            response = client.get('/dists/trixie/main/binary-amd64/Packages.gz')
+
+            # When
+            etag_response = client.get('/dists/trixie/main/binary-amd64/Packages.gz',
+                                       headers={'If-None-Match': response.headers['ETag']})
+            modified_response = client.get('/dists/trixie/main/binary-amd64/Packages.gz',
+                                           headers={'If-Modified-Since': response.headers['Last-Modified']})
+
+            # Then
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(f'"{hashlib.sha256(b"Packages content").hexdigest()}"', response.headers['ETag'])
+            self.assertEqual(304, etag_response.status_code)
+            self.assertEqual(b'', etag_response.data)
+            self.assertEqual(response.headers['ETag'], etag_response.headers['ETag'])
+            self.assertEqual(304, modified_response.status_code)
+
+    def test_returns_200_when_cached_file_does_not_match_etag(self):
+        # Given
+        web_server, cache, config = create_components()
+        file_path = REPOSITORY_DIR / 'dists/trixie/main/binary-amd64/Packages'
+        cache.store('trixie', file_path, b'Packages content')
+        cache.switch('trixie')
+
+        with DefaultDirectoryService(web_server, cache, config) as directory_service:
+            directory_service.start()
+
+            wait_for_condition(1, lambda: web_server.is_running())
+
+            client = web_server._app.test_client()
+
+            # When
+            response = client.get('/dists/trixie/main/binary-amd64/Packages', headers={'If-None-Match': '"stale"'})
+            head_response = client.head('/dists/trixie/main/binary-amd64/Packages')
+
+            # Then
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(b'Packages content', response.data)
+            self.assertEqual(200, head_response.status_code)
+            self.assertEqual(b'', head_response.data)
+            self.assertEqual(str(len(b'Packages content')), head_response.headers['Content-Length'])
+            self.assertEqual(response.headers['ETag'], head_response.headers['ETag'])
+
+    def test_returns_precompressed_variant_matching_accept_encoding(self):
+        # Given
+        web_server, cache, config = create_components()
+        file_path = REPOSITORY_DIR / 'dists/trixie/main/binary-amd64/Packages'
+        file_content = b'Package: hello-world\nVersion: 1.0.0\n\n' * 100
+        cache.store('trixie', file_path, file_content)
+        cache.switch('trixie')
+        wait_for_condition(5, lambda: 'gzip' in cache.resolve('trixie', file_path).variants)
+
+        with DefaultDirectoryService(web_server, cache, config) as directory_service:
+            directory_service.start()
+
+            wait_for_condition(1, lambda: web_server.is_running())
+
+            client = web_server._app.test_client()
+
+            # When
+            gzip_response = client.get('/dists/trixie/main/binary-amd64/Packages',
+                                       headers={'Accept-Encoding': 'gzip, br'})
+            identity_response = client.get('/dists/trixie/main/binary-amd64/Packages')
+
+            # Then
+            self.assertEqual('gzip', gzip_response.headers['Content-Encoding'])
+            self.assertEqual('Accept-Encoding', gzip_response.headers['Vary'])
+            self.assertEqual(file_content, gzip.decompress(gzip_response.data))
+            self.assertNotIn('Content-Encoding', identity_response.headers)
+            self.assertEqual('Accept-Encoding', identity_response.headers['Vary'])
+            self.assertEqual(file_content, identity_response.data)
+            self.assertNotEqual(gzip_response.headers['ETag'], identity_response.headers['ETag'])
+
+    def test_returns_compressed_directory_listing_matching_accept_encoding(self):
+        # Given
+        web_server, cache, config = create_components()
+
+        with DefaultDirectoryService(web_server, cache, config) as directory_service:
+            directory_service.start()
+
+            wait_for_condition(1, lambda: web_server.is_running())
+
+            client = web_server._app.test_client()
+            identity_response = client.get('/')
+
+            # When
+            response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+
+            # Then
+            self.assertEqual(200, response.status_code)
+            self.assertEqual('gzip', response.headers['Content-Encoding'])
+            self.assertEqual('Accept-Encoding', response.headers['Vary'])
+            self.assertEqual(identity_response.data, gzip.decompress(response.data))
+
+    def test_returns_200_when_accessing_spilled_cached_file(self):
+        # Given
+        web_server, cache, config = create_components(DefaultCacheMemory(100, REPOSITORY_DIR / '.cache/spill'))
+        file_path = REPOSITORY_DIR / 'dists/trixie/main/binary-amd64/Packages.xz'
+        file_content = os.urandom(400)
+        cache.store('trixie', file_path, file_content)
+        cache.switch('trixie')
+
+        with DefaultDirectoryService(web_server, cache, config) as directory_service:
+            directory_service.start()
+
+            wait_for_condition(1, lambda: web_server.is_running())
+
+            client = web_server._app.test_client()
+
+            # When
+            response = client.get('/dists/trixie/main/binary-amd64/Packages.xz')
+
+            # Then
+            self.assertEqual(400, cache.get_statistics().spilled_bytes)
+            self.assertEqual(200, response.status_code)
+            self.assertEqual('400', response.headers['Content-Length'])
+            self.assertEqual(file_content, response.data)
+
+    def test_returns_decompressed_cached_file_when_cache_is_compressed_only(self):
+        # Given
+        web_server, cache, config = create_components(compressed_only=True)
+        file_path = REPOSITORY_DIR / 'dists/trixie/main/binary-amd64/Packages'
+        file_content = b'Package: hello-world\nVersion: 1.0.0\n\n' * 100
+        cache.store('trixie', file_path, file_content)
+        cache.store('trixie', file_path.with_name('Packages.gz'), gzip.compress(file_content))
+        cache.switch('trixie')
+
+        with DefaultDirectoryService(web_server, cache, config) as directory_service:
+            directory_service.start()
+
+            wait_for_condition(1, lambda: web_server.is_running())
+
+            client = web_server._app.test_client()
+
+            # When
+            identity_response = client.get('/dists/trixie/main/binary-amd64/Packages')
+            gzip_response = client.get('/dists/trixie/main/binary-amd64/Packages', headers={'Accept-Encoding': 'gzip'})
+
+            # Then
+            self.assertEqual(200, identity_response.status_code)
+            self.assertEqual(file_content, identity_response.data)
+            self.assertEqual('gzip', gzip_response.headers['Content-Encoding'])
+            self.assertEqual(file_content, gzip.decompress(gzip_response.data))
 
     def test_returns_200_when_accessing_private_directory_with_auth(self):
         # Given
@@ -286,6 +559,59 @@ class DirectoryServiceTest(TestCase):
             # Then
             self.assertEqual(401, response.status_code)
 
+    def test_returns_404_when_accessing_hidden_file(self):
+        # Given
+        web_server, cache, config = create_components()
+        create_file(REPOSITORY_DIR / '.cache/packages.db', 'hidden')
+
+        with DefaultDirectoryService(web_server, cache, config) as directory_service:
+            # When
+            directory_service.start()
+
+            wait_for_condition(1, lambda: web_server.is_running())
+
+            client = web_server._app.test_client()
+
+            # When
+            response = client.get('/.cache/packages.db')
+            listing = client.get('/')
+
+            # Then
+            self.assertEqual(404, response.status_code)
+            self.assertNotIn(b'.cache', listing.data)
+
+    def test_returns_200_when_accessing_file_in_pool_root(self):
+        # Given
+        web_server, cache, config = create_components()
+        pool_root = TEST_RESOURCE_ROOT / 'test-pools/second'
+        delete_directory(pool_root)
+        create_file(pool_root / 'trixie/main/sharded.deb', 'sharded')
+        pool = DefaultPackagePool([PACKAGE_DIR, pool_root])
+
+        with DefaultDirectoryService(web_server, cache, config, pool) as directory_service:
+            # When
+            directory_service.start()
+
+            wait_for_condition(1, lambda: web_server.is_running())
+
+            client = web_server._app.test_client()
+
+            # When
+            response = client.get('/pool/trixie/main/sharded.deb')
+            primary = client.get('/pool/trixie/main/hello-world_0.0.1-1_amd64.deb')
+            listing = client.get('/pool/trixie/main/')
+            missing = client.get('/pool/trixie/main/missing.deb')
+
+            # Then
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(b'sharded', response.data)
+            self.assertEqual(200, primary.status_code)
+            self.assertIn(b'sharded.deb', listing.data)
+            self.assertIn(b'hello-world_0.0.1-1_amd64.deb', listing.data)
+            self.assertEqual(404, missing.status_code)
+
+        delete_directory(pool_root)
+
     def test_returns_404_when_accessing_non_existing_path(self):
         # Given
         web_server, cache, config = create_components()
@@ -305,9 +631,9 @@ class DirectoryServiceTest(TestCase):
             self.assertEqual(404, response.status_code)
 
 
-def create_components():
+def create_components(memory=None, compressed_only=False):
     web_server = DefaultDirectoryServer(ServerConfig(['*:0']))
-    cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+    cache = DefaultRepositoryCache({'bookworm', 'trixie'}, memory=memory, compressed_only=compressed_only)
     cache.initialize()
     config = DirectoryConfig(REPOSITORY_DIR, '1.0.0', 'admin', 'admin', [],
                              Path(f'{RESOURCE_ROOT}/templates/directory.j2'))
@@ -0,0 +1,107 @@
+import gzip
+import hashlib
+import re
+import unittest
+from unittest import TestCase
+
+from context_logger import setup_logging
+
+from package_repository import IndexPatch, create_ed_script, create_diff_index
+from tests import APPLICATION_NAME
+
+PREVIOUS = (b'Package: a\nVersion: 1.0\n\n'
+            b'Package: b\nVersion: 1.0\n\n'
+            b'Package: c\nVersion: 1.0\n\n')
+
+
+class IndexDiffTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        setup_logging(APPLICATION_NAME, 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self):
+        print()
+
+    def test_create_ed_script_when_stanza_changed(self):
+        # Given
+        current = PREVIOUS.replace(b'Package: b\nVersion: 1.0\n', b'Package: b\nVersion: 2.0\n')
+
+        # When
+        script = create_ed_script(PREVIOUS, current)
+
+        # Then
+        self.assertEqual(b'4,6c\nPackage: b\nVersion: 2.0\n\n.\n', script)
+        self.assertEqual(current, apply_ed_script(PREVIOUS, script))
+
+    def test_create_ed_script_when_stanzas_added_and_removed(self):
+        # Given
+        current = (b'Package: 0\nVersion: 1.0\n\n'
+                   b'Package: a\nVersion: 1.0\n\n'
+                   b'Package: c\nVersion: 1.0\n\n'
+                   b'Package: d\nVersion: 1.0\nDescription: test\n multi-line\n\n')
+
+        # When
+        script = create_ed_script(PREVIOUS, current)
+
+        # Then
+        self.assertEqual(current, apply_ed_script(PREVIOUS, script))
+
+    def test_create_ed_script_when_previous_is_empty(self):
+        # When
+        script = create_ed_script(b'', PREVIOUS)
+
+        # Then
+        self.assertEqual(PREVIOUS, apply_ed_script(b'', script))
+
+    def test_create_diff_index(self):
+        # Given
+        current = PREVIOUS.replace(b'Version: 1.0\n\nPackage: c', b'Version: 1.1\n\nPackage: c')
+        patch = IndexPatch.create('2024-01-01-1200.00', PREVIOUS, current)
+
+        # When
+        index = create_diff_index(current, [patch])
+
+        # Then
+        self.assertEqual(
+            f'SHA256-Current: {hashlib.sha256(current).hexdigest()} {len(current)}\n'
+            f'SHA256-History:\n'
+            f' {hashlib.sha256(PREVIOUS).hexdigest()} {len(PREVIOUS)} 2024-01-01-1200.00\n'
+            f'SHA256-Patches:\n'
+            f' {patch.sha256} {patch.size} 2024-01-01-1200.00\n'
+            f'SHA256-Download:\n'
+            f' {hashlib.sha256(patch.download).hexdigest()} {len(patch.download)} 2024-01-01-1200.00.gz\n'.encode(),
+            index)
+        self.assertEqual(current, apply_ed_script(PREVIOUS, gzip.decompress(patch.download)))
+
+
+def apply_ed_script(content: bytes, script: bytes) -> bytes:
+    lines = content.splitlines(keepends=True)
+    script_lines = script.splitlines(keepends=True)
+    position = 0
+
+    while position < len(script_lines):
+        match = re.fullmatch(rb'(\d+)(?:,(\d+))?([acd])\n', script_lines[position])
+        assert match, script_lines[position]
+        start = int(match.group(1))
+        end = int(match.group(2) or start)
+        command = match.group(3)
+        position += 1
+
+        added = []
+        if command in (b'a', b'c'):
+            while script_lines[position] != b'.\n':
+                added.append(script_lines[position])
+                position += 1
+            position += 1
+
+        if command == b'a':
+            lines[start:start] = added
+        else:
+            lines[start - 1:end] = added
+
+    return b''.join(lines)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import bz2
+import gzip
+import hashlib
+import lzma
+import unittest
+from unittest import TestCase
+
+from common_utility import delete_directory, create_directory
+from context_logger import setup_logging
+
+from package_repository import IndexFile, IndexWriter, write_index_file, iterate_chunks, compress_content, \
+    decompress_content
+from tests import APPLICATION_NAME, REPOSITORY_DIR
+
+CONTENT = b''.join(f'Package: package-{index}\nVersion: 1.0\n\n'.encode() for index in range(10000))
+
+
+class IndexWriterTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        setup_logging(APPLICATION_NAME, 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self):
+        print()
+        delete_directory(REPOSITORY_DIR)
+        create_directory(REPOSITORY_DIR)
+
+    def test_write_index_file(self):
+        # Given
+        file_path = REPOSITORY_DIR / 'Packages'
+
+        # When
+        index_file = write_index_file(file_path, iterate_chunks(CONTENT, 4096))
+
+        # Then
+        self.assertEqual(CONTENT, file_path.read_bytes())
+        self.assertEqual(CONTENT, index_file.content)
+        self.assertEqual(len(CONTENT), index_file.size)
+        self.assertEqual(hashlib.md5(CONTENT).hexdigest(), index_file.md5)
+        self.assertEqual(hashlib.sha1(CONTENT).hexdigest(), index_file.sha1)
+        self.assertEqual(hashlib.sha256(CONTENT).hexdigest(), index_file.sha256)
+
+    def test_create_index_file_hashes_content(self):
+        # Given
+        file_path = REPOSITORY_DIR / 'Packages'
+
+        # When
+        index_file = IndexFile.create(file_path, CONTENT)
+
+        # Then
+        self.assertEqual(len(CONTENT), index_file.size)
+        self.assertEqual(hashlib.md5(CONTENT).hexdigest(), index_file.md5)
+        self.assertEqual(hashlib.sha1(CONTENT).hexdigest(), index_file.sha1)
+        self.assertEqual(hashlib.sha256(CONTENT).hexdigest(), index_file.sha256)
+
+    def test_write_compressed_index_files(self):
+        for compression, decompress in [('gz', gzip.decompress), ('xz', lzma.decompress), ('bz2', bz2.decompress)]:
+            # Given
+            file_path = REPOSITORY_DIR / f'Packages.{compression}'
+
+            # When
+            index_file = write_index_file(file_path, iterate_chunks(CONTENT, 4096), compression)
+
+            # Then
+            content = file_path.read_bytes()
+            self.assertEqual(content, index_file.content)
+            self.assertEqual(CONTENT, decompress(content))
+            self.assertEqual(hashlib.sha256(content).hexdigest(), index_file.sha256)
+            self.assertEqual(len(content), index_file.size)
+
+    def test_write_index_file_when_failed_keeps_previous_file(self):
+        # Given
+        file_path = REPOSITORY_DIR / 'Packages'
+        file_path.write_bytes(b'previous')
+
+        def failing_chunks():
+            yield b'Package: test\n'
+            raise IOError('Pipe closed')
+
+        # When, Then
+        self.assertRaises(IOError, write_index_file, file_path, failing_chunks())
+        self.assertEqual(b'previous', file_path.read_bytes())
+        self.assertEqual(['Packages'], [path.name for path in REPOSITORY_DIR.iterdir()])
+
+    def test_compress_content_at_higher_level_is_smaller(self):
+        # When
+        fast = compress_content(CONTENT, 'gz', 1)
+        maximum = compress_content(CONTENT, 'gz', 9)
+
+        # Then
+        self.assertEqual(CONTENT, gzip.decompress(fast))
+        self.assertEqual(CONTENT, gzip.decompress(maximum))
+        self.assertLess(len(maximum), len(fast))
+
+    def test_decompress_content_restores_compressed_content(self):
+        # Given
+        compressed = {compression: compress_content(CONTENT, compression) for compression in ['gz', 'xz', 'bz2']}
+
+        # When
+        decompressed = {compression: decompress_content(content, compression)
+                        for compression, content in compressed.items()}
+
+        # Then
+        self.assertEqual({'gz': CONTENT, 'xz': CONTENT, 'bz2': CONTENT}, decompressed)
+
+    def test_create_with_unsupported_compression(self):
+        # When, Then
+        self.assertRaises(ValueError, IndexWriter, REPOSITORY_DIR / 'Packages.lz4', 'lz4')
+
+
+if __name__ == "__main__":
+    unittest.main()
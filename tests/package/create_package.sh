@@ -4,17 +4,19 @@ set -e
 TARGET_DIR=$1
 if [ -z "$TARGET_DIR" ]
 then
-    echo "Usage: $0 <target_dir> <architecture>"
+    echo "Usage: $0 <target_dir> <architecture> [package]"
     exit 1
 fi
 
 ARCHITECTURE=$2
 if [ -z "$ARCHITECTURE" ]
 then
-    echo "Usage: $0 <target_dir> <architecture>"
+    echo "Usage: $0 <target_dir> <architecture> [package]"
     exit 1
 fi
 
+PACKAGE=${3:-hello-world}
+
 # Get directory of this script
 SCRIPT_DIR=$(dirname $0)
 
@@ -40,13 +42,13 @@ int main() {
 EOF
 
 # Create test binary
-mkdir -p "$SCRIPT_DIR"/build/hello-world_0.0.1-1_"$ARCHITECTURE"/usr/bin
-$CC -o "$SCRIPT_DIR"/build/hello-world_0.0.1-1_"$ARCHITECTURE"/usr/bin/hello-world "$SCRIPT_DIR"/hello-world.cpp
+mkdir -p "$SCRIPT_DIR"/build/"$PACKAGE"_0.0.1-1_"$ARCHITECTURE"/usr/bin
+$CC -o "$SCRIPT_DIR"/build/"$PACKAGE"_0.0.1-1_"$ARCHITECTURE"/usr/bin/"$PACKAGE" "$SCRIPT_DIR"/hello-world.cpp
 
 # Create package configuration
-mkdir -p "$SCRIPT_DIR"/build/hello-world_0.0.1-1_"$ARCHITECTURE"/DEBIAN
-cat <<EOF >"$SCRIPT_DIR"/build/hello-world_0.0.1-1_"$ARCHITECTURE"/DEBIAN/control
-Package: hello-world
+mkdir -p "$SCRIPT_DIR"/build/"$PACKAGE"_0.0.1-1_"$ARCHITECTURE"/DEBIAN
+cat <<EOF >"$SCRIPT_DIR"/build/"$PACKAGE"_0.0.1-1_"$ARCHITECTURE"/DEBIAN/control
+Package: $PACKAGE
 Version: 0.0.1
 Maintainer: example <example@example.com>
 Depends: libc6
@@ -56,8 +58,8 @@ Description: A program that prints hello world
 EOF
 
 # Create test package
-dpkg --build "$SCRIPT_DIR"/build/hello-world_0.0.1-1_"$ARCHITECTURE"
+dpkg --build "$SCRIPT_DIR"/build/"$PACKAGE"_0.0.1-1_"$ARCHITECTURE"
 
 # Move test package to target directory
 mkdir -p "$TARGET_DIR"
-mv "$SCRIPT_DIR"/build/hello-world_0.0.1-1_"$ARCHITECTURE".deb "$TARGET_DIR"
+mv "$SCRIPT_DIR"/build/"$PACKAGE"_0.0.1-1_"$ARCHITECTURE".deb "$TARGET_DIR"
@@ -0,0 +1,84 @@
+import unittest
+from pathlib import Path
+from unittest import TestCase
+
+from common_utility import delete_directory, create_file, create_directory
+from context_logger import setup_logging
+
+from package_repository import DefaultPackagePool
+from tests import APPLICATION_NAME, TEST_RESOURCE_ROOT
+
+POOL_ROOT = TEST_RESOURCE_ROOT / 'test-pools'
+FIRST_ROOT = POOL_ROOT / 'first'
+SECOND_ROOT = POOL_ROOT / 'second'
+
+
+class PackagePoolTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        setup_logging(APPLICATION_NAME, 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self):
+        print()
+        delete_directory(POOL_ROOT)
+        create_directory(FIRST_ROOT / 'trixie/main')
+        create_directory(SECOND_ROOT / 'trixie/main')
+
+    def tearDown(self):
+        delete_directory(POOL_ROOT)
+
+    def test_resolve_returns_first_root_containing_path(self):
+        # Given
+        pool = DefaultPackagePool([FIRST_ROOT, SECOND_ROOT])
+        create_file(FIRST_ROOT / 'trixie/main/first.deb', 'first')
+        create_file(SECOND_ROOT / 'trixie/main/second.deb', 'second')
+        create_file(SECOND_ROOT / 'trixie/main/first.deb', 'duplicate')
+
+        # When
+        first = pool.resolve(Path('trixie/main/first.deb'))
+        second = pool.resolve(Path('trixie/main/second.deb'))
+
+        # Then
+        self.assertEqual(FIRST_ROOT, first)
+        self.assertEqual(SECOND_ROOT, second)
+
+    def test_resolve_returns_none_when_path_missing(self):
+        # Given
+        pool = DefaultPackagePool([FIRST_ROOT, SECOND_ROOT])
+
+        # When
+        root = pool.resolve(Path('trixie/main/missing.deb'))
+
+        # Then
+        self.assertIsNone(root)
+
+    def test_resolve_updates_index_when_package_moved_between_roots(self):
+        # Given
+        pool = DefaultPackagePool([FIRST_ROOT, SECOND_ROOT])
+        create_file(FIRST_ROOT / 'trixie/main/package.deb', 'package')
+        pool.resolve(Path('trixie/main/package.deb'))
+        (FIRST_ROOT / 'trixie/main/package.deb').rename(SECOND_ROOT / 'trixie/main/package.deb')
+
+        # When
+        root = pool.resolve(Path('trixie/main/package.deb'))
+
+        # Then
+        self.assertEqual(SECOND_ROOT, root)
+
+    def test_get_directories_returns_directory_from_every_root(self):
+        # Given
+        pool = DefaultPackagePool([FIRST_ROOT, SECOND_ROOT])
+        create_directory(SECOND_ROOT / 'trixie/contrib')
+
+        # When
+        main = pool.get_directories(Path('trixie/main'))
+        contrib = pool.get_directories(Path('trixie/contrib'))
+
+        # Then
+        self.assertEqual([FIRST_ROOT / 'trixie/main', SECOND_ROOT / 'trixie/main'], main)
+        self.assertEqual([SECOND_ROOT / 'trixie/contrib'], contrib)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,209 @@
+import os
+import subprocess
+import unittest
+from pathlib import Path
+from unittest import TestCase, mock
+
+from common_utility import delete_directory, create_directory
+from context_logger import setup_logging
+
+from package_repository import DpkgPackageScanner, NativePackageScanner, SinglePassDpkgPackageScanner, \
+    SqlitePackageStore
+from tests import create_test_packages, create_test_package, REPOSITORY_DIR, PACKAGE_DIR, APPLICATION_NAME
+
+ARCHITECTURES = ['all', 'amd64', 'arm64']
+
+
+class PackageScannerTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        setup_logging(APPLICATION_NAME, 'DEBUG', warn_on_overwrite=False)
+        delete_directory(PACKAGE_DIR)
+        delete_directory(REPOSITORY_DIR)
+        create_test_packages(PACKAGE_DIR, 'trixie')
+        create_test_package(PACKAGE_DIR, 'trixie', 'main', 'all', 'hello-all')
+        create_directory(REPOSITORY_DIR)
+        os.symlink(PACKAGE_DIR, REPOSITORY_DIR / 'pool', target_is_directory=True)
+
+    def setUp(self):
+        print()
+
+    def test_dpkg_scanner_generates_packages_per_architecture(self):
+        # Given
+        scanner = DpkgPackageScanner(REPOSITORY_DIR)
+
+        # When
+        packages = scanner.scan(Path('pool/trixie/main'), ARCHITECTURES)
+
+        # Then
+        self.assertEqual(ARCHITECTURES, list(packages.keys()))
+        self.assertIn(b'Filename: pool/trixie/main/hello-world_0.0.1-1_amd64.deb', packages['amd64'])
+        self.assertIn(b'Filename: pool/trixie/main/hello-all_0.0.1-1_all.deb', packages['amd64'])
+        self.assertNotIn(b'Architecture: arm64', packages['amd64'])
+
+    def test_single_pass_scanner_output_is_identical_to_dpkg_scanner(self):
+        # Given
+        dpkg_scanner = DpkgPackageScanner(REPOSITORY_DIR)
+        single_pass_scanner = SinglePassDpkgPackageScanner(REPOSITORY_DIR)
+
+        # When
+        expected = dpkg_scanner.scan(Path('pool/trixie/main'), ARCHITECTURES)
+        packages = single_pass_scanner.scan(Path('pool/trixie/main'), ARCHITECTURES)
+
+        # Then
+        self.assertEqual(expected, packages)
+
+    def test_single_pass_scanner_runs_dpkg_once(self):
+        # Given
+        scanner = SinglePassDpkgPackageScanner(REPOSITORY_DIR)
+
+        with mock.patch('subprocess.run', wraps=subprocess.run) as run:
+            # When
+            packages = scanner.scan(Path('pool/trixie/main'), ARCHITECTURES)
+
+        # Then
+        run.assert_called_once()
+        self.assertEqual(1, packages['all'].count(b'Package: '))
+        self.assertEqual(2, packages['amd64'].count(b'Package: '))
+        self.assertEqual(2, packages['arm64'].count(b'Package: '))
+
+    def test_native_scanner_output_is_identical_to_dpkg_scanner(self):
+        # Given
+        dpkg_scanner = DpkgPackageScanner(REPOSITORY_DIR)
+        native_scanner = NativePackageScanner(REPOSITORY_DIR)
+
+        # When
+        expected = dpkg_scanner.scan(Path('pool/trixie/main'), ARCHITECTURES)
+        packages = native_scanner.scan(Path('pool/trixie/main'), ARCHITECTURES)
+
+        # Then
+        self.assertEqual(expected, packages)
+
+    def test_native_scanner_fans_out_architecture_all_packages(self):
+        # Given
+        scanner = NativePackageScanner(REPOSITORY_DIR)
+
+        # When
+        packages = scanner.scan(Path('pool/trixie/main'), ARCHITECTURES)
+
+        # Then
+        for architecture in ARCHITECTURES:
+            self.assertIn(b'Architecture: all', packages[architecture])
+        self.assertEqual(1, packages['all'].count(b'Package: '))
+        self.assertEqual(2, packages['amd64'].count(b'Package: '))
+        self.assertEqual(2, packages['arm64'].count(b'Package: '))
+
+    def test_native_scanner_updates_changed_packages_only(self):
+        # Given
+        scanner = NativePackageScanner(REPOSITORY_DIR)
+        package_dir = Path('pool/trixie/main')
+        initial = scanner.scan(package_dir, ARCHITECTURES)
+        create_test_package(PACKAGE_DIR, 'trixie', 'main', 'arm64', 'hello-arm')
+        added_path = package_dir / 'hello-arm_0.0.1-1_arm64.deb'
+
+        with mock.patch.object(scanner, '_create_stanza', wraps=scanner._create_stanza) as create_stanza:
+            # When
+            packages = scanner.scan(package_dir, ARCHITECTURES, {added_path})
+
+        # Then
+        create_stanza.assert_called_once_with(added_path, mock.ANY)
+        self.assertIs(initial['amd64'], packages['amd64'])
+        self.assertIs(initial['all'], packages['all'])
+        self.assertIn(b'Package: hello-arm', packages['arm64'])
+        self.assertEqual(DpkgPackageScanner(REPOSITORY_DIR).scan(package_dir, ARCHITECTURES), packages)
+
+        # When
+        (REPOSITORY_DIR / added_path).unlink()
+        packages = scanner.scan(package_dir, ARCHITECTURES, {added_path})
+
+        # Then
+        self.assertEqual(initial, packages)
+
+    def test_native_scanner_rescans_changed_directory(self):
+        # Given
+        scanner = NativePackageScanner(REPOSITORY_DIR)
+        package_dir = Path('pool/trixie/main')
+        initial = scanner.scan(package_dir, ARCHITECTURES)
+        create_test_package(PACKAGE_DIR, 'trixie', 'main/subdir', 'amd64', 'hello-sub')
+
+        # When
+        packages = scanner.scan(package_dir, ARCHITECTURES, {package_dir / 'subdir'})
+
+        # Then
+        self.assertIn(b'Filename: pool/trixie/main/subdir/hello-sub_0.0.1-1_amd64.deb', packages['amd64'])
+
+        # When
+        delete_directory(PACKAGE_DIR / 'trixie/main/subdir')
+        packages = scanner.scan(package_dir, ARCHITECTURES, {package_dir / 'subdir'})
+
+        # Then
+        self.assertEqual(initial, packages)
+
+    def test_native_scanner_reuses_stored_packages_after_restart(self):
+        # Given
+        store_path = REPOSITORY_DIR / '.cache/packages.db'
+        store_path.unlink(missing_ok=True)
+        scanner = NativePackageScanner(REPOSITORY_DIR, SqlitePackageStore(store_path))
+        scanner.initialize()
+        expected = scanner.scan(Path('pool/trixie/main'), ARCHITECTURES)
+
+        restarted = NativePackageScanner(REPOSITORY_DIR, SqlitePackageStore(store_path))
+        restarted.initialize()
+
+        with mock.patch.object(restarted, '_create_stanza', wraps=restarted._create_stanza) as create_stanza:
+            # When
+            packages = restarted.scan(Path('pool/trixie/main'), ARCHITECTURES)
+
+        # Then
+        create_stanza.assert_not_called()
+        self.assertEqual(expected, packages)
+
+    def test_native_scanner_parses_package_when_fingerprint_changed(self):
+        # Given
+        store_path = REPOSITORY_DIR / '.cache/packages.db'
+        store_path.unlink(missing_ok=True)
+        scanner = NativePackageScanner(REPOSITORY_DIR, SqlitePackageStore(store_path))
+        scanner.initialize()
+        scanner.scan(Path('pool/trixie/main'), ARCHITECTURES)
+        package_path = Path('pool/trixie/main/hello-world_0.0.1-1_amd64.deb')
+        os.utime(REPOSITORY_DIR / package_path)
+
+        restarted = NativePackageScanner(REPOSITORY_DIR, SqlitePackageStore(store_path))
+        restarted.initialize()
+
+        with mock.patch.object(restarted, '_create_stanza', wraps=restarted._create_stanza) as create_stanza:
+            # When
+            restarted.scan(Path('pool/trixie/main'), ARCHITECTURES)
+
+        # Then
+        create_stanza.assert_called_once_with(package_path, mock.ANY)
+
+    def test_native_scanner_skips_invalid_package(self):
+        # Given
+        invalid_path = PACKAGE_DIR / 'trixie/main/invalid_1.0_amd64.deb'
+        invalid_path.write_bytes(b'not a debian package')
+        scanner = NativePackageScanner(REPOSITORY_DIR)
+
+        # When
+        packages = scanner.scan(Path('pool/trixie/main'), ARCHITECTURES)
+
+        # Then
+        invalid_path.unlink()
+        self.assertNotIn(b'invalid', packages['amd64'])
+        self.assertEqual(2, packages['amd64'].count(b'Package: '))
+
+    def test_native_scanner_returns_empty_indices_when_directory_is_empty(self):
+        # Given
+        create_directory(PACKAGE_DIR / 'trixie/empty')
+        scanner = NativePackageScanner(REPOSITORY_DIR)
+
+        # When
+        packages = scanner.scan(Path('pool/trixie/empty'), ARCHITECTURES)
+
+        # Then
+        self.assertEqual({architecture: b'' for architecture in ARCHITECTURES}, packages)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+from pathlib import Path
+from unittest import TestCase
+
+from common_utility import delete_directory
+from context_logger import setup_logging
+
+from package_repository import SqlitePackageStore, StoredPackage, FileFingerprint, ControlStanza, StoredContents
+from tests import APPLICATION_NAME, REPOSITORY_DIR
+
+DATABASE_PATH = REPOSITORY_DIR / '.cache/packages.db'
+
+
+class SqlitePackageStoreTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        setup_logging(APPLICATION_NAME, 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self):
+        print()
+        delete_directory(REPOSITORY_DIR)
+
+    def test_initialize_creates_database(self):
+        # Given
+        store = SqlitePackageStore(DATABASE_PATH)
+
+        # When
+        store.initialize()
+
+        # Then
+        self.assertTrue(DATABASE_PATH.is_file())
+
+    def test_save_and_load(self):
+        # Given
+        store = SqlitePackageStore(DATABASE_PATH)
+        store.initialize()
+        package = create_package('hello-world')
+
+        # When
+        store.save({Path('pool/trixie/main/hello-world_1.0_amd64.deb'): package})
+
+        # Then
+        reopened = SqlitePackageStore(DATABASE_PATH)
+        reopened.initialize()
+        packages = reopened.load(Path('pool/trixie/main'))
+        self.assertEqual([Path('pool/trixie/main/hello-world_1.0_amd64.deb')], list(packages.keys()))
+        stored = packages[Path('pool/trixie/main/hello-world_1.0_amd64.deb')]
+        self.assertEqual(package.fingerprint, stored.fingerprint)
+        self.assertEqual(package.stanza.format(), stored.stanza.format())
+
+    def test_load_matches_path_prefix_only(self):
+        # Given
+        store = SqlitePackageStore(DATABASE_PATH)
+        store.initialize()
+        store.save({
+            Path('pool/trixie/main/a_1.0_amd64.deb'): create_package('a'),
+            Path('pool/trixie/main/sub/b_1.0_amd64.deb'): create_package('b'),
+            Path('pool/trixie/mainX/c_1.0_amd64.deb'): create_package('c'),
+            Path('pool/trixie/main_/d_1.0_amd64.deb'): create_package('d'),
+        })
+
+        # When
+        packages = store.load(Path('pool/trixie/main'))
+
+        # Then
+        self.assertEqual({Path('pool/trixie/main/a_1.0_amd64.deb'), Path('pool/trixie/main/sub/b_1.0_amd64.deb')},
+                         set(packages.keys()))
+        self.assertEqual(1, len(store.load(Path('pool/trixie/main/a_1.0_amd64.deb'))))
+
+    def test_remove(self):
+        # Given
+        store = SqlitePackageStore(DATABASE_PATH)
+        store.initialize()
+        store.save({Path('pool/trixie/main/a_1.0_amd64.deb'): create_package('a')})
+
+        # When
+        store.remove({Path('pool/trixie/main/a_1.0_amd64.deb')})
+
+        # Then
+        self.assertEqual({}, store.load(Path('pool/trixie/main')))
+
+    def test_save_load_and_remove_contents(self):
+        # Given
+        store = SqlitePackageStore(DATABASE_PATH)
+        store.initialize()
+        contents = StoredContents(FileFingerprint(100, 1234567890, 42), 'utils/a', 'amd64',
+                                  ['usr/bin/a', 'usr/share/doc/a/copyright'])
+
+        # When
+        store.save_contents({Path('pool/trixie/main/a_1.0_amd64.deb'): contents})
+
+        # Then
+        self.assertEqual({Path('pool/trixie/main/a_1.0_amd64.deb'): contents},
+                         store.load_contents(Path('pool/trixie/main')))
+        store.remove_contents({Path('pool/trixie/main/a_1.0_amd64.deb')})
+        self.assertEqual({}, store.load_contents(Path('pool/trixie/main')))
+
+    def test_load_when_not_initialized(self):
+        # Given
+        store = SqlitePackageStore(DATABASE_PATH)
+
+        # When, Then
+        self.assertRaises(RuntimeError, store.load, Path('pool'))
+
+
+def create_package(name: str) -> StoredPackage:
+    stanza = ControlStanza.parse(f'Package: {name}\nVersion: 1.0\nArchitecture: amd64\n'.encode())
+    stanza['SHA256'] = 'abc'
+    return StoredPackage(FileFingerprint(100, 1234567890, 42), stanza)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,10 @@
 import unittest
-from unittest import TestCase
+from pathlib import Path
+from unittest import TestCase, mock
 from unittest.mock import MagicMock
 
 from context_logger import setup_logging
-from watchdog.events import FileCreatedEvent
+from watchdog.events import FileCreatedEvent, FileMovedEvent, DirDeletedEvent, DirCreatedEvent
 from watchdog.observers.api import BaseObserver
 
 from package_repository import DefaultPackageWatcher, OnPackageEvent
@@ -82,7 +83,7 @@ class PackageWatcherTest(TestCase):
         watcher.on_created(event)
 
         # Then
-        handler.assert_called_once_with('trixie')
+        handler.assert_called_once_with('trixie', Path('trixie/main/new-package.deb'))
 
     def test_handler_called_when_package_renamed(self):
         # Given
@@ -98,7 +99,58 @@ class PackageWatcherTest(TestCase):
         watcher.on_moved(event)
 
         # Then
-        handler.assert_called_once_with('trixie')
+        handler.assert_called_once_with('trixie', Path('trixie/main/new-package.deb'))
+
+    def test_handler_called_with_both_paths_when_package_moved(self):
+        # Given
+        observer = MagicMock(spec=BaseObserver)
+        watcher = DefaultPackageWatcher(observer, PACKAGE_DIR)
+        handler = MagicMock(spec=OnPackageEvent)
+
+        watcher.register(handler)
+
+        event = FileMovedEvent(PACKAGE_DIR / 'trixie/main/old-package.deb', PACKAGE_DIR / 'trixie/main/new-package.deb')
+
+        # When
+        watcher.on_moved(event)
+
+        # Then
+        handler.assert_has_calls([
+            mock.call('trixie', Path('trixie/main/old-package.deb')),
+            mock.call('trixie', Path('trixie/main/new-package.deb'))
+        ])
+
+    def test_handler_called_when_upload_renamed_to_package(self):
+        # Given
+        observer = MagicMock(spec=BaseObserver)
+        watcher = DefaultPackageWatcher(observer, PACKAGE_DIR)
+        handler = MagicMock(spec=OnPackageEvent)
+
+        watcher.register(handler)
+
+        event = FileMovedEvent(PACKAGE_DIR / 'trixie/main/upload.tmp', PACKAGE_DIR / 'trixie/main/new-package.deb')
+
+        # When
+        watcher.on_moved(event)
+
+        # Then
+        handler.assert_called_once_with('trixie', Path('trixie/main/new-package.deb'))
+
+    def test_handler_called_when_package_directory_removed(self):
+        # Given
+        observer = MagicMock(spec=BaseObserver)
+        watcher = DefaultPackageWatcher(observer, PACKAGE_DIR)
+        handler = MagicMock(spec=OnPackageEvent)
+
+        watcher.register(handler)
+
+        event = DirDeletedEvent(PACKAGE_DIR / 'trixie/main/subdir')
+
+        # When
+        watcher.on_deleted(event)
+
+        # Then
+        handler.assert_called_once_with('trixie', Path('trixie/main/subdir'))
 
     def test_handler_called_when_package_removed(self):
         # Given
@@ -114,7 +166,7 @@ class PackageWatcherTest(TestCase):
         watcher.on_deleted(event)
 
         # Then
-        handler.assert_called_once_with('trixie')
+        handler.assert_called_once_with('trixie', Path('trixie/main/new-package.deb'))
 
     def test_no_operation_when_non_package_file_added(self):
         # Given
@@ -132,6 +184,39 @@ class PackageWatcherTest(TestCase):
         # Then
         handler.assert_not_called()
 
+    def test_handler_called_when_package_added_to_pool_root(self):
+        # Given
+        observer = MagicMock(spec=BaseObserver)
+        pool_root = Path('/mnt/pool')
+        watcher = DefaultPackageWatcher(observer, PACKAGE_DIR, [pool_root])
+        handler = MagicMock(spec=OnPackageEvent)
+
+        watcher.register(handler)
+
+        event = FileCreatedEvent(pool_root / 'trixie/main/new-package.deb')
+
+        # When
+        watcher.on_created(event)
+
+        # Then
+        handler.assert_called_once_with('trixie', Path('trixie/main/new-package.deb'))
+
+    def test_no_operation_when_hidden_directory_changed(self):
+        # Given
+        observer = MagicMock(spec=BaseObserver)
+        watcher = DefaultPackageWatcher(observer, PACKAGE_DIR)
+        handler = MagicMock(spec=OnPackageEvent)
+
+        watcher.register(handler)
+
+        event = DirCreatedEvent(PACKAGE_DIR / '.content-store/ab')
+
+        # When
+        watcher.on_created(event)
+
+        # Then
+        handler.assert_not_called()
+
     def test_error_handled_when_failed_to_parse_distribution(self):
         # Given
         observer = MagicMock(spec=BaseObserver)
@@ -165,8 +250,8 @@ class PackageWatcherTest(TestCase):
         watcher.on_deleted(event)
 
         # Then
-        handler1.assert_called_once_with('trixie')
-        handler2.assert_called_once_with('trixie')
+        handler1.assert_called_once_with('trixie', Path('trixie/main/new-package.deb'))
+        handler2.assert_called_once_with('trixie', Path('trixie/main/new-package.deb'))
 
 
 if __name__ == "__main__":
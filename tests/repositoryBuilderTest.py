@@ -0,0 +1,304 @@
+import os
+import unittest
+from pathlib import Path
+from unittest import TestCase
+from unittest import mock
+from unittest.mock import MagicMock
+
+from context_logger import setup_logging
+
+from package_repository import RepositoryCreator, RepositorySigner, RepositoryCache, DefaultRepositoryCache, \
+    DefaultRepositoryBuilder, ProcessRepositoryBuilder, RepositoryBuildError
+from tests import APPLICATION_NAME
+
+RELEASE_PATH = Path('dists/trixie/Release')
+IN_RELEASE_PATH = Path('dists/trixie/InRelease')
+
+
+class DefaultRepositoryBuilderTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        setup_logging(APPLICATION_NAME, 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self):
+        print()
+
+    def test_initialize(self):
+        # Given
+        creator, signer, cache = create_components()
+        builder = DefaultRepositoryBuilder(creator, signer, cache)
+
+        # When
+        builder.initialize()
+
+        # Then
+        cache.initialize.assert_called_once()
+        creator.initialize.assert_called_once()
+        signer.initialize.assert_called_once()
+
+    def test_build(self):
+        # Given
+        creator, signer, cache = create_components()
+        builder = DefaultRepositoryBuilder(creator, signer, cache)
+
+        # When
+        changed = builder.build('trixie', {Path('trixie/main/new-package.deb')})
+
+        # Then
+        self.assertTrue(changed)
+        creator.create.assert_called_once_with('trixie', {Path('trixie/main/new-package.deb')})
+        signer.sign.assert_called_once_with('trixie')
+        signer.verify.assert_called_once_with('trixie')
+        cache.switch.assert_called_once_with('trixie')
+        cache.revert.assert_not_called()
+        creator.commit.assert_called_once_with('trixie')
+
+    def test_build_skips_publish_when_repository_unchanged(self):
+        # Given
+        creator, signer, cache = create_components()
+        creator.create.return_value = False
+        builder = DefaultRepositoryBuilder(creator, signer, cache)
+
+        # When
+        changed = builder.build('trixie')
+
+        # Then
+        self.assertFalse(changed)
+        cache.discard.assert_called_once_with('trixie')
+        signer.sign.assert_not_called()
+        cache.switch.assert_not_called()
+
+    def test_recompress_publishes_recompressed_generation(self):
+        # Given
+        creator, signer, cache = create_components()
+        builder = DefaultRepositoryBuilder(creator, signer, cache)
+
+        # When
+        changed = builder.recompress('trixie')
+
+        # Then
+        self.assertTrue(changed)
+        creator.recompress.assert_called_once_with('trixie')
+        creator.create.assert_called_once_with('trixie', set())
+        signer.sign.assert_called_once_with('trixie')
+        cache.switch.assert_called_once_with('trixie')
+
+    def test_recompress_skips_publish_when_nothing_recompressed(self):
+        # Given
+        creator, signer, cache = create_components()
+        creator.recompress.return_value = False
+        builder = DefaultRepositoryBuilder(creator, signer, cache)
+
+        # When
+        changed = builder.recompress('trixie')
+
+        # Then
+        self.assertFalse(changed)
+        creator.create.assert_not_called()
+        cache.switch.assert_not_called()
+
+    def test_build_discards_pending_generation_when_signing_failed(self):
+        # Given
+        creator, signer, cache = create_components()
+        signer.sign.side_effect = Exception('Signing failed')
+        builder = DefaultRepositoryBuilder(creator, signer, cache)
+
+        # When, Then
+        self.assertRaises(Exception, builder.build, 'trixie')
+        cache.discard.assert_called_once_with('trixie')
+        cache.switch.assert_not_called()
+        creator.revert.assert_called_once_with('trixie')
+
+    def test_build_reverts_published_generation_when_verification_failed(self):
+        # Given
+        creator, signer, cache = create_components()
+        signer.verify.side_effect = Exception('Verification failed')
+        builder = DefaultRepositoryBuilder(creator, signer, cache)
+
+        # When, Then
+        self.assertRaises(Exception, builder.build, 'trixie')
+        signer.verify.assert_called_once_with('trixie')
+        cache.switch.assert_called_once_with('trixie')
+        cache.revert.assert_called_once_with('trixie')
+        creator.revert.assert_called_once_with('trixie')
+        creator.commit.assert_not_called()
+
+
+class ProcessRepositoryBuilderTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        setup_logging(APPLICATION_NAME, 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self):
+        print()
+
+    def test_build_replaces_cache_with_generation_built_in_process(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        builder = ProcessRepositoryBuilder(cache, {'bookworm', 'trixie'}, create_test_components)
+        builder.initialize()
+
+        try:
+            # When
+            changed = builder.build('trixie')
+
+            # Then
+            self.assertTrue(changed)
+            release = cache.load('trixie', RELEASE_PATH)
+            self.assertNotEqual(str(os.getpid()).encode(), release)
+            self.assertEqual(b'signed ' + release, cache.load('trixie', IN_RELEASE_PATH))
+        finally:
+            builder.shutdown()
+
+    def test_build_keeps_published_generation_when_unchanged(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        builder = ProcessRepositoryBuilder(cache, {'bookworm', 'trixie'}, create_test_components)
+        builder.initialize()
+
+        try:
+            builder.build('trixie')
+            published = cache.load('trixie', RELEASE_PATH)
+
+            # When
+            changed = builder.build('trixie', {Path('unchanged')})
+
+            # Then
+            self.assertFalse(changed)
+            self.assertEqual(published, cache.load('trixie', RELEASE_PATH))
+        finally:
+            builder.shutdown()
+
+    def test_recompress_replaces_cache_with_generation_recompressed_in_process(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        builder = ProcessRepositoryBuilder(cache, {'bookworm', 'trixie'}, create_test_components)
+        builder.initialize()
+
+        try:
+            builder.build('trixie')
+
+            # When
+            changed = builder.recompress('trixie')
+
+            # Then
+            self.assertTrue(changed)
+            self.assertEqual(b'recompressed', cache.load('trixie', RELEASE_PATH))
+            self.assertIsNotNone(cache.load('trixie', IN_RELEASE_PATH))
+        finally:
+            builder.shutdown()
+
+    def test_recompress_sends_only_changed_files_from_process(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        builder = ProcessRepositoryBuilder(cache, {'bookworm', 'trixie'}, create_test_components)
+        builder.initialize()
+
+        try:
+            builder.build('trixie')
+
+            with mock.patch.object(cache, 'patch', wraps=cache.patch) as patch:
+                # When
+                builder.recompress('trixie')
+
+            # Then
+            patch.assert_called_once_with('trixie', {RELEASE_PATH: b'recompressed'}, set())
+            self.assertIsNotNone(cache.load('trixie', IN_RELEASE_PATH))
+        finally:
+            builder.shutdown()
+
+    def test_build_raises_error_when_build_failed(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        builder = ProcessRepositoryBuilder(cache, {'bookworm', 'trixie'}, create_test_components)
+        builder.initialize()
+
+        try:
+            # When, Then
+            self.assertRaises(RepositoryBuildError, builder.build, 'trixie', {Path('failing')})
+            self.assertTrue(builder.build('trixie'))
+        finally:
+            builder.shutdown()
+
+    def test_build_restarts_terminated_process(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        builder = ProcessRepositoryBuilder(cache, {'bookworm', 'trixie'}, create_test_components)
+        builder.initialize()
+        builder._process.kill()
+        builder._process.join()
+
+        try:
+            # When
+            changed = builder.build('trixie')
+
+            # Then
+            self.assertTrue(changed)
+        finally:
+            builder.shutdown()
+
+
+class StubCreator(RepositoryCreator):
+
+    def __init__(self, cache: RepositoryCache) -> None:
+        self._cache = cache
+        self._recompressed = False
+
+    def initialize(self) -> None:
+        pass
+
+    def recompress(self, distribution: str) -> bool:
+        self._recompressed = True
+        return True
+
+    def commit(self, distribution: str) -> None:
+        pass
+
+    def revert(self, distribution: str) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        pass
+
+    def create(self, distribution: str, changed_paths: set[Path] | None = None) -> bool:
+        if changed_paths == {Path('failing')}:
+            raise Exception('Creation failed')
+
+        if changed_paths == {Path('unchanged')}:
+            return False
+
+        release = b'recompressed' if self._recompressed else str(os.getpid()).encode()
+        self._cache.store(distribution, RELEASE_PATH, release)
+        return True
+
+
+class StubSigner(RepositorySigner):
+
+    def __init__(self, cache: RepositoryCache) -> None:
+        self._cache = cache
+
+    def initialize(self) -> None:
+        pass
+
+    def sign(self, distribution: str) -> None:
+        self._cache.store(distribution, IN_RELEASE_PATH, b'signed ' + str(os.getpid()).encode())
+
+    def verify(self, distribution: str) -> None:
+        pass
+
+
+def create_test_components(cache: RepositoryCache) -> tuple[RepositoryCreator, RepositorySigner]:
+    return StubCreator(cache), StubSigner(cache)
+
+
+def create_components():
+    creator = MagicMock(spec=RepositoryCreator)
+    signer = MagicMock(spec=RepositorySigner)
+    cache = MagicMock(spec=RepositoryCache)
+    return creator, signer, cache
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,16 @@
+import gzip
+import hashlib
+import os
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from unittest import TestCase
 
 from context_logger import setup_logging
+from test_utility import wait_for_condition
 
-from package_repository import DefaultRepositoryCache
-from tests import APPLICATION_NAME
+from package_repository import DefaultRepositoryCache, DefaultCacheMemory
+from tests import APPLICATION_NAME, REPOSITORY_DIR
 
 
 class DefaultRepositoryCacheTest(TestCase):
@@ -27,8 +32,8 @@ class DefaultRepositoryCacheTest(TestCase):
         # Then
         self.assertIsNotNone(cache._write_cache.get('trixie'))
         self.assertIsNotNone(cache._write_cache.get('bookworm'))
-        self.assertIsNotNone(cache._read_cache.get('trixie'))
-        self.assertIsNotNone(cache._read_cache.get('bookworm'))
+        self.assertEqual(0, cache.get_generation('trixie'))
+        self.assertEqual(0, cache.get_generation('bookworm'))
 
     def test_store(self):
         # Given
@@ -39,7 +44,7 @@ class DefaultRepositoryCacheTest(TestCase):
         cache.store('trixie', Path('test.txt'), b'Test content')
 
         # Then
-        self.assertEqual(b'Test content', cache._write_cache.get('trixie').get(Path('test.txt')))
+        self.assertEqual(b'Test content', cache._write_cache.get('trixie').get(Path('test.txt')).content)
 
     def test_store_when_distribution_is_invalid(self):
         # Given
@@ -56,7 +61,8 @@ class DefaultRepositoryCacheTest(TestCase):
         # Given
         cache = DefaultRepositoryCache({'bookworm', 'trixie'})
         cache.initialize()
-        cache._read_cache['trixie'][Path('test.txt')] = b'Test content'
+        cache.store('trixie', Path('test.txt'), b'Test content')
+        cache.switch('trixie')
 
         # When
         content = cache.load('trixie', Path('test.txt'))
@@ -79,27 +85,308 @@ class DefaultRepositoryCacheTest(TestCase):
         # Given
         cache = DefaultRepositoryCache({'bookworm', 'trixie'})
         cache.initialize()
-        cache._write_cache['trixie'][Path('test.txt')] = b'Test content'
+        cache.store('trixie', Path('test.txt'), b'Test content')
 
         # When
         cache.switch('trixie')
 
         # Then
-        self.assertEqual(b'Test content', cache._read_cache.get('trixie').get(Path('test.txt')))
+        self.assertEqual(b'Test content', cache.load('trixie', Path('test.txt')))
         self.assertIsNone(cache._write_cache.get('trixie').get(Path('test.txt')))
 
     def test_switch_when_distribution_is_invalid(self):
         # Given
         cache = DefaultRepositoryCache({'bookworm', 'trixie'})
         cache.initialize()
-        cache._write_cache['trixie'][Path('test.txt')] = b'Test content'
+        cache.store('trixie', Path('test.txt'), b'Test content')
 
         # When
         cache.switch('invalid')
 
         # Then
-        self.assertIsNone(cache._read_cache.get('trixie').get(Path('test.txt')))
-        self.assertEqual(b'Test content', cache._write_cache.get('trixie').get(Path('test.txt')))
+        self.assertIsNone(cache.load('trixie', Path('test.txt')))
+        self.assertEqual(b'Test content', cache._write_cache.get('trixie').get(Path('test.txt')).content)
+
+    def test_discard(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        cache.initialize()
+        cache.store('trixie', Path('test.txt'), b'Published content')
+        cache.switch('trixie')
+        cache.store('trixie', Path('test.txt'), b'Test content')
+
+        # When
+        cache.discard('trixie')
+
+        # Then
+        self.assertEqual(b'Published content', cache.load('trixie', Path('test.txt')))
+        self.assertIsNone(cache._write_cache.get('trixie').get(Path('test.txt')))
+
+    def test_revert(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        cache.initialize()
+        cache.store('trixie', Path('test.txt'), b'Published content')
+        cache.switch('trixie')
+        cache.store('trixie', Path('test.txt'), b'Test content')
+        cache.switch('trixie')
+
+        # When
+        cache.revert('trixie')
+
+        # Then
+        self.assertEqual(b'Published content', cache.load('trixie', Path('test.txt')))
+        self.assertIsNone(cache._write_cache.get('trixie').get(Path('test.txt')))
+
+    def test_resolve_prefers_pinned_generation(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        cache.initialize()
+        cache.store('trixie', Path('test.txt'), b'First content')
+        cache.switch('trixie')
+        cache.store('trixie', Path('test.txt'), b'Second content')
+        cache.switch('trixie')
+
+        # When
+        pinned = cache.resolve('trixie', Path('test.txt'), 1)
+        current = cache.resolve('trixie', Path('test.txt'))
+
+        # Then
+        self.assertEqual((1, b'First content'), (pinned.generation, pinned.content))
+        self.assertEqual((2, b'Second content'), (current.generation, current.content))
+        self.assertEqual(2, cache.get_generation('trixie'))
+
+    def test_resolve_ignores_expired_generation(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'}, generation_retention=0)
+        cache.initialize()
+        cache.store('trixie', Path('test.txt'), b'First content')
+        cache.switch('trixie')
+        cache.switch('trixie')
+
+        # When
+        content = cache.resolve('trixie', Path('test.txt'), 1)
+
+        # Then
+        self.assertIsNone(content)
+
+    def test_switch_keeps_bounded_generation_history(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'}, generation_history=2)
+        cache.initialize()
+
+        # When
+        for index in range(5):
+            cache.store('trixie', Path(f'test{index}.txt'), b'Test content')
+            cache.switch('trixie')
+
+        # Then
+        self.assertEqual([5, 4, 3], [generation.id for generation in cache._generations['trixie']])
+        self.assertIsNone(cache.resolve('trixie', Path('test1.txt')))
+        self.assertEqual(3, cache.resolve('trixie', Path('test2.txt')).generation)
+
+    def test_resolve_returns_validators_kept_while_content_unchanged(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        cache.initialize()
+        cache.store('trixie', Path('test.txt'), b'Test content')
+        cache.switch('trixie')
+        first = cache.resolve('trixie', Path('test.txt'))
+        cache.store('trixie', Path('test.txt'), b'Test content')
+        cache.switch('trixie')
+
+        # When
+        unchanged = cache.resolve('trixie', Path('test.txt'))
+        cache.store('trixie', Path('test.txt'), b'Changed content')
+        cache.switch('trixie')
+        changed = cache.resolve('trixie', Path('test.txt'))
+
+        # Then
+        self.assertEqual(hashlib.sha256(b'Test content').hexdigest(), first.etag)
+        self.assertEqual((2, first.etag, first.modified), (unchanged.generation, unchanged.etag, unchanged.modified))
+        self.assertEqual(hashlib.sha256(b'Changed content').hexdigest(), changed.etag)
+        self.assertGreaterEqual(changed.modified, first.modified)
+
+    def test_switch_creates_compressed_variants_of_uncompressed_files(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        cache.initialize()
+        content = b'Package: hello-world\nVersion: 1.0.0\n\n' * 100
+        cache.store('trixie', Path('Packages'), content)
+        cache.store('trixie', Path('Packages.gz'), gzip.compress(content))
+
+        # When
+        cache.switch('trixie')
+
+        # Then
+        wait_for_condition(5, lambda: 'zstd' in cache.resolve('trixie', Path('Packages')).variants)
+        variants = cache.resolve('trixie', Path('Packages')).variants
+        self.assertEqual(['zstd', 'gzip'], list(variants))
+        self.assertEqual(content, gzip.decompress(variants['gzip'].content))
+        self.assertEqual({}, cache.resolve('trixie', Path('Packages.gz')).variants)
+
+    def test_resolve_serves_spilled_content_within_memory_budget(self):
+        # Given
+        memory = DefaultCacheMemory(1000, REPOSITORY_DIR / '.cache/spill')
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'}, memory=memory)
+        cache.initialize()
+        contents = {Path(f'test{index}.txt'): os.urandom(400) for index in range(5)}
+        for path, content in contents.items():
+            cache.store('trixie', path, content)
+
+        # When
+        cache.switch('trixie')
+
+        # Then
+        statistics = cache.get_statistics()
+        self.assertLessEqual(statistics.resident_bytes, 1000)
+        self.assertEqual(2000, statistics.resident_bytes + statistics.spilled_bytes)
+        for path, content in contents.items():
+            self.assertEqual(content, bytes(cache.resolve('trixie', path).content))
+            self.assertEqual(content, cache.load('trixie', path))
+
+    def test_patch_publishes_changed_files_over_current_generation(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        cache.initialize()
+        cache.replace('trixie', {Path('changed.txt'): b'First content', Path('unchanged.txt'): b'Unchanged content',
+                                 Path('removed.txt'): b'Removed content'})
+        unchanged = cache.resolve('trixie', Path('unchanged.txt'))
+
+        # When
+        cache.patch('trixie', {Path('changed.txt'): b'Second content'}, {Path('removed.txt')})
+
+        # Then
+        self.assertEqual({Path('changed.txt'): b'Second content', Path('unchanged.txt'): b'Unchanged content'},
+                         cache.export('trixie'))
+        self.assertEqual(unchanged.etag, cache.resolve('trixie', Path('unchanged.txt')).etag)
+        self.assertEqual(unchanged.modified, cache.resolve('trixie', Path('unchanged.txt')).modified)
+        self.assertEqual(2, cache.resolve('trixie', Path('unchanged.txt')).generation)
+
+    def test_switch_releases_memory_of_expired_generations(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'}, generation_retention=0)
+        cache.initialize()
+        cache.store('trixie', Path('test.txt'), b'First content')
+        cache.switch('trixie')
+        cache.store('trixie', Path('test.txt'), b'Second content')
+        cache.switch('trixie')
+
+        # When
+        cache.store('trixie', Path('test.txt'), b'Third content')
+        cache.switch('trixie')
+
+        # Then
+        self.assertEqual(len(b'Second content') + len(b'Third content'), cache.get_statistics().resident_bytes)
+
+    def test_store_deduplicates_identical_content_across_paths_and_distributions(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        cache.initialize()
+        cache.store('trixie', Path('main/binary-all/Packages'), b'Test content')
+        cache.store('trixie', Path('main/binary-amd64/Packages'), b'Test content')
+        cache.store('bookworm', Path('main/binary-all/Packages'), b'Test content')
+
+        # When
+        cache.switch('trixie')
+        cache.switch('bookworm')
+
+        # Then
+        self.assertEqual(len(b'Test content'), cache.get_statistics().resident_bytes)
+        self.assertEqual(b'Test content', cache.load('bookworm', Path('main/binary-all/Packages')))
+        self.assertEqual(b'Test content', cache.load('trixie', Path('main/binary-amd64/Packages')))
+
+    def test_store_while_other_distribution_switches_keeps_stored_content(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'}, content_variants=False)
+        cache.initialize()
+
+        def store_packages():
+            for index in range(1000):
+                cache.store('bookworm', Path(f'Packages-{index}'), f'Packages {index}'.encode())
+
+        # When
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            stored = executor.submit(store_packages)
+
+            while not stored.done():
+                cache.store('trixie', Path('Release'), os.urandom(16))
+                cache.switch('trixie')
+
+            stored.result()
+
+        cache.switch('bookworm')
+
+        # Then
+        self.assertEqual(1000, len(cache.export('bookworm')))
+        self.assertEqual(b'Packages 999', cache.load('bookworm', Path('Packages-999')))
+
+    def test_switch_reuses_compressed_file_as_variant_of_uncompressed_file(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        cache.initialize()
+        content = b'Package: hello-world\nVersion: 1.0.0\n\n' * 100
+        cache.store('trixie', Path('Packages'), content)
+        cache.store('trixie', Path('Packages.gz'), gzip.compress(content))
+
+        # When
+        cache.switch('trixie')
+
+        # Then
+        variants = cache.resolve('trixie', Path('Packages')).variants
+        self.assertIs(cache.resolve('trixie', Path('Packages.gz')).blob, variants['gzip'])
+
+    def test_switch_without_content_variants_reuses_only_compressed_files(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'}, content_variants=False)
+        cache.initialize()
+        content = b'Package: hello-world\nVersion: 1.0.0\n\n' * 100
+        cache.store('trixie', Path('Packages'), content)
+        cache.store('trixie', Path('Packages.gz'), gzip.compress(content))
+
+        # When
+        cache.switch('trixie')
+        cache.shutdown()
+
+        # Then
+        self.assertEqual(['gzip'], list(cache.resolve('trixie', Path('Packages')).variants))
+
+    def test_resolve_decompresses_uncompressed_file_when_compressed_only(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'}, compressed_only=True)
+        cache.initialize()
+        content = b'Package: hello-world\nVersion: 1.0.0\n\n' * 100
+        compressed = gzip.compress(content)
+        cache.store('trixie', Path('Packages'), content)
+        cache.store('trixie', Path('Packages.gz'), compressed)
+        cache.switch('trixie')
+
+        # When
+        cached_file = cache.resolve('trixie', Path('Packages'))
+
+        # Then
+        self.assertEqual(content, bytes(cached_file.content))
+        self.assertIsNone(cached_file.compression)
+        self.assertEqual(hashlib.sha256(content).hexdigest(), cached_file.etag)
+        self.assertEqual(content, cache.load('trixie', Path('Packages')))
+        self.assertEqual(content, cache.export('trixie')[Path('Packages')])
+        self.assertEqual(compressed, cache.load('trixie', Path('Packages.gz')))
+        self.assertNotIn(content, [blob.content for blob in cache._blobs.values()])
+
+    def test_switch_keeps_uncompressed_file_when_compressed_file_differs(self):
+        # Given
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'}, compressed_only=True)
+        cache.initialize()
+        cache.store('trixie', Path('Packages'), b'Test content')
+        cache.store('trixie', Path('Packages.gz'), gzip.compress(b'Other content'))
+
+        # When
+        cache.switch('trixie')
+
+        # Then
+        cached_file = cache.resolve('trixie', Path('Packages'))
+        self.assertEqual(b'Test content', cached_file.content)
+        self.assertEqual({}, cached_file.variants)
 
 
 if __name__ == "__main__":
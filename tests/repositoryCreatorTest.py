@@ -1,16 +1,26 @@
+import bz2
 import gzip
+import hashlib
+import lzma
 import os
+import shutil
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase
+from pathlib import Path
+from unittest import mock
 from unittest.mock import MagicMock
 
 from common_utility import delete_directory, render_template_file, create_directory
 from context_logger import setup_logging
 from test_utility import compare_lines
 
-from package_repository import RepositoryConfig, DefaultRepositoryCreator, RepositoryCache, ReleaseInfo
+from package_repository import RepositoryConfig, DefaultRepositoryCreator, RepositoryCache, ReleaseInfo, \
+    NativePackageScanner, DefaultContentsGenerator, DefaultRepositoryCache, PackageScanner, RetentionPolicy, \
+    evaluate_retention_policy
 from tests import (
     create_test_packages,
+    create_test_package,
     TEST_RESOURCE_ROOT,
     REPOSITORY_DIR,
     RESOURCE_ROOT, PACKAGE_DIR, APPLICATION_NAME, RELEASE_TEMPLATE_PATH
@@ -94,6 +104,105 @@ class RepositoryCreatorTest(TestCase):
             all_matches_gz = compare_lines(packages, gz_packages)
             self.assertTrue(all_matches_gz)
 
+    def test_create_with_native_scanner_assert_packages_files_identical(self):
+        # Given
+        cache, config, info = create_components()
+        creator = DefaultRepositoryCreator(cache, config, info)
+        creator.initialize()
+        creator.create('trixie')
+
+        expected = {}
+        for architecture in ['all', 'amd64', 'arm64']:
+            with open(f'{REPOSITORY_DIR}/dists/trixie/main/binary-{architecture}/Packages', 'rb') as file:
+                expected[architecture] = file.read()
+
+        native_creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+
+        # When
+        native_creator.create('trixie')
+
+        # Then
+        for architecture in ['all', 'amd64', 'arm64']:
+            with open(f'{REPOSITORY_DIR}/dists/trixie/main/binary-{architecture}/Packages', 'rb') as file:
+                self.assertEqual(expected[architecture], file.read())
+
+    def test_create_with_changed_paths_regenerates_affected_packages_files_only(self):
+        # Given
+        cache, config, info = create_components()
+        creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+        creator.initialize()
+        creator.create('trixie')
+        create_test_package(PACKAGE_DIR, 'trixie', 'main', 'arm64', 'hello-arm')
+
+        with mock.patch.object(creator, '_create_file', wraps=creator._create_file) as create_file:
+            # When
+            creator.create('trixie', {Path('trixie/main/hello-arm_0.0.1-1_arm64.deb')})
+
+        # Then
+        packages_path = REPOSITORY_DIR / 'dists/trixie/main/binary-arm64/Packages'
+        create_file.assert_has_calls([
+            mock.call('trixie', packages_path, mock.ANY),
+            mock.call('trixie', Path(f'{packages_path}.gz'), mock.ANY, 'gz', None),
+            mock.call('trixie', REPOSITORY_DIR / 'dists/trixie/Release', mock.ANY)
+        ], any_order=True)
+        self.assertEqual(3, create_file.call_count)
+        with open(packages_path, 'rb') as file:
+            self.assertIn(b'Package: hello-arm', file.read())
+        self.assertEqual(28, cache.store.call_count)
+
+    def test_create_does_not_change_working_directory(self):
+        # Given
+        cache, config, info = create_components()
+        creator = DefaultRepositoryCreator(cache, config, info)
+        creator.initialize()
+        current_dir = os.getcwd()
+
+        # When
+        creator.create('trixie')
+
+        # Then
+        self.assertEqual(current_dir, os.getcwd())
+
+    def test_create_with_build_workers_assert_packages_files_identical(self):
+        # Given
+        cache, config, info = create_components()
+        creator = DefaultRepositoryCreator(cache, config, info)
+        creator.initialize()
+        creator.create('trixie')
+
+        expected = {}
+        for architecture in ['all', 'amd64', 'arm64']:
+            with open(f'{REPOSITORY_DIR}/dists/trixie/main/binary-{architecture}/Packages', 'rb') as file:
+                expected[architecture] = file.read()
+
+        config.build_workers = 4
+        parallel_creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+
+        # When
+        parallel_creator.create('trixie')
+
+        # Then
+        for architecture in ['all', 'amd64', 'arm64']:
+            with open(f'{REPOSITORY_DIR}/dists/trixie/main/binary-{architecture}/Packages', 'rb') as file:
+                self.assertEqual(expected[architecture], file.read())
+
+    def test_create_distributions_concurrently(self):
+        # Given
+        cache, config, info = create_components()
+        config.build_workers = 4
+        creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+        creator.initialize()
+
+        # When
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(creator.create, ['bookworm', 'trixie']))
+
+        # Then
+        for distribution in ['bookworm', 'trixie']:
+            self.assertTrue(os.path.isfile(f'{REPOSITORY_DIR}/dists/{distribution}/Release'))
+            with open(f'{REPOSITORY_DIR}/dists/{distribution}/main/binary-amd64/Packages', 'rb') as file:
+                self.assertIn(f'Filename: pool/{distribution}/main/'.encode(), file.read())
+
     def test_create_assert_release_file_generated(self):
         # Given
         expected_release = render_template_file(
@@ -109,7 +218,8 @@ class RepositoryCreatorTest(TestCase):
                 'components': 'main',
                 'md5_checksums': 'Packages',
                 'sha1_checksums': 'Packages',
-                'sha256_checksums': 'Packages'
+                'sha256_checksums': 'Packages',
+                'acquire_by_hash': True
             },
         ).splitlines()
 
@@ -131,6 +241,522 @@ class RepositoryCreatorTest(TestCase):
         all_matches = compare_lines(expected_release, release, exclusions)
         self.assertTrue(all_matches)
 
+    def test_create_release_checksums_match_index_files(self):
+        # Given
+        cache, config, info = create_components()
+        creator = DefaultRepositoryCreator(cache, config, info)
+        creator.initialize()
+
+        # When
+        creator.create('trixie')
+
+        # Then
+        dist_path = REPOSITORY_DIR / 'dists/trixie'
+        with open(dist_path / 'Release', 'r') as file:
+            release = file.read()
+
+        for file_path in dist_path.glob('*/binary-*/Packages*'):
+            content = file_path.read_bytes()
+            entry = f'{len(content)} {file_path.relative_to(dist_path).as_posix()}'
+            self.assertIn(f' {hashlib.md5(content).hexdigest()} {entry}', release)
+            self.assertIn(f' {hashlib.sha1(content).hexdigest()} {entry}', release)
+            self.assertIn(f' {hashlib.sha256(content).hexdigest()} {entry}', release)
+
+    def test_create_with_compressions_assert_compressed_files_generated(self):
+        # Given
+        cache, config, info = create_components()
+        config.compressions = {'gz': 1, 'xz': None, 'bz2': 9}
+        creator = DefaultRepositoryCreator(cache, config, info)
+        creator.initialize()
+
+        # When
+        creator.create('trixie')
+
+        # Then
+        packages_path = REPOSITORY_DIR / 'dists/trixie/main/binary-amd64/Packages'
+        content = packages_path.read_bytes()
+        self.assertEqual(content, gzip.decompress(Path(f'{packages_path}.gz').read_bytes()))
+        self.assertEqual(content, lzma.decompress(Path(f'{packages_path}.xz').read_bytes()))
+        self.assertEqual(content, bz2.decompress(Path(f'{packages_path}.bz2').read_bytes()))
+
+        release = (REPOSITORY_DIR / 'dists/trixie/Release').read_text()
+        for extension in ['gz', 'xz', 'bz2']:
+            self.assertIn(f'main/binary-amd64/Packages.{extension}\n', release)
+
+    def test_create_without_compressions_assert_only_plain_files_listed(self):
+        # Given
+        cache, config, info = create_components()
+        config.compressions = {}
+        creator = DefaultRepositoryCreator(cache, config, info)
+        creator.initialize()
+
+        # When
+        creator.create('trixie')
+
+        # Then
+        release = (REPOSITORY_DIR / 'dists/trixie/Release').read_text()
+        self.assertIn('main/binary-amd64/Packages\n', release)
+        self.assertNotIn('main/binary-amd64/Packages.gz', release)
+
+    def test_create_with_unsupported_compression_raises_error(self):
+        # Given
+        cache, config, info = create_components()
+        config.compressions = {'lz4': None}
+
+        # When, Then
+        with self.assertRaises(ValueError):
+            DefaultRepositoryCreator(cache, config, info)
+
+    def test_create_publishes_index_files_by_hash(self):
+        # Given
+        cache, config, info = create_components()
+        creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+        creator.initialize()
+
+        # When
+        creator.create('trixie')
+
+        # Then
+        arch_dir = REPOSITORY_DIR / 'dists/trixie/main/binary-amd64'
+        for file_name in ['Packages', 'Packages.gz']:
+            content = (arch_dir / file_name).read_bytes()
+            by_hash_path = arch_dir / 'by-hash/SHA256' / hashlib.sha256(content).hexdigest()
+            self.assertEqual(content, by_hash_path.read_bytes())
+            cache.store.assert_any_call('trixie', by_hash_path, content)
+        self.assertIn('Acquire-By-Hash: yes', (REPOSITORY_DIR / 'dists/trixie/Release').read_text())
+
+    def test_create_keeps_configured_by_hash_generations(self):
+        # Given
+        cache, config, info = create_components()
+        config.by_hash_generations = 2
+        creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+        creator.initialize()
+        by_hash_dir = REPOSITORY_DIR / 'dists/trixie/main/binary-arm64/by-hash/SHA256'
+        generations = []
+
+        # When
+        for package in ['hello-arm', 'hello-arm2', 'hello-arm3']:
+            create_test_package(PACKAGE_DIR, 'trixie', 'main', 'arm64', package)
+            creator.create('trixie')
+            generations.append(hashlib.sha256(
+                (REPOSITORY_DIR / 'dists/trixie/main/binary-arm64/Packages').read_bytes()).hexdigest())
+
+        # Then
+        self.assertFalse((by_hash_dir / generations[0]).exists())
+        self.assertTrue((by_hash_dir / generations[1]).is_file())
+        self.assertTrue((by_hash_dir / generations[2]).is_file())
+        self.assertEqual(4, len(list(by_hash_dir.iterdir())))
+
+    def test_create_without_by_hash_generations(self):
+        # Given
+        delete_directory(REPOSITORY_DIR)
+        cache, config, info = create_components()
+        config.by_hash_generations = 0
+        creator = DefaultRepositoryCreator(cache, config, info)
+        creator.initialize()
+
+        # When
+        creator.create('trixie')
+
+        # Then
+        self.assertFalse((REPOSITORY_DIR / 'dists/trixie/main/binary-amd64/by-hash').exists())
+        self.assertNotIn('Acquire-By-Hash', (REPOSITORY_DIR / 'dists/trixie/Release').read_text())
+
+    def test_create_with_contents_generator_assert_contents_files_generated(self):
+        # Given
+        cache, config, info = create_components()
+        creator = DefaultRepositoryCreator(cache, config, info, contents=DefaultContentsGenerator(REPOSITORY_DIR))
+        creator.initialize()
+
+        # When
+        creator.create('trixie')
+
+        # Then
+        contents_path = REPOSITORY_DIR / 'dists/trixie/main/Contents-amd64.gz'
+        content = contents_path.read_bytes()
+        self.assertIn(b'usr/bin/hello-world misc/hello-world\n', gzip.decompress(content))
+        cache.store.assert_any_call('trixie', contents_path, content)
+        release = (REPOSITORY_DIR / 'dists/trixie/Release').read_text()
+        self.assertIn(f' {hashlib.sha256(content).hexdigest()} {len(content)} main/Contents-amd64.gz\n', release)
+
+    def test_create_with_pdiff_history_keeps_bounded_patches(self):
+        # Given
+        cache, config, info = create_components()
+        config.pdiff_history = 2
+        creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+        creator.initialize()
+        creator.create('trixie')
+        diff_dir = REPOSITORY_DIR / 'dists/trixie/main/binary-arm64/Packages.diff'
+
+        # When
+        for package in ['hello-arm', 'hello-arm2', 'hello-arm3']:
+            create_test_package(PACKAGE_DIR, 'trixie', 'main', 'arm64', package)
+            with mock.patch.object(creator, '_get_patch_name', return_value=f'patch-{package}'):
+                creator.create('trixie')
+
+        # Then
+        self.assertEqual({'Index', 'patch-hello-arm2.gz', 'patch-hello-arm3.gz'},
+                         {path.name for path in diff_dir.iterdir() if path.is_file()})
+        index = (diff_dir / 'Index').read_text()
+        self.assertNotIn('patch-hello-arm.gz', index)
+        self.assertIn(' patch-hello-arm3.gz\n', index)
+        packages = (REPOSITORY_DIR / 'dists/trixie/main/binary-arm64/Packages').read_bytes()
+        self.assertIn(f'SHA256-Current: {hashlib.sha256(packages).hexdigest()} {len(packages)}\n', index)
+        self.assertIn('main/binary-arm64/Packages.diff/Index\n', (REPOSITORY_DIR / 'dists/trixie/Release').read_text())
+        cache.store.assert_any_call('trixie', diff_dir / 'patch-hello-arm3.gz',
+                                    (diff_dir / 'patch-hello-arm3.gz').read_bytes())
+        self.assertFalse((REPOSITORY_DIR / 'dists/trixie/main/binary-amd64/Packages.diff/Index').exists())
+
+    def test_create_returns_false_when_published_indices_unchanged(self):
+        # Given
+        _, config, info = create_components()
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        cache.initialize()
+        creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+        creator.initialize()
+        self.assertTrue(creator.create('trixie'))
+        cache.switch('trixie')
+        release = (REPOSITORY_DIR / 'dists/trixie/Release').read_bytes()
+
+        # When
+        changed = creator.create('trixie', {Path('trixie/main/temporary.deb')})
+
+        # Then
+        self.assertFalse(changed)
+        self.assertEqual(release, (REPOSITORY_DIR / 'dists/trixie/Release').read_bytes())
+
+    def test_create_returns_true_when_not_yet_published(self):
+        # Given
+        _, config, info = create_components()
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        cache.initialize()
+        creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+        creator.initialize()
+        creator.create('trixie')
+
+        # When
+        changed = creator.create('trixie')
+
+        # Then
+        self.assertTrue(changed)
+
+    def test_create_returns_true_when_indices_changed(self):
+        # Given
+        _, config, info = create_components()
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        cache.initialize()
+        creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+        creator.initialize()
+        creator.create('trixie')
+        cache.switch('trixie')
+        create_test_package(PACKAGE_DIR, 'trixie', 'main', 'arm64', 'hello-arm')
+
+        # When
+        changed = creator.create('trixie', {Path('trixie/main/hello-arm_0.0.1-1_arm64.deb')})
+
+        # Then
+        self.assertTrue(changed)
+
+    def test_create_with_two_phase_compression_recompresses_at_maximum_level(self):
+        # Given
+        _, config, info = create_components()
+        config.compressions = {'gz': None, 'xz': None}
+        config.two_phase_compression = True
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        cache.initialize()
+        creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+        creator.initialize()
+        creator.create('trixie')
+        cache.switch('trixie')
+        creator.commit('trixie')
+        packages_path = REPOSITORY_DIR / 'dists/trixie/main/binary-amd64/Packages'
+        content = packages_path.read_bytes()
+        fast_xz = Path(f'{packages_path}.xz').read_bytes()
+        self.assertEqual(lzma.compress(content, preset=0), fast_xz)
+
+        # When
+        recompressed = creator.recompress('trixie')
+
+        # Then
+        self.assertTrue(recompressed)
+        self.assertEqual(fast_xz, Path(f'{packages_path}.xz').read_bytes())
+        self.assertTrue(creator.create('trixie', set()))
+        release = (REPOSITORY_DIR / 'dists/trixie/Release').read_text()
+        xz_content = lzma.compress(content, preset=9)
+        self.assertIn(f' {hashlib.sha256(xz_content).hexdigest()} {len(xz_content)} main/binary-amd64/Packages.xz\n',
+                      release)
+        self.assertEqual(fast_xz, cache.load('trixie', Path(f'{packages_path}.xz')))
+        creator.commit('trixie')
+        self.assertEqual(xz_content, Path(f'{packages_path}.xz').read_bytes())
+        self.assertEqual(content, gzip.decompress(Path(f'{packages_path}.gz').read_bytes()))
+        self.assertFalse(creator.recompress('trixie'))
+
+    def test_recompress_before_publish_committed_does_nothing(self):
+        # Given
+        _, config, info = create_components()
+        config.two_phase_compression = True
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        cache.initialize()
+        creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+        creator.initialize()
+        creator.create('trixie')
+
+        # When
+        recompressed = creator.recompress('trixie')
+
+        # Then
+        self.assertFalse(recompressed)
+
+    def test_revert_restores_published_index_files(self):
+        # Given
+        delete_directory(REPOSITORY_DIR / 'dists/trixie')
+        _, config, info = create_components()
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        cache.initialize()
+        creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+        creator.initialize()
+        creator.create('trixie')
+        cache.switch('trixie')
+        creator.commit('trixie')
+        dist_dir = REPOSITORY_DIR / 'dists/trixie'
+        published = {path: path.read_bytes() for path in dist_dir.rglob('*') if path.is_file()}
+        create_test_package(PACKAGE_DIR, 'trixie', 'main', 'amd64', 'hello-new')
+        creator.create('trixie', {Path('trixie/main/hello-new_0.0.1-1_amd64.deb')})
+        cache.switch('trixie')
+        cache.revert('trixie')
+
+        # When
+        creator.revert('trixie')
+
+        # Then
+        self.assertEqual(published, {path: path.read_bytes() for path in dist_dir.rglob('*') if path.is_file()})
+        creator.create('trixie', set())
+        self.assertIn('Package: hello-new\n', (dist_dir / 'main/binary-amd64/Packages').read_text())
+
+    def test_revert_drops_staged_recompression(self):
+        # Given
+        _, config, info = create_components()
+        config.compressions = {'xz': None}
+        config.two_phase_compression = True
+        cache = DefaultRepositoryCache({'bookworm', 'trixie'})
+        cache.initialize()
+        creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+        creator.initialize()
+        creator.create('trixie')
+        cache.switch('trixie')
+        creator.commit('trixie')
+        packages_path = REPOSITORY_DIR / 'dists/trixie/main/binary-amd64/Packages'
+        fast_xz = Path(f'{packages_path}.xz').read_bytes()
+        creator.recompress('trixie')
+        creator.create('trixie', set())
+        cache.switch('trixie')
+        cache.revert('trixie')
+
+        # When
+        creator.revert('trixie')
+
+        # Then
+        self.assertEqual(fast_xz, Path(f'{packages_path}.xz').read_bytes())
+        self.assertFalse(Path(f'{packages_path.parent}/.Packages.xz.staged').exists())
+        self.assertTrue(creator.recompress('trixie'))
+
+    def test_recompress_without_two_phase_compression_does_nothing(self):
+        # Given
+        cache, config, info = create_components()
+        creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+        creator.initialize()
+        creator.create('trixie')
+
+        # When
+        recompressed = creator.recompress('trixie')
+
+        # Then
+        self.assertFalse(recompressed)
+
+    def test_create_with_retention_policy_archives_excluded_packages(self):
+        # Given
+        cache, config, info = create_components()
+        archive_dir = REPOSITORY_DIR / '.archive'
+        config.retention = RetentionPolicy(max_versions=1, action='archive', archive_dir=archive_dir)
+        scanner = MagicMock(spec=PackageScanner)
+        old_stanza = b'Package: hello\nVersion: 1.0\nArchitecture: amd64\nFilename: pool/trixie/main/hello_1.0.deb\n\n'
+        new_stanza = b'Package: hello\nVersion: 2.0\nArchitecture: amd64\nFilename: pool/trixie/main/hello_2.0.deb\n\n'
+        scanner.scan.return_value = {'all': b'', 'amd64': old_stanza + new_stanza, 'arm64': b''}
+        creator = DefaultRepositoryCreator(cache, config, info, scanner)
+        creator.initialize()
+        (PACKAGE_DIR / 'trixie/main/hello_1.0.deb').write_bytes(b'old')
+
+        # When
+        creator.create('trixie')
+
+        # Then
+        packages_path = REPOSITORY_DIR / 'dists/trixie/main/binary-amd64/Packages'
+        self.assertEqual(new_stanza, packages_path.read_bytes())
+        self.assertFalse((PACKAGE_DIR / 'trixie/main/hello_1.0.deb').exists())
+        self.assertEqual(b'old', (archive_dir / 'trixie/main/hello_1.0.deb').read_bytes())
+
+    def test_create_with_retention_policy_reuses_result_of_unchanged_packages(self):
+        # Given
+        cache, config, info = create_components()
+        config.retention = RetentionPolicy(max_versions=1)
+        scanner = MagicMock(spec=PackageScanner)
+        stanza = b'Package: hello\nVersion: 1.0\nArchitecture: amd64\nFilename: pool/trixie/main/hello_1.0.deb\n\n'
+        scanner.scan.return_value = {'all': b'', 'amd64': stanza, 'arm64': b''}
+        creator = DefaultRepositoryCreator(cache, config, info, scanner)
+        creator.initialize()
+        creator.create('trixie')
+        scanner.scan.return_value = {'all': b'', 'amd64': stanza, 'arm64': stanza.replace(b'amd64', b'arm64')}
+
+        with mock.patch('package_repository.repositoryCreator.evaluate_retention_policy',
+                        wraps=evaluate_retention_policy) as evaluate:
+            # When
+            creator.create('trixie', set())
+
+        # Then
+        self.assertEqual(1, evaluate.call_count)
+        self.assertEqual(stanza.replace(b'amd64', b'arm64'), evaluate.call_args.args[0])
+
+    def test_create_with_archive_retention_without_archive_dir_raises_error(self):
+        # Given
+        cache, config, info = create_components()
+        config.retention = RetentionPolicy(max_versions=1, action='archive')
+
+        # When, Then
+        self.assertRaises(ValueError, DefaultRepositoryCreator, cache, config, info)
+
+    def test_create_with_content_addressed_pool_links_identical_packages(self):
+        # Given
+        cache, config, info = create_components()
+        config.content_addressed_pool = True
+        trixie_path = PACKAGE_DIR / 'trixie/main/hello-world_0.0.1-1_amd64.deb'
+        bookworm_path = PACKAGE_DIR / 'bookworm/main/hello-world_0.0.1-1_amd64.deb'
+        shutil.copyfile(trixie_path, bookworm_path)
+        creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+        creator.initialize()
+        orphan_path = PACKAGE_DIR / '.content-store/00/orphan'
+        create_directory(orphan_path.parent)
+        orphan_path.write_bytes(b'orphan')
+
+        # When
+        creator.create('trixie')
+        creator.create('bookworm')
+
+        # Then
+        sha256 = hashlib.sha256(trixie_path.read_bytes()).hexdigest()
+        blob_path = PACKAGE_DIR / '.content-store' / sha256[:2] / sha256
+        self.assertTrue(os.path.samefile(blob_path, trixie_path))
+        self.assertTrue(os.path.samefile(blob_path, bookworm_path))
+        self.assertFalse(orphan_path.exists())
+        packages = (REPOSITORY_DIR / 'dists/bookworm/main/binary-amd64/Packages').read_text()
+        self.assertIn(f'SHA256: {sha256}\n', packages)
+        self.assertNotIn('.content-store', packages)
+
+    def test_create_with_content_addressed_pool_removes_blob_of_package_modified_in_place(self):
+        # Given
+        cache, config, info = create_components()
+        config.content_addressed_pool = True
+        package_path = PACKAGE_DIR / 'trixie/main/hello-world_0.0.1-1_amd64.deb'
+        creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+        creator.initialize()
+        creator.create('trixie')
+        sha256 = hashlib.sha256(package_path.read_bytes()).hexdigest()
+        blob_path = PACKAGE_DIR / '.content-store' / sha256[:2] / sha256
+        self.assertEqual(0, blob_path.stat().st_mode & 0o222)
+        with open(package_path, 'ab') as package_file:
+            package_file.write(b'modified')
+
+        # When
+        creator.create('trixie')
+
+        # Then
+        modified = hashlib.sha256(package_path.read_bytes()).hexdigest()
+        self.assertFalse(blob_path.exists())
+        self.assertTrue(os.path.samefile(package_path, PACKAGE_DIR / '.content-store' / modified[:2] / modified))
+
+    def test_create_with_retention_policy_archives_linked_package_as_copy(self):
+        # Given
+        cache, config, info = create_components()
+        archive_dir = REPOSITORY_DIR / '.archive'
+        config.content_addressed_pool = True
+        config.retention = RetentionPolicy(max_versions=1, action='archive', archive_dir=archive_dir)
+        scanner = MagicMock(spec=PackageScanner)
+        old_stanza = b'Package: hello\nVersion: 1.0\nArchitecture: amd64\nFilename: pool/trixie/main/hello_1.0.deb\n\n'
+        new_stanza = b'Package: hello\nVersion: 2.0\nArchitecture: amd64\nFilename: pool/trixie/main/hello_2.0.deb\n\n'
+        scanner.scan.return_value = {'all': b'', 'amd64': old_stanza + new_stanza, 'arm64': b''}
+        creator = DefaultRepositoryCreator(cache, config, info, scanner)
+        creator.initialize()
+        (PACKAGE_DIR / 'trixie/main/hello_1.0.deb').write_bytes(b'old')
+        sha256 = hashlib.sha256(b'old').hexdigest()
+
+        # When
+        creator.create('trixie')
+
+        # Then
+        self.assertEqual(b'old', (archive_dir / 'trixie/main/hello_1.0.deb').read_bytes())
+        self.assertFalse((PACKAGE_DIR / '.content-store' / sha256[:2] / sha256).exists())
+
+    def test_create_with_pool_roots_merges_packages_into_one_pool(self):
+        # Given
+        cache, config, info = create_components()
+        pool_root = TEST_RESOURCE_ROOT / 'test-pools/second'
+        delete_directory(pool_root)
+        create_test_package(pool_root, 'trixie', 'main', 'arm64', 'hello-arm')
+        config.pool_roots = [pool_root]
+        creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+        creator.initialize()
+
+        # When
+        creator.create('trixie', None)
+        creator.create('trixie', {Path('trixie/main/hello-arm_0.0.1-1_arm64.deb')})
+
+        # Then
+        packages = (REPOSITORY_DIR / 'dists/trixie/main/binary-arm64/Packages').read_text()
+        self.assertIn('Filename: pool/trixie/main/hello-world_0.0.1-1_arm64.deb\n', packages)
+        self.assertIn('Filename: pool/trixie/main/hello-arm_0.0.1-1_arm64.deb\n', packages)
+        self.assertNotIn('.pools', packages)
+        self.assertTrue((REPOSITORY_DIR / '.pools/1/trixie/main/hello-arm_0.0.1-1_arm64.deb').is_file())
+        delete_directory(pool_root)
+
+    def test_create_with_pool_roots_lists_package_of_first_root_only(self):
+        # Given
+        cache, config, info = create_components()
+        pool_root = TEST_RESOURCE_ROOT / 'test-pools/second'
+        delete_directory(pool_root)
+        create_test_package(pool_root, 'trixie', 'main', 'amd64')
+        config.pool_roots = [pool_root]
+        creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+        creator.initialize()
+
+        # When
+        creator.create('trixie', None)
+
+        # Then
+        packages = (REPOSITORY_DIR / 'dists/trixie/main/binary-amd64/Packages').read_text()
+        sha256 = hashlib.sha256((PACKAGE_DIR / 'trixie/main/hello-world_0.0.1-1_amd64.deb').read_bytes()).hexdigest()
+        self.assertEqual(1, packages.count('Filename: pool/trixie/main/hello-world_0.0.1-1_amd64.deb\n'))
+        self.assertIn(f'SHA256: {sha256}\n', packages)
+        delete_directory(pool_root)
+
+    def test_create_with_pool_roots_and_content_addressed_pool_links_changed_package_of_pool_root(self):
+        # Given
+        cache, config, info = create_components()
+        config.content_addressed_pool = True
+        pool_root = TEST_RESOURCE_ROOT / 'test-pools/second'
+        delete_directory(pool_root)
+        create_test_package(pool_root, 'trixie', 'main', 'arm64', 'hello-arm')
+        config.pool_roots = [pool_root]
+        creator = DefaultRepositoryCreator(cache, config, info, NativePackageScanner(REPOSITORY_DIR))
+        creator.initialize()
+        package_path = pool_root / 'trixie/main/hello-arm_0.0.1-1_arm64.deb'
+
+        # When
+        creator.create('trixie', {Path('trixie/main/hello-arm_0.0.1-1_arm64.deb')})
+
+        # Then
+        sha256 = hashlib.sha256(package_path.read_bytes()).hexdigest()
+        self.assertTrue(os.path.samefile(PACKAGE_DIR / '.content-store' / sha256[:2] / sha256, package_path))
+        delete_directory(pool_root)
+
 
 def create_components():
     cache = MagicMock(spec=RepositoryCache)
@@ -14,7 +14,8 @@ from watchdog.observers import Observer
 
 from package_repository import DefaultDirectoryService, DefaultRepositoryService, DirectoryConfig, \
     DefaultDirectoryServer, ServerConfig, DefaultRepositoryCache, DefaultRepositorySigner, DefaultRepositoryCreator, \
-    RepositoryConfig, DefaultPackageWatcher, PublicGpgKey, PrivateGpgKey, DefaultRepositoryServer, ReleaseInfo
+    RepositoryConfig, DefaultPackageWatcher, PublicGpgKey, PrivateGpgKey, DefaultRepositoryServer, ReleaseInfo, \
+    DefaultRepositoryBuilder
 from tests import create_test_packages, TEST_RESOURCE_ROOT, RESOURCE_ROOT, REPOSITORY_DIR, APPLICATION_NAME, \
     PACKAGE_DIR, RELEASE_TEMPLATE_PATH
 
@@ -171,8 +172,8 @@ def create_components():
     private_key = PrivateGpgKey(KEY_ID, PRIVATE_KEY_PATH, PASSPHRASE)
     public_key = PublicGpgKey(KEY_ID, PUBLIC_KEY_PATH, PUBLIC_KEY_NAME)
     repository_signer = DefaultRepositorySigner(repository_cache, GPG(), private_key, public_key, REPOSITORY_DIR)
-    repository_service = DefaultRepositoryService(package_watcher, repository_creator, repository_signer,
-                                                  repository_cache, DISTRIBUTIONS, 0.1)
+    repository_builder = DefaultRepositoryBuilder(repository_creator, repository_signer, repository_cache)
+    repository_service = DefaultRepositoryService(package_watcher, repository_builder, DISTRIBUTIONS, 0.1)
 
     server_config = ServerConfig([f'*:{SERVER_PORT}'], 'http', "", 32, 1024, 1000, 60)
     directory_server = DefaultDirectoryServer(server_config)
@@ -1,14 +1,16 @@
 import unittest
+from pathlib import Path
 from unittest import TestCase
 from unittest.mock import MagicMock, call
 
 from context_logger import setup_logging
 from test_utility import wait_for_assertion
 
-from package_repository import PackageWatcher, RepositoryCreator, RepositorySigner, RepositoryCache, \
-    DefaultRepositoryService
+from package_repository import PackageWatcher, RepositoryBuilder, DefaultRepositoryService
 from tests import APPLICATION_NAME
 
+PACKAGE_PATH = Path('trixie/main/new-package.deb')
+
 
 class RepositoryServiceTest(TestCase):
 
@@ -21,26 +23,22 @@ class RepositoryServiceTest(TestCase):
 
     def test_start(self):
         # Given
-        watcher, creator, signer, cache = create_components()
-        service = DefaultRepositoryService(watcher, creator, signer, cache, {'bookworm', 'trixie'}, 0.1)
+        watcher, builder = create_components()
+        service = DefaultRepositoryService(watcher, builder, {'bookworm', 'trixie'}, 0.1)
 
         # When
         service.start()
 
         # Then
-        cache.initialize.assert_called_once()
-        cache.switch.assert_has_calls([call('bookworm'), call('trixie')], any_order=True)
-        creator.initialize.assert_called_once()
-        creator.create.assert_has_calls([call('bookworm'), call('trixie')], any_order=True)
-        signer.initialize.assert_called_once()
-        signer.sign.assert_has_calls([call('bookworm'), call('trixie')], any_order=True)
+        builder.initialize.assert_called_once()
+        builder.build.assert_has_calls([call('bookworm', None), call('trixie', None)], any_order=True)
         watcher.register.assert_called_once_with(service._handle_event)
         watcher.start.assert_called_once()
 
     def test_stop(self):
         # Given
-        watcher, creator, signer, cache = create_components()
-        service = DefaultRepositoryService(watcher, creator, signer, cache, {'bookworm', 'trixie'}, 0.1)
+        watcher, builder = create_components()
+        service = DefaultRepositoryService(watcher, builder, {'bookworm', 'trixie'}, 0.1)
 
         # When
         service.stop()
@@ -48,56 +46,102 @@ class RepositoryServiceTest(TestCase):
         # Then
         watcher.deregister.assert_called_once_with(service._handle_event)
         watcher.stop.assert_called_once()
+        builder.shutdown.assert_called_once()
 
     def test_event_handled(self):
         # Given
-        watcher, creator, signer, cache = create_components()
-        service = DefaultRepositoryService(watcher, creator, signer, cache, {'bookworm', 'trixie'}, 0.1)
+        watcher, builder = create_components()
+        service = DefaultRepositoryService(watcher, builder, {'bookworm', 'trixie'}, 0.1)
 
         # When
-        service._handle_event('trixie')
+        service._handle_event('trixie', PACKAGE_PATH)
 
         # Then
-        wait_for_assertion(1, lambda: cache.switch.assert_called_once_with('trixie'))
-        creator.create.assert_called_once_with('trixie')
-        signer.sign.assert_called_once_with('trixie')
+        wait_for_assertion(1, lambda: builder.build.assert_called_once_with('trixie', {PACKAGE_PATH}))
 
     def test_event_handled_when_another_event_is_handled(self):
         # Given
-        watcher, creator, signer, cache = create_components()
-        service = DefaultRepositoryService(watcher, creator, signer, cache, {'bookworm', 'trixie'}, 0.1)
+        watcher, builder = create_components()
+        service = DefaultRepositoryService(watcher, builder, {'bookworm', 'trixie'}, 0.1)
+
+        service._handle_event('trixie', PACKAGE_PATH)
+
+        # When
+        service._handle_event('trixie', PACKAGE_PATH)
+
+        # Then
+        wait_for_assertion(1, lambda: builder.build.assert_called_once_with('trixie', {PACKAGE_PATH}))
+
+    def test_changed_paths_accumulated_until_update(self):
+        # Given
+        watcher, builder = create_components()
+        service = DefaultRepositoryService(watcher, builder, {'bookworm', 'trixie'}, 0.1)
+        other_path = Path('trixie/main/other-package.deb')
+
+        service._handle_event('trixie', PACKAGE_PATH)
+
+        # When
+        service._handle_event('trixie', other_path)
+
+        # Then
+        wait_for_assertion(1, lambda: builder.build.assert_called_once_with('trixie', {PACKAGE_PATH, other_path}))
+
+    def test_recompression_scheduled_when_repository_changed(self):
+        # Given
+        watcher, builder = create_components()
+        builder.build.return_value = True
+        service = DefaultRepositoryService(watcher, builder, {'bookworm', 'trixie'}, 0.1)
+
+        # When
+        service._update_repository('trixie')
+
+        # Then
+        wait_for_assertion(1, lambda: builder.recompress.assert_called_once_with('trixie'))
+        service.stop()
+
+    def test_recompression_not_scheduled_when_repository_unchanged(self):
+        # Given
+        watcher, builder = create_components()
+        builder.build.return_value = False
+        service = DefaultRepositoryService(watcher, builder, {'bookworm', 'trixie'}, 0.1)
+
+        # When
+        service._update_repository('trixie')
 
-        service._handle_event('trixie')
+        # Then
+        service.stop()
+        builder.recompress.assert_not_called()
+
+    def test_changed_paths_restored_when_update_fails(self):
+        # Given
+        watcher, builder = create_components()
+        builder.build.side_effect = Exception('Build failed')
+        service = DefaultRepositoryService(watcher, builder, {'bookworm', 'trixie'}, 0.1)
+        service._changes['trixie'] = {PACKAGE_PATH}
 
         # When
-        service._handle_event('trixie')
+        self.assertRaises(Exception, service._update_repository, 'trixie')
 
         # Then
-        wait_for_assertion(1, lambda: cache.switch.assert_called_once_with('trixie'))
-        creator.create.assert_called_once_with('trixie')
-        signer.sign.assert_called_once_with('trixie')
+        self.assertEqual({PACKAGE_PATH}, service._changes['trixie'])
 
     def test_event_not_handled_when_unsupported(self):
         # Given
-        watcher, creator, signer, cache = create_components()
-        service = DefaultRepositoryService(watcher, creator, signer, cache, {'bookworm', 'trixie'}, 0.1)
+        watcher, builder = create_components()
+        service = DefaultRepositoryService(watcher, builder, {'bookworm', 'trixie'}, 0.1)
 
         # When
-        service._handle_event('unsupported')
+        service._handle_event('unsupported', PACKAGE_PATH)
 
         # Then
-        creator.create.assert_not_called()
-        signer.sign.assert_not_called()
-        cache.switch.assert_not_called()
+        builder.build.assert_not_called()
 
 
 def create_components():
     watcher = MagicMock(spec=PackageWatcher)
-    creator = MagicMock(spec=RepositoryCreator)
-    signer = MagicMock(spec=RepositorySigner)
-    cache = MagicMock(spec=RepositoryCache)
+    builder = MagicMock(spec=RepositoryBuilder)
 
-    return watcher, creator, signer, cache
+    return watcher, builder
 
 
 if __name__ == "__main__":
@@ -4,12 +4,15 @@ from collections import deque
 from pathlib import Path
 from unittest import TestCase
 
+import pgpy
 from common_utility import delete_directory
 from context_logger import setup_logging
 from gnupg import GPG
+from pgpy.constants import PubKeyAlgorithm, KeyFlags, HashAlgorithm
 
 from package_repository import RepositoryConfig, DefaultRepositoryCreator, DefaultRepositorySigner, PrivateGpgKey, \
-    PublicGpgKey, DefaultRepositoryCache, ReleaseInfo
+    PublicGpgKey, DefaultRepositoryCache, ReleaseInfo, NativeRepositorySigner, SignatureError, \
+    SignatureConfig
 from tests import create_test_packages, TEST_RESOURCE_ROOT, REPOSITORY_DIR, APPLICATION_NAME, \
     PACKAGE_DIR, RELEASE_TEMPLATE_PATH
 
@@ -90,6 +93,118 @@ class RepositorySignerIntegrationTest(TestCase):
             last_line = deque(release_file, 1)[0]
             self.assertEqual(last_line, f'SignWith: {KEY_ID}')
 
+    def test_release_file_signed_in_process(self):
+        # Given
+        cache, config, info, gpg, private_key, public_key = create_components()
+        creator = DefaultRepositoryCreator(cache, config, info)
+        signer = NativeRepositorySigner(cache, private_key, public_key, REPOSITORY_DIR)
+
+        creator.initialize()
+        signer.initialize()
+
+        creator.create('trixie')
+
+        # When
+        signer.sign('trixie')
+
+        # Then
+        release_path = f'{REPOSITORY_DIR}/dists/trixie'
+        release_file_path = f'{release_path}/Release'
+
+        with open(release_file_path) as release_file:
+            last_line = deque(release_file, 1)[0]
+            self.assertEqual(last_line, f'SignWith: {KEY_ID}')
+
+        gpg.import_keys_file(str(PUBLIC_KEY_PATH))
+
+        with open(f'{release_path}/InRelease', 'rb') as signed_release_file:
+            self.assertEqual(0, gpg.verify_file(signed_release_file).returncode)
+
+        with open(f'{release_path}/Release.gpg', 'rb') as signature_file:
+            self.assertEqual(0, gpg.verify_file(signature_file, release_file_path).returncode)
+
+        self.assertTrue(os.path.exists(f'{REPOSITORY_DIR}/{PUBLIC_KEY_NAME}'))
+
+    def test_release_file_resigned_in_process(self):
+        # Given
+        cache, config, info, gpg, private_key, public_key = create_components()
+        creator = DefaultRepositoryCreator(cache, config, info)
+        signer = NativeRepositorySigner(cache, private_key, public_key, REPOSITORY_DIR)
+
+        creator.initialize()
+        signer.initialize()
+
+        creator.create('trixie')
+        signer.sign('trixie')
+
+        release_file_path = f'{REPOSITORY_DIR}/dists/trixie/Release'
+
+        # When
+        signer.sign('trixie')
+
+        # Then
+        with open(release_file_path) as release_file:
+            release_lines = release_file.readlines()
+            self.assertEqual(release_lines[-1], f'SignWith: {KEY_ID}')
+            self.assertEqual(1, sum(1 for line in release_lines if line.startswith('SignWith')))
+
+    def test_in_release_only_signed_in_process_with_deferred_verification(self):
+        # Given
+        cache, config, info, gpg, private_key, public_key = create_components()
+        creator = DefaultRepositoryCreator(cache, config, info)
+        signature_config = SignatureConfig(verification='deferred', detached_signature=False)
+        signer = NativeRepositorySigner(cache, private_key, public_key, REPOSITORY_DIR, signature_config)
+
+        creator.initialize()
+        signer.initialize()
+
+        creator.create('trixie')
+
+        # When
+        signer.sign('trixie')
+        signer.verify('trixie')
+
+        # Then
+        release_path = f'{REPOSITORY_DIR}/dists/trixie'
+        self.assertTrue(os.path.exists(f'{release_path}/InRelease'))
+        self.assertFalse(os.path.exists(f'{release_path}/Release.gpg'))
+
+    def test_native_signer_fails_to_initialize_when_passphrase_invalid(self):
+        # Given
+        cache, config, info, gpg, private_key, public_key = create_components()
+        private_key.passphrase = 'invalid'
+        signer = NativeRepositorySigner(cache, private_key, public_key, REPOSITORY_DIR)
+
+        # When, Then
+        with self.assertRaises(SignatureError):
+            signer.initialize()
+
+    def test_native_signer_fails_to_initialize_when_key_not_found(self):
+        # Given
+        cache, config, info, gpg, private_key, public_key = create_components()
+        private_key.id = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+        signer = NativeRepositorySigner(cache, private_key, public_key, REPOSITORY_DIR)
+
+        # When, Then
+        with self.assertRaises(SignatureError):
+            signer.initialize()
+
+    def test_native_signer_fails_to_verify_signature_made_with_other_key(self):
+        # Given
+        cache, config, info, gpg, private_key, public_key = create_components()
+        creator = DefaultRepositoryCreator(cache, config, info)
+        creator.initialize()
+        creator.create('trixie')
+        other_key = create_other_private_key()
+        signer = NativeRepositorySigner(cache, other_key, public_key, REPOSITORY_DIR)
+        signer.initialize()
+
+        # When, Then
+        with self.assertRaises(SignatureError):
+            signer.sign('trixie')
+
+        other_key.path.unlink()
+
 
 def create_components():
     distributions = {'bookworm', 'trixie'}
@@ -103,5 +218,14 @@ def create_components():
     return cache, config, info, gpg, private_key, public_key
 
 
+def create_other_private_key():
+    key = pgpy.PGPKey.new(PubKeyAlgorithm.RSAEncryptOrSign, 2048)
+    key.add_uid(pgpy.PGPUID.new('Other Key'), usage={KeyFlags.Sign}, hashes=[HashAlgorithm.SHA512])
+    key_path = REPOSITORY_DIR / 'other-private-key.asc'
+    key_path.write_text(str(key))
+
+    return PrivateGpgKey(str(key.fingerprint).replace(' ', ''), key_path, '')
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -7,7 +7,8 @@ from common_utility import delete_directory, create_file, render_template_file
 from context_logger import setup_logging
 from gnupg import GPG, Sign, Verify, ImportResult
 
-from package_repository import DefaultRepositorySigner, GpgException, PublicGpgKey, PrivateGpgKey, RepositoryCache
+from package_repository import DefaultRepositorySigner, GpgException, PublicGpgKey, PrivateGpgKey, RepositoryCache, \
+    SignatureConfig
 from tests import TEST_RESOURCE_ROOT, REPOSITORY_DIR, APPLICATION_NAME, RELEASE_TEMPLATE_PATH
 
 RELEASE_DIR = f'{REPOSITORY_DIR}/dists/trixie'
@@ -68,35 +69,35 @@ class RepositorySignerTest(TestCase):
 
         # Then
         gpg.import_keys_file.assert_called_once_with(PRIVATE_KEY_PATH)
-        gpg.sign_file.assert_not_called()
+        gpg.sign.assert_not_called()
 
     def test_sign(self):
         # Given
         cache, gpg, private_key, public_key = create_components()
         signer = DefaultRepositorySigner(cache, gpg, private_key, public_key, REPOSITORY_DIR)
         signer.initialize()
+        verified_signatures = []
+        detached_verify_result = gpg.verify_data.return_value
+        gpg.verify_data.side_effect = lambda signature_path, data: (
+            verified_signatures.append(Path(signature_path).read_bytes()) or detached_verify_result)
 
         # When
         signer.sign('trixie')
 
         # Then
-        gpg.sign_file.assert_has_calls(
+        release = Path(f'{RELEASE_DIR}/Release').read_bytes()
+        gpg.sign.assert_has_calls(
             [
-                mock.call(
-                    f'{RELEASE_DIR}/Release',
-                    keyid=KEY_ID,
-                    passphrase=PASSPHRASE,
-                    detach=False,
-                ),
-                mock.call(
-                    f'{RELEASE_DIR}/Release',
-                    keyid=KEY_ID,
-                    passphrase=PASSPHRASE,
-                    detach=True,
-                ),
-            ]
+                mock.call(release, keyid=KEY_ID, passphrase=PASSPHRASE, detach=True),
+                mock.call(release, keyid=KEY_ID, passphrase=PASSPHRASE, detach=False),
+            ],
+            any_order=True
         )
-        gpg.verify_file.assert_called()
+        gpg.verify.assert_called_once_with(b'Signed data')
+        gpg.verify_data.assert_called_once_with(mock.ANY, release)
+        self.assertEqual([b'Detached signature'], verified_signatures)
+        self.assertEqual(b'Signed data', Path(f'{RELEASE_DIR}/InRelease').read_bytes())
+        self.assertEqual(b'Detached signature', Path(f'{RELEASE_DIR}/Release.gpg').read_bytes())
 
     def test_sign_when_fails_to_create_signature(self):
         # Given
@@ -108,8 +109,8 @@ class RepositorySignerTest(TestCase):
         self.assertRaises(GpgException, signer.sign, 'trixie')
 
         # Then
-        gpg.sign_file.assert_called_once()
-        gpg.verify_file.assert_not_called()
+        gpg.verify.assert_not_called()
+        gpg.verify_data.assert_not_called()
 
     def test_sign_when_fails_to_verify_signature(self):
         # Given
@@ -121,8 +122,7 @@ class RepositorySignerTest(TestCase):
         self.assertRaises(GpgException, signer.sign, 'trixie')
 
         # Then
-        gpg.sign_file.assert_called_once()
-        gpg.verify_file.assert_called_once()
+        gpg.verify.assert_called_once()
 
     def test_sign_when_fails_to_create_detached_signature(self):
         # Given
@@ -134,8 +134,8 @@ class RepositorySignerTest(TestCase):
         self.assertRaises(GpgException, signer.sign, 'trixie')
 
         # Then
-        gpg.sign_file.assert_called()
-        gpg.verify_file.assert_called_once()
+        self.assertEqual(2, gpg.sign.call_count)
+        gpg.verify.assert_not_called()
 
     def test_sign_when_failed_to_verify_detached_signature(self):
         # Given
@@ -147,8 +147,61 @@ class RepositorySignerTest(TestCase):
         self.assertRaises(GpgException, signer.sign, 'trixie')
 
         # Then
-        gpg.sign_file.assert_called()
-        gpg.verify_file.assert_called()
+        gpg.verify_data.assert_called_once()
+
+    def test_sign_defers_verification(self):
+        # Given
+        cache, gpg, private_key, public_key = create_components(verify_codes=[1, 0])
+        config = SignatureConfig(verification='deferred')
+        signer = DefaultRepositorySigner(cache, gpg, private_key, public_key, REPOSITORY_DIR, config)
+        signer.initialize()
+
+        # When
+        signer.sign('trixie')
+
+        # Then
+        gpg.verify.assert_not_called()
+        self.assertRaises(GpgException, signer.verify, 'trixie')
+        gpg.verify.assert_called_once_with(b'Signed data')
+
+    def test_sign_skips_verification_when_not_sampled(self):
+        # Given
+        cache, gpg, private_key, public_key = create_components()
+        config = SignatureConfig(verification='sampled', sample_rate=0)
+        signer = DefaultRepositorySigner(cache, gpg, private_key, public_key, REPOSITORY_DIR, config)
+        signer.initialize()
+
+        # When
+        signer.sign('trixie')
+        signer.verify('trixie')
+
+        # Then
+        gpg.verify.assert_not_called()
+        gpg.verify_data.assert_not_called()
+
+    def test_sign_creates_in_release_only(self):
+        # Given
+        cache, gpg, private_key, public_key = create_components()
+        config = SignatureConfig(detached_signature=False)
+        signer = DefaultRepositorySigner(cache, gpg, private_key, public_key, REPOSITORY_DIR, config)
+        signer.initialize()
+
+        # When
+        signer.sign('trixie')
+
+        # Then
+        gpg.sign.assert_called_once_with(mock.ANY, keyid=KEY_ID, passphrase=PASSPHRASE, detach=False)
+        gpg.verify_data.assert_not_called()
+        self.assertFalse(Path(f'{RELEASE_DIR}/Release.gpg').exists())
+
+    def test_create_when_verification_mode_is_invalid(self):
+        # Given
+        cache, gpg, private_key, public_key = create_components()
+        config = SignatureConfig(verification='invalid')
+
+        # When, Then
+        self.assertRaises(ValueError, DefaultRepositorySigner, cache, gpg, private_key, public_key, REPOSITORY_DIR,
+                          config)
 
 
 def create_components(import_code=0, sign_codes=None, verify_codes=None):
@@ -164,25 +217,26 @@ def create_components(import_code=0, sign_codes=None, verify_codes=None):
 
     if sign_codes is None:
         sign_codes = [0, 0]
-    sign_result1 = Sign(gpg)
-    sign_result1.returncode = sign_codes[0]
-    sign_result1.status = 'signed'
-    sign_result1.data = b'Signed data 1'
-    sign_result2 = Sign(gpg)
-    sign_result2.returncode = sign_codes[1]
-    sign_result2.status = 'signed'
-    sign_result2.data = b'Signed data 2'
-    gpg.sign_file.side_effect = [sign_result1, sign_result2]
+    sign_result = Sign(gpg)
+    sign_result.returncode = sign_codes[0]
+    sign_result.status = 'signed'
+    sign_result.data = b'Signed data'
+    detached_sign_result = Sign(gpg)
+    detached_sign_result.returncode = sign_codes[1]
+    detached_sign_result.status = 'signed'
+    detached_sign_result.data = b'Detached signature'
+    gpg.sign.side_effect = lambda data, detach, **kwargs: detached_sign_result if detach else sign_result
 
     if verify_codes is None:
         verify_codes = [0, 0]
-    verify_result1 = Verify(gpg)
-    verify_result1.returncode = verify_codes[0]
-    verify_result1.status = 'verified'
-    verify_result2 = Verify(gpg)
-    verify_result2.returncode = verify_codes[1]
-    verify_result2.status = 'verified'
-    gpg.verify_file.side_effect = [verify_result1, verify_result2]
+    verify_result = Verify(gpg)
+    verify_result.returncode = verify_codes[0]
+    verify_result.status = 'verified'
+    detached_verify_result = Verify(gpg)
+    detached_verify_result.returncode = verify_codes[1]
+    detached_verify_result.status = 'verified'
+    gpg.verify.return_value = verify_result
+    gpg.verify_data.return_value = detached_verify_result
 
     private_key = PrivateGpgKey(KEY_ID, Path(PRIVATE_KEY_PATH), PASSPHRASE)
     public_key = PublicGpgKey(KEY_ID, Path(PUBLIC_KEY_PATH), PUBLIC_KEY_NAME)
@@ -0,0 +1,114 @@
+import os
+import unittest
+from unittest import TestCase
+
+from common_utility import delete_directory, create_directory
+from context_logger import setup_logging
+
+from package_repository import RetentionPolicy, apply_retention_policy, compare_versions, evaluate_retention_policy
+from tests import APPLICATION_NAME, REPOSITORY_DIR
+
+NOW = 1700000000.0
+DAY = 24 * 60 * 60
+
+
+class RetentionPolicyTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        setup_logging(APPLICATION_NAME, 'DEBUG', warn_on_overwrite=False)
+
+    def setUp(self):
+        print()
+        delete_directory(REPOSITORY_DIR)
+        create_directory(REPOSITORY_DIR)
+
+    def test_compare_versions(self):
+        for lower, higher in [('1.0', '1.1'), ('1.9', '1.10'), ('1.0~rc1', '1.0'), ('1.0', '1.0a'), ('1.0', '1.0-1'),
+                              ('1.0-1', '1.0-2'), ('9.0', '1:0.1'), ('1.0+b1', '1.0.1'), ('1.0~~', '1.0~'),
+                              ('0.0.1-1', '0.0.1-1+deb12u1')]:
+            self.assertLess(compare_versions(lower, higher), 0, f'{lower} < {higher}')
+            self.assertGreater(compare_versions(higher, lower), 0, f'{higher} > {lower}')
+
+        self.assertEqual(0, compare_versions('1.0', '1.0'))
+        self.assertEqual(0, compare_versions('0:1.01', '1.1'))
+
+    def test_apply_retention_policy_keeps_latest_versions(self):
+        # Given
+        content = create_packages([('hello', '1.0', 'amd64'), ('hello', '1.10', 'amd64'), ('hello', '1.9', 'amd64'),
+                                   ('world', '2.0', 'amd64')])
+
+        # When
+        retained, excluded = apply_retention_policy(content, RetentionPolicy(max_versions=2), REPOSITORY_DIR, NOW)
+
+        # Then
+        self.assertEqual(create_packages([('hello', '1.10', 'amd64'), ('hello', '1.9', 'amd64'),
+                                          ('world', '2.0', 'amd64')]), retained)
+        self.assertEqual({'pool/hello_1.0_amd64.deb'}, excluded)
+
+    def test_apply_retention_policy_keeps_versions_per_architecture(self):
+        # Given
+        content = create_packages([('hello', '1.0', 'amd64'), ('hello', '1.0', 'all'), ('hello', '2.0', 'amd64')])
+
+        # When
+        retained, excluded = apply_retention_policy(content, RetentionPolicy(max_versions=1), REPOSITORY_DIR, NOW)
+
+        # Then
+        self.assertEqual(create_packages([('hello', '1.0', 'all'), ('hello', '2.0', 'amd64')]), retained)
+        self.assertEqual({'pool/hello_1.0_amd64.deb'}, excluded)
+
+    def test_apply_retention_policy_keeps_recent_and_newest_versions(self):
+        # Given
+        packages = [('hello', '1.0', 'amd64'), ('hello', '2.0', 'amd64'), ('hello', '3.0', 'amd64')]
+        content = create_packages(packages)
+        for (package, version, architecture), age in zip(packages, [40, 20, 60]):
+            create_package_file(package, version, architecture, NOW - age * DAY)
+
+        # When
+        retained, excluded = apply_retention_policy(content, RetentionPolicy(max_age_days=30), REPOSITORY_DIR, NOW)
+
+        # Then
+        self.assertEqual(create_packages([('hello', '2.0', 'amd64'), ('hello', '3.0', 'amd64')]), retained)
+        self.assertEqual({'pool/hello_1.0_amd64.deb'}, excluded)
+
+    def test_evaluate_retention_policy_expires_when_oldest_retained_version_ages_out(self):
+        # Given
+        packages = [('hello', '1.0', 'amd64'), ('hello', '2.0', 'amd64'), ('hello', '3.0', 'amd64')]
+        content = create_packages(packages)
+        for (package, version, architecture), age in zip(packages, [20, 10, 60]):
+            create_package_file(package, version, architecture, NOW - age * DAY)
+
+        # When
+        result = evaluate_retention_policy(content, RetentionPolicy(max_age_days=30), REPOSITORY_DIR, NOW)
+
+        # Then
+        self.assertEqual(set(), result.excluded)
+        self.assertEqual(NOW + 10 * DAY, result.expires)
+
+    def test_apply_retention_policy_returns_content_when_nothing_excluded(self):
+        # Given
+        content = create_packages([('hello', '1.0', 'amd64'), ('world', '1.0', 'amd64')])
+
+        # When
+        retained, excluded = apply_retention_policy(content, RetentionPolicy(max_versions=1), REPOSITORY_DIR, NOW)
+
+        # Then
+        self.assertIs(content, retained)
+        self.assertEqual(set(), excluded)
+
+
+def create_packages(packages: list[tuple[str, str, str]]) -> bytes:
+    return b''.join(f'Package: {package}\nVersion: {version}\nArchitecture: {architecture}\n'
+                    f'Filename: pool/{package}_{version}_{architecture}.deb\n\n'.encode()
+                    for package, version, architecture in packages)
+
+
+def create_package_file(package: str, version: str, architecture: str, mtime: float) -> None:
+    package_path = REPOSITORY_DIR / 'pool' / f'{package}_{version}_{architecture}.deb'
+    create_directory(package_path.parent)
+    package_path.write_bytes(b'package')
+    os.utime(package_path, (mtime, mtime))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,6 +15,8 @@ def create_test_packages(package_dir: Path, distribution: str, component: str =
     create_test_package(package_dir, distribution, component, 'arm64')
 
 
-def create_test_package(package_dir: Path, distribution: str, component: str, architecture: str) -> None:
+def create_test_package(package_dir: Path, distribution: str, component: str, architecture: str,
+                        package: str = 'hello-world') -> None:
     target_dir = str(package_dir / distribution / component)
-    subprocess.call(['/bin/bash', f'{str(TEST_RESOURCE_ROOT)}/package/create_package.sh', target_dir, architecture])
+    subprocess.call(['/bin/bash', f'{str(TEST_RESOURCE_ROOT)}/package/create_package.sh', target_dir, architecture,
+                     package])